@@ -0,0 +1,406 @@
+#!/usr/bin/env python
+# Asyncio serving mode for the Blipp game database server
+#
+# An asyncio HTTP/1.1 front end that keeps connections (including thousands
+# of idle keep-alive browser tabs) on the event loop and runs the Flask app,
+# i.e. the same /api/* routes and their blocking SQLite work, on a bounded
+# thread pool.
+#
+# Server-Sent Events streams (/api/events, /api/dashboard/stream) block
+# between messages for as long as the client stays connected, so they are
+# not pulled on the pool: each gets its own thread, and at most
+# max_event_streams are open at once (more are refused with 503).
+#
+# Usage:
+#   python async_server.py [--host 0.0.0.0] [--port 5000] [--workers 16] [--max-event-streams 256]
+
+import argparse
+import asyncio
+import io
+import os
+import re
+import sys
+import threading
+import traceback
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import unquote
+
+MAX_HEADER_BYTES = 64 * 1024
+MAX_BODY_BYTES = 16 * 1024 * 1024
+KEEPALIVE_TIMEOUT = 75.0
+MAX_EVENT_STREAMS = 256
+# Messages an event stream's thread may queue ahead of a slow client
+EVENT_QUEUE_SIZE = 16
+CHUNK_SIZE = re.compile(rb'[0-9A-Fa-f]{1,16}')
+
+REASONS = {400: 'Bad Request', 408: 'Request Timeout', 413: 'Payload Too Large', 500: 'Internal Server Error',
+           503: 'Service Unavailable'}
+
+
+class HTTPError(Exception):
+    def __init__(self, status):
+        super().__init__(status)
+        self.status = status
+
+
+def build_environ(method, target, version, headers, body, server, peer):
+    path, _, query = target.partition('?')
+    environ = {
+        'REQUEST_METHOD': method,
+        'SCRIPT_NAME': '',
+        # WSGI carries the decoded path as latin-1 code points
+        'PATH_INFO': unquote(path, encoding='latin-1'),
+        'QUERY_STRING': query,
+        'SERVER_NAME': server[0],
+        'SERVER_PORT': str(server[1]),
+        'SERVER_PROTOCOL': version,
+        'REMOTE_ADDR': peer[0] if peer else '',
+        'REMOTE_PORT': str(peer[1]) if peer else '',
+        'wsgi.version': (1, 0),
+        'wsgi.url_scheme': 'http',
+        'wsgi.input': io.BytesIO(body),
+        'wsgi.errors': sys.stderr,
+        'wsgi.multithread': True,
+        'wsgi.multiprocess': False,
+        'wsgi.run_once': False
+    }
+    for name, value in headers:
+        key = name.upper().replace('-', '_')
+        if key == 'CONTENT_TYPE':
+            environ['CONTENT_TYPE'] = value
+        elif key == 'CONTENT_LENGTH':
+            environ['CONTENT_LENGTH'] = value
+        elif key == 'TRANSFER_ENCODING':
+            continue
+        else:
+            key = 'HTTP_' + key
+            environ[key] = f'{environ[key]},{value}' if key in environ else value
+    if body:
+        # The body is already read and de-chunked: the app sees a fixed-length one
+        environ['CONTENT_LENGTH'] = str(len(body))
+    return environ
+
+
+def has_body(method, status):
+    """HTTP forbids a body on HEAD responses and on 1xx, 204 and 304"""
+    code = int(status.split(' ', 1)[0])
+    return method != 'HEAD' and code >= 200 and code not in (204, 304)
+
+
+def call_app(app, environ):
+    """Run the WSGI app on a worker thread.
+
+    Returns (status, headers, body, iterator): fixed-length responses are
+    read completely here so the event loop only has to write bytes; streamed
+    responses hand back their iterator to be pulled chunk by chunk. Responses
+    that may not carry a body come back as headers only.
+    """
+    captured = {}
+
+    def start_response(status, headers, exc_info=None):
+        captured['status'] = status
+        captured['headers'] = headers
+        return lambda data: None
+
+    result = app(environ, start_response)
+    headers = captured['headers']
+    if not has_body(environ['REQUEST_METHOD'], captured['status']):
+        if hasattr(result, 'close'):
+            result.close()
+        return captured['status'], headers, b'', None
+    if any(name.lower() == 'content-length' for name, _ in headers):
+        try:
+            body = b''.join(result)
+        finally:
+            if hasattr(result, 'close'):
+                result.close()
+        return captured['status'], headers, body, None
+    return captured['status'], headers, None, result
+
+
+def _next_chunk(iterator):
+    try:
+        return next(iterator)
+    except StopIteration:
+        return None
+
+
+def is_event_stream(headers):
+    return any(name.lower() == 'content-type' and value.startswith('text/event-stream') for name, value in headers)
+
+
+class AsyncWSGIServer:
+    def __init__(self, app, host='0.0.0.0', port=5000, workers=16, keepalive_timeout=KEEPALIVE_TIMEOUT,
+                 max_event_streams=MAX_EVENT_STREAMS):
+        self.app = app
+        self.host = host
+        self.port = port
+        self.keepalive_timeout = keepalive_timeout
+        self.max_event_streams = max_event_streams
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='sqlite-worker')
+        self.open_connections = 0
+        self.event_streams = 0
+
+    async def handle(self, reader, writer):
+        self.open_connections += 1
+        peer = writer.get_extra_info('peername')
+        loop = asyncio.get_running_loop()
+        try:
+            while True:
+                try:
+                    head = await asyncio.wait_for(reader.readuntil(b'\r\n\r\n'), self.keepalive_timeout)
+                except (asyncio.IncompleteReadError, asyncio.TimeoutError, ConnectionError):
+                    return
+                except asyncio.LimitOverrunError:
+                    await self._send_error(writer, 400)
+                    return
+
+                try:
+                    method, target, version, headers = self._parse_head(head)
+                    body = await self._read_body(reader, writer, version, headers)
+                except HTTPError as e:
+                    await self._send_error(writer, e.status)
+                    return
+
+                header_map = {name.lower(): value for name, value in headers}
+                connection = header_map.get('connection', '').lower()
+                keep_alive = ('keep-alive' in connection) if version == 'HTTP/1.0' else ('close' not in connection)
+
+                environ = build_environ(method, target, version, headers, body, (self.host, self.port), peer)
+                try:
+                    status, response_headers, payload, iterator = await loop.run_in_executor(
+                        self.executor, call_app, self.app, environ)
+                except Exception:
+                    traceback.print_exc()
+                    await self._send_error(writer, 500)
+                    return
+
+                event_stream = iterator is not None and is_event_stream(response_headers)
+                if event_stream and self.event_streams >= self.max_event_streams:
+                    # Not started yet, so closing the generator is instant
+                    if hasattr(iterator, 'close'):
+                        iterator.close()
+                    await self._send_error(writer, 503)
+                    return
+
+                chunked = iterator is not None and version == 'HTTP/1.1'
+                if iterator is not None and not chunked:
+                    keep_alive = False
+                lines = [f'{version} {status}']
+                lines += [f'{name}: {value}' for name, value in response_headers]
+                if chunked:
+                    lines.append('Transfer-Encoding: chunked')
+                lines.append('Connection: keep-alive' if keep_alive else 'Connection: close')
+                writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+
+                if iterator is None:
+                    writer.write(payload)
+                    await writer.drain()
+                elif event_stream:
+                    await self._stream_events(loop, writer, iterator, chunked)
+                else:
+                    await self._stream(loop, writer, iterator, chunked)
+
+                if not keep_alive:
+                    return
+        except ConnectionError:
+            pass
+        finally:
+            self.open_connections -= 1
+            writer.close()
+
+    async def _stream(self, loop, writer, result, chunked):
+        iterator = iter(result)
+        try:
+            while True:
+                chunk = await loop.run_in_executor(self.executor, _next_chunk, iterator)
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+        finally:
+            if hasattr(result, 'close'):
+                await loop.run_in_executor(self.executor, result.close)
+
+    async def _stream_events(self, loop, writer, result, chunked):
+        """Relay an event stream whose generator runs on a thread of its own.
+
+        The thread hands messages over through a bounded queue. When the client
+        goes away it stops at the generator's next message (keepalives come at
+        least every 15 seconds) and closes it there, on the thread running it.
+        """
+        messages = asyncio.Queue(maxsize=EVENT_QUEUE_SIZE)
+        stop = threading.Event()
+
+        def pump():
+            try:
+                for chunk in result:
+                    if stop.is_set():
+                        break
+                    asyncio.run_coroutine_threadsafe(messages.put(chunk), loop).result()
+            except RuntimeError:
+                # The event loop closed underneath us (server shutdown)
+                pass
+            finally:
+                if hasattr(result, 'close'):
+                    result.close()
+                if not stop.is_set():
+                    try:
+                        asyncio.run_coroutine_threadsafe(messages.put(None), loop)
+                    except RuntimeError:
+                        pass
+
+        self.event_streams += 1
+        threading.Thread(target=pump, name='event-stream', daemon=True).start()
+        try:
+            while True:
+                chunk = await messages.get()
+                if chunk is None:
+                    break
+                if not chunk:
+                    continue
+                if isinstance(chunk, str):
+                    chunk = chunk.encode('utf-8')
+                writer.write(b'%x\r\n%s\r\n' % (len(chunk), chunk) if chunked else chunk)
+                await writer.drain()
+            if chunked:
+                writer.write(b'0\r\n\r\n')
+                await writer.drain()
+        finally:
+            self.event_streams -= 1
+            stop.set()
+            # Unblock a put waiting on a full queue so the thread can see stop
+            while not messages.empty():
+                messages.get_nowait()
+
+    @staticmethod
+    def _parse_head(head):
+        lines = head.decode('latin-1').split('\r\n')
+        try:
+            method, target, version = lines[0].split(' ', 2)
+        except ValueError:
+            raise HTTPError(400)
+        if version not in ('HTTP/1.0', 'HTTP/1.1'):
+            raise HTTPError(400)
+        headers = []
+        for line in lines[1:]:
+            if not line:
+                continue
+            name, sep, value = line.partition(':')
+            if not sep:
+                raise HTTPError(400)
+            headers.append((name.strip(), value.strip()))
+        return method, target, version, headers
+
+    @staticmethod
+    async def _read_body(reader, writer, version, headers):
+        """Read the request body; malformed framing is an HTTPError(400), after
+        which the connection is closed because the next request cannot be found"""
+        header_map = {name.lower(): value for name, value in headers}
+        lengths = {value for name, value in headers if name.lower() == 'content-length'}
+        encoding = header_map.get('transfer-encoding')
+        # Framing two ways (or with conflicting lengths) is how requests get smuggled past a proxy
+        if len(lengths) > 1 or (lengths and encoding is not None):
+            raise HTTPError(400)
+        if encoding is not None and encoding.split(',')[-1].strip().lower() != 'chunked':
+            raise HTTPError(400)
+
+        if header_map.get('expect', '').lower() == '100-continue':
+            writer.write(f'{version} 100 Continue\r\n\r\n'.encode('latin-1'))
+            await writer.drain()
+
+        try:
+            if encoding is not None:
+                return await AsyncWSGIServer._read_chunked(reader)
+            length = header_map.get('content-length', '0')
+            if not length.isdigit():
+                raise HTTPError(400)
+            length = int(length)
+            if length > MAX_BODY_BYTES:
+                raise HTTPError(413)
+            return await reader.readexactly(length) if length else b''
+        except (asyncio.IncompleteReadError, asyncio.LimitOverrunError):
+            raise HTTPError(400)
+
+    @staticmethod
+    async def _read_chunked(reader):
+        body = bytearray()
+        while True:
+            size_line = await reader.readuntil(b'\r\n')
+            size = size_line.split(b';', 1)[0].strip()
+            # Hex digits only: int(..., 16) would also take a sign or underscores
+            if not CHUNK_SIZE.fullmatch(size):
+                raise HTTPError(400)
+            size = int(size, 16)
+            if size == 0:
+                # Skip any trailer fields up to the blank line
+                while await reader.readuntil(b'\r\n') != b'\r\n':
+                    pass
+                return bytes(body)
+            if len(body) + size > MAX_BODY_BYTES:
+                raise HTTPError(413)
+            body += await reader.readexactly(size)
+            if await reader.readexactly(2) != b'\r\n':
+                raise HTTPError(400)
+
+    @staticmethod
+    async def _send_error(writer, status):
+        reason = REASONS.get(status, 'Error')
+        body = f'{status} {reason}'.encode('ascii')
+        writer.write(f'HTTP/1.1 {status} {reason}\r\nContent-Type: text/plain\r\n'
+                     f'Content-Length: {len(body)}\r\nConnection: close\r\n\r\n'.encode('ascii') + body)
+        try:
+            await writer.drain()
+        except ConnectionError:
+            pass
+
+    async def serve_forever(self, sock=None):
+        if sock is not None:
+            server = await asyncio.start_server(self.handle, sock=sock, limit=MAX_HEADER_BYTES, backlog=1024)
+        else:
+            server = await asyncio.start_server(self.handle, self.host, self.port,
+                                                limit=MAX_HEADER_BYTES, backlog=1024)
+        async with server:
+            await server.serve_forever()
+
+    def shutdown(self):
+        self.executor.shutdown(wait=True)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the Blipp game database API on asyncio')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BLIPP_ASYNC_WORKERS', 16)),
+                        help='threads running Flask/SQLite work (default: %(default)s)')
+    parser.add_argument('--keepalive', type=float, default=KEEPALIVE_TIMEOUT,
+                        help='seconds an idle keep-alive connection is kept open (default: %(default)s)')
+    parser.add_argument('--max-event-streams', type=int,
+                        default=int(os.environ.get('BLIPP_MAX_EVENT_STREAMS', MAX_EVENT_STREAMS)),
+                        help='open Server-Sent Events streams, one thread each (default: %(default)s)')
+    args = parser.parse_args()
+
+    import game_db
+
+    app = game_db.create_app()
+    server = AsyncWSGIServer(app, args.host, args.port, args.workers, args.keepalive, args.max_event_streams)
+    game_db.logger.info(f"Starting asyncio game database server on port {args.port} "
+                        f"with {args.workers} worker threads...")
+    try:
+        asyncio.run(server.serve_forever())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.shutdown()
+        game_db.shutdown()
+
+
+if __name__ == '__main__':
+    main()
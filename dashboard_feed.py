@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Shared dashboard snapshot with per-viewer change streams
+#
+# The snapshot is rebuilt at most once per data generation (or once per
+# interval when a dependency cannot be versioned), no matter how many
+# dashboards are open. Each viewer's Server-Sent Events stream compares
+# section digests and only sends the sections that changed.
+
+import hashlib
+import json
+import threading
+import time
+
+from streaming import format_sse
+
+PUSH_INTERVAL = 1.0
+KEEPALIVE_INTERVAL = 15.0
+# Client reconnect delay advertised in the stream (milliseconds)
+RETRY_MS = 3000
+
+
+def _digest(value):
+    # Sections are built in a stable order, so the digest needs no sort_keys
+    encoded = json.dumps(value, separators=(',', ':')).encode('utf-8')
+    return hashlib.blake2b(encoded, digest_size=8).hexdigest()
+
+
+class DashboardFeed:
+    """build() returns {section: payload}; generation_source(deps) returns
+    (generation, last_modified) like the response cache uses"""
+
+    def __init__(self, build, generation_source, deps, interval=PUSH_INTERVAL, keepalive=KEEPALIVE_INTERVAL):
+        self.build = build
+        self.generation_source = generation_source
+        self.deps = deps
+        self.interval = interval
+        self.keepalive = keepalive
+
+        self._lock = threading.Lock()
+        self._generation = None
+        self._built_at = 0.0
+        self._sections = None
+        self._digests = None
+
+        # Statistics
+        self._builds = 0
+        self._viewers = 0
+
+    def snapshot(self):
+        """Return (sections, digests), rebuilding only when the data changed"""
+        generation, _ = self.generation_source(self.deps)
+        with self._lock:
+            if self._sections is not None:
+                if generation is not None and generation == self._generation:
+                    return self._sections, self._digests
+                if generation is None and time.monotonic() - self._built_at < self.interval:
+                    return self._sections, self._digests
+
+            sections = self.build()
+            self._sections = sections
+            self._digests = {name: _digest(value) for name, value in sections.items()}
+            self._generation = generation
+            self._built_at = time.monotonic()
+            self._builds += 1
+            return self._sections, self._digests
+
+    def stream(self):
+        """Yield SSE messages: one 'snapshot' with every section, then a 'delta'
+        with just the changed sections whenever something changes"""
+        with self._lock:
+            self._viewers += 1
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            sent = {}
+            last_send = time.monotonic()
+            while True:
+                sections, digests = self.snapshot()
+                changed = {name: sections[name] for name, digest in digests.items() if sent.get(name) != digest}
+                if changed:
+                    yield format_sse(changed, event='delta' if sent else 'snapshot')
+                    sent = dict(digests)
+                    last_send = time.monotonic()
+                elif time.monotonic() - last_send >= self.keepalive:
+                    # Comment line: keeps proxies from timing out an idle stream
+                    yield ': keepalive\n\n'
+                    last_send = time.monotonic()
+                time.sleep(self.interval)
+        finally:
+            with self._lock:
+                self._viewers -= 1
+
+    def stats(self):
+        with self._lock:
+            return {
+                'snapshot_builds': self._builds,
+                'stream_viewers': self._viewers,
+                'push_interval_seconds': self.interval
+            }
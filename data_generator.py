@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+# High-volume synthetic data generator for the Blipp game database
+#
+# Builds inventory_items and item_templates rows from the same vocabularies
+# as populate_database.py and populate_item_database.py, at benchmark scale.
+# Rows are generated in fixed-size chunks, each from its own RNG seeded with
+# (seed, table, chunk number), so a seed always produces the same rows
+# (timestamps aside, which end at the current time) no matter how many
+# processes generate them. Chunks are written with
+# executemany inside large transactions.
+#
+# Usage:
+#   python data_generator.py --items 10000000 --seed 42 --processes 4 --defer-triggers
+#   python data_generator.py --templates 50000 --db /tmp/bench.db --replace
+#   python data_generator.py --items 100000 --rarity common=50,rare=30,legendary=20
+
+import argparse
+import multiprocessing
+import random
+import sqlite3
+import time
+from collections import deque
+from itertools import accumulate
+
+import inventory_stats
+import populate_database as inventory_vocab
+import populate_item_database as template_vocab
+from db_migrations import DB_PATH, migrate
+
+CHUNK_SIZE = 10000
+COMMIT_ROWS = 500000
+
+INSERT_SQL = {
+    'inventory_items': '''
+        INSERT INTO inventory_items (name, type, prefix, color, symbol, rarity, description, category, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    ''',
+    'item_templates': '''
+        INSERT INTO item_templates (name, type, prefix, rarity, description, category)
+        VALUES (?, ?, ?, ?, ?, ?)
+    '''
+}
+
+# Default rarity weights: the inventory script's weights, uniform for templates
+DEFAULT_RARITIES = {
+    'inventory_items': dict(inventory_vocab.RARITIES),
+    'item_templates': {rarity: 1 for rarity in template_vocab.RARITY_LEVELS}
+}
+
+# Per-category (name, symbol, description) tuples, built once
+_INVENTORY_TEMPLATES = {
+    category: [(t['name'], t['symbol'], t['description']) for t in templates]
+    for category, templates in inventory_vocab.ITEM_TEMPLATES.items()
+}
+
+
+def parse_rarity(value, table):
+    """Parse 'common=60,rare=10' into {rarity: weight}; unlisted rarities get weight 0"""
+    known = {name.lower(): name for name in DEFAULT_RARITIES[table]}
+    weights = {}
+    for part in value.split(','):
+        name, _, weight = part.partition('=')
+        name = name.strip()
+        if name.lower() not in known:
+            raise ValueError(f"Unknown rarity '{name}' for {table} (expected one of {', '.join(known.values())})")
+        try:
+            weight = float(weight)
+        except ValueError:
+            raise ValueError(f"Rarity weight for '{name}' must be a number")
+        if weight < 0:
+            raise ValueError(f"Rarity weight for '{name}' must not be negative")
+        weights[known[name.lower()]] = weight
+    if not any(weights.values()):
+        raise ValueError('At least one rarity needs a positive weight')
+    return weights
+
+
+def _chunk_rng(seed, table, index):
+    # String seeds are hashed deterministically, unlike hash() of a tuple
+    return random.Random(f'{seed}:{table}:{index}')
+
+
+def _inventory_chunk(task):
+    seed, index, first_row, count, rarities, cum_weights, start_time, step = task
+    rng = _chunk_rng(seed, 'inventory_items', index)
+    categories = rng.choices(inventory_vocab.CATEGORIES, k=count)
+    picked = rng.choices(rarities, cum_weights=cum_weights, k=count)
+
+    rows = []
+    last_second = timestamp = None
+    for offset, (category, rarity) in enumerate(zip(categories, picked)):
+        name, symbol, description = rng.choice(_INVENTORY_TEMPLATES[category])
+        # Timestamps ascend with the row number so the timestamp index is appended to.
+        # Same format as the server's datetime('now') so live inserts sort after them.
+        second = int(start_time + (first_row + offset) * step)
+        if second != last_second:
+            last_second = second
+            timestamp = time.strftime('%Y-%m-%d %H:%M:%S', time.gmtime(second))
+        rows.append((name, category, rng.choice(inventory_vocab.PREFIXES[rarity]),
+                     rng.choice(inventory_vocab.COLORS[rarity]), symbol, rarity, description, category, timestamp))
+    return rows
+
+
+def _template_chunk(task):
+    seed, index, _, count, rarities, cum_weights, _, _ = task
+    rng = _chunk_rng(seed, 'item_templates', index)
+    picked = rng.choices(rarities, cum_weights=cum_weights, k=count)
+
+    rows = []
+    for rarity in picked:
+        item_type = rng.choice(template_vocab.ITEM_TYPES)
+        prefix = rng.choice(template_vocab.ITEM_PREFIXES)
+        category = template_vocab.TYPE_CATEGORIES[item_type] or rng.choice(template_vocab.CATEGORIES)
+        description = rng.choice(template_vocab.DESCRIPTION_TEMPLATES).format(
+            prefix=prefix.lower(), type=item_type.lower(), category=category)
+        rows.append((f'{prefix} {item_type}', item_type, prefix, rarity, description, category))
+    return rows
+
+
+_GENERATORS = {
+    'inventory_items': _inventory_chunk,
+    'item_templates': _template_chunk
+}
+
+
+def generate_chunks(table, rows, seed, rarity=None, chunk_size=CHUNK_SIZE, processes=1, days=30):
+    """Yield lists of row tuples for table, in order, chunk_size rows at a time.
+
+    With processes > 1 chunks are generated in a process pool; at most two
+    chunks per process are outstanding so memory stays bounded.
+    """
+    weights = rarity or DEFAULT_RARITIES[table]
+    names = [name for name, weight in weights.items() if weight > 0]
+    cum_weights = list(accumulate(weights[name] for name in names))
+    # Inventory timestamps are spread evenly over the last `days` days
+    start_time = time.time() - days * 86400
+    step = days * 86400 / max(rows, 1)
+
+    tasks = (
+        (seed, index, first_row, min(chunk_size, rows - first_row), names, cum_weights, start_time, step)
+        for index, first_row in enumerate(range(0, rows, chunk_size))
+    )
+    generate = _GENERATORS[table]
+
+    if processes <= 1:
+        for task in tasks:
+            yield generate(task)
+        return
+
+    with multiprocessing.Pool(processes) as pool:
+        outstanding = deque()
+        for task in tasks:
+            outstanding.append(pool.apply_async(generate, (task,)))
+            if len(outstanding) >= processes * 2:
+                yield outstanding.popleft().get()
+        while outstanding:
+            yield outstanding.popleft().get()
+
+
+def _drop_triggers(conn, table):
+    """Drop the per-row triggers on table and return their SQL for recreation"""
+    triggers = conn.execute("SELECT name, sql FROM sqlite_master WHERE type = 'trigger' AND tbl_name = ?",
+                            (table,)).fetchall()
+    for name, _ in triggers:
+        conn.execute(f'DROP TRIGGER {name}')
+    return triggers
+
+
+def _restore_triggers(conn, table, triggers):
+    """Recreate dropped triggers and redo, once, the bookkeeping they would have done per row"""
+    existing = {row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'trigger'")}
+    for name, sql in triggers:
+        if name not in existing:
+            conn.execute(sql)
+    if table == 'inventory_items':
+        inventory_stats.recount(conn)
+    conn.execute("UPDATE table_generations SET generation = generation + 1, "
+                 "updated_at = CAST(strftime('%s', 'now') AS INTEGER) WHERE name = ?", (table,))
+
+
+def load(conn, table, chunks, replace=False, defer_triggers=False, commit_rows=COMMIT_ROWS, log=None):
+    """Insert generated chunks into table, committing every commit_rows rows;
+    returns the number of rows written.
+
+    defer_triggers drops the counter and generation triggers for the load and
+    rebuilds their state once at the end. Nothing else may write to the table
+    meanwhile: their changes would not be counted.
+    """
+    sql = INSERT_SQL[table]
+    written = pending = 0
+    started = time.monotonic()
+    triggers = []
+
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        if defer_triggers:
+            triggers = _drop_triggers(conn, table)
+        if replace:
+            conn.execute(f'DELETE FROM {table}')
+
+        for rows in chunks:
+            conn.executemany(sql, rows)
+            written += len(rows)
+            pending += len(rows)
+            if pending >= commit_rows:
+                conn.commit()
+                conn.execute('BEGIN IMMEDIATE')
+                pending = 0
+                if log:
+                    elapsed = time.monotonic() - started
+                    log(f'{table}: {written} rows ({written / elapsed:.0f} rows/s)')
+
+        if defer_triggers:
+            _restore_triggers(conn, table, triggers)
+        conn.commit()
+    except BaseException:
+        conn.rollback()
+        if triggers:
+            # Earlier batches may already be committed without the triggers
+            conn.execute('BEGIN IMMEDIATE')
+            _restore_triggers(conn, table, triggers)
+            conn.commit()
+        raise
+    return written
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Generate synthetic inventory items and item templates')
+    parser.add_argument('--db', default=DB_PATH, help='database file (default: %(default)s)')
+    parser.add_argument('--items', type=int, default=0, help='inventory_items rows to generate')
+    parser.add_argument('--templates', type=int, default=0, help='item_templates rows to generate')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed; the same seed yields the same rows')
+    parser.add_argument('--rarity', help='rarity weights, e.g. common=60,uncommon=25,rare=10,epic=4,legendary=1 '
+                                         '(applied to each generated table)')
+    parser.add_argument('--days', type=float, default=30,
+                        help='spread inventory timestamps over this many past days (default: %(default)s)')
+    parser.add_argument('--processes', type=int, default=1,
+                        help='processes generating rows; the database is written from one (default: %(default)s)')
+    parser.add_argument('--commit-rows', type=int, default=COMMIT_ROWS,
+                        help='rows per write transaction (default: %(default)s)')
+    parser.add_argument('--replace', action='store_true', help='delete existing rows of each generated table first')
+    parser.add_argument('--defer-triggers', action='store_true',
+                        help='drop per-row counter triggers during the load and rebuild the counters once '
+                             '(the server must not be writing)')
+    args = parser.parse_args()
+
+    if args.items <= 0 and args.templates <= 0:
+        parser.error('nothing to generate: pass --items and/or --templates')
+    if args.commit_rows <= 0 or args.processes <= 0:
+        parser.error('--commit-rows and --processes must be positive')
+
+    plan = [(table, rows) for table, rows in (('inventory_items', args.items), ('item_templates', args.templates))
+            if rows > 0]
+    rarities = {}
+    for table, _ in plan:
+        try:
+            rarities[table] = parse_rarity(args.rarity, table) if args.rarity else None
+        except ValueError as e:
+            parser.error(str(e))
+
+    conn = sqlite3.connect(args.db, isolation_level=None)
+    migrate(conn, log=print)
+    conn.execute('PRAGMA journal_mode=WAL')
+    conn.execute('PRAGMA synchronous=NORMAL')
+    conn.execute('PRAGMA cache_size=-65536')
+
+    for table, rows in plan:
+        print(f'Generating {rows} {table} rows into {args.db} (seed {args.seed}, {args.processes} process(es))')
+        started = time.monotonic()
+        chunks = generate_chunks(table, rows, args.seed, rarities[table], processes=args.processes,
+                                 days=args.days)
+        written = load(conn, table, chunks, replace=args.replace, defer_triggers=args.defer_triggers,
+                       commit_rows=args.commit_rows, log=print)
+        elapsed = time.monotonic() - started
+        print(f'{table}: wrote {written} rows in {elapsed:.1f}s ({written / max(elapsed, 1e-9):.0f} rows/s)')
+
+    conn.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,430 @@
+#!/usr/bin/env python
+# Versioned schema migrations for the Blipp game database
+#
+# Usage:
+#   python db_migrations.py            Upgrade game_data.db to the latest version
+#   python db_migrations.py --status   Show applied and pending migrations
+#   python db_migrations.py --plans    Show EXPLAIN QUERY PLAN for the hot queries
+
+import argparse
+import os
+import sqlite3
+import sys
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+DB_PATH = os.path.join(SCRIPT_DIR, 'game_data.db')
+
+# Ordered migration steps: (version, name, statements)
+# Never edit a step once it has shipped; append a new one instead.
+MIGRATIONS = [
+    (1, 'baseline tables', [
+        '''
+        CREATE TABLE IF NOT EXISTS robot_state (
+            id INTEGER PRIMARY KEY,
+            x REAL,
+            y REAL,
+            direction INTEGER,
+            is_digging BOOLEAN,
+            is_jumping BOOLEAN,
+            timestamp TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS inventory_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            type TEXT,
+            prefix TEXT,
+            color TEXT,
+            symbol TEXT,
+            rarity TEXT,
+            description TEXT,
+            category TEXT,
+            timestamp TEXT
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS item_templates (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT,
+            type TEXT,
+            prefix TEXT,
+            rarity TEXT,
+            description TEXT,
+            category TEXT
+        )
+        '''
+    ]),
+    (2, 'secondary indexes for route queries', [
+        # Category/rarity filters (random selection, populate reports)
+        'CREATE INDEX IF NOT EXISTS idx_inventory_items_category_rarity ON inventory_items (category, rarity)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_items_rarity ON inventory_items (rarity)',
+        # Recent items listing: ORDER BY timestamp DESC, id DESC
+        'CREATE INDEX IF NOT EXISTS idx_inventory_items_timestamp ON inventory_items (timestamp, id)',
+        # Stats: GROUP BY type / GROUP BY prefix as covering index scans
+        'CREATE INDEX IF NOT EXISTS idx_inventory_items_type ON inventory_items (type)',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_items_prefix ON inventory_items (prefix)',
+        # Template filters
+        'CREATE INDEX IF NOT EXISTS idx_item_templates_category_rarity ON item_templates (category, rarity)',
+        'CREATE INDEX IF NOT EXISTS idx_item_templates_rarity ON item_templates (rarity)'
+    ]),
+    (3, 'materialized inventory counters', [
+        # One row per (dimension, key): ('total', ''), ('type', <type>), ('prefix', <prefix>)
+        '''
+        CREATE TABLE IF NOT EXISTS inventory_counts (
+            dimension TEXT NOT NULL,
+            key TEXT,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        'CREATE INDEX IF NOT EXISTS idx_inventory_counts_dimension_key ON inventory_counts (dimension, key)',
+        # Triggers keep the counters exact for every writer, including the populate scripts.
+        # Keys are matched with IS so NULL types and prefixes are counted like GROUP BY does.
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_counts_after_insert AFTER INSERT ON inventory_items
+        BEGIN
+            UPDATE inventory_counts SET count = count + 1 WHERE dimension = 'total';
+            INSERT INTO inventory_counts (dimension, key, count)
+                SELECT 'type', NEW.type, 0
+                WHERE NOT EXISTS (SELECT 1 FROM inventory_counts WHERE dimension = 'type' AND key IS NEW.type);
+            UPDATE inventory_counts SET count = count + 1 WHERE dimension = 'type' AND key IS NEW.type;
+            INSERT INTO inventory_counts (dimension, key, count)
+                SELECT 'prefix', NEW.prefix, 0
+                WHERE NOT EXISTS (SELECT 1 FROM inventory_counts WHERE dimension = 'prefix' AND key IS NEW.prefix);
+            UPDATE inventory_counts SET count = count + 1 WHERE dimension = 'prefix' AND key IS NEW.prefix;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_counts_after_delete AFTER DELETE ON inventory_items
+        BEGIN
+            UPDATE inventory_counts SET count = count - 1 WHERE dimension = 'total';
+            UPDATE inventory_counts SET count = count - 1 WHERE dimension = 'type' AND key IS OLD.type;
+            DELETE FROM inventory_counts WHERE dimension = 'type' AND key IS OLD.type AND count <= 0;
+            UPDATE inventory_counts SET count = count - 1 WHERE dimension = 'prefix' AND key IS OLD.prefix;
+            DELETE FROM inventory_counts WHERE dimension = 'prefix' AND key IS OLD.prefix AND count <= 0;
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS inventory_counts_after_update AFTER UPDATE OF type, prefix ON inventory_items
+        BEGIN
+            UPDATE inventory_counts SET count = count - 1 WHERE dimension = 'type' AND key IS OLD.type;
+            DELETE FROM inventory_counts WHERE dimension = 'type' AND key IS OLD.type AND count <= 0;
+            INSERT INTO inventory_counts (dimension, key, count)
+                SELECT 'type', NEW.type, 0
+                WHERE NOT EXISTS (SELECT 1 FROM inventory_counts WHERE dimension = 'type' AND key IS NEW.type);
+            UPDATE inventory_counts SET count = count + 1 WHERE dimension = 'type' AND key IS NEW.type;
+            UPDATE inventory_counts SET count = count - 1 WHERE dimension = 'prefix' AND key IS OLD.prefix;
+            DELETE FROM inventory_counts WHERE dimension = 'prefix' AND key IS OLD.prefix AND count <= 0;
+            INSERT INTO inventory_counts (dimension, key, count)
+                SELECT 'prefix', NEW.prefix, 0
+                WHERE NOT EXISTS (SELECT 1 FROM inventory_counts WHERE dimension = 'prefix' AND key IS NEW.prefix);
+            UPDATE inventory_counts SET count = count + 1 WHERE dimension = 'prefix' AND key IS NEW.prefix;
+        END
+        ''',
+        # Backfill from the rows already present
+        'DELETE FROM inventory_counts',
+        "INSERT INTO inventory_counts (dimension, key, count) SELECT 'total', '', COUNT(*) FROM inventory_items",
+        "INSERT INTO inventory_counts (dimension, key, count) SELECT 'type', type, COUNT(*) FROM inventory_items GROUP BY type",
+        "INSERT INTO inventory_counts (dimension, key, count) SELECT 'prefix', prefix, COUNT(*) FROM inventory_items GROUP BY prefix"
+    ]),
+    (4, 'robot trajectory time series', [
+        # Clustered on (resolution, ts): a time range at one resolution is a
+        # single primary-key range scan. sample is struct '<ffbB' (x, y,
+        # direction, flag bits); see robot_trajectory.py.
+        '''
+        CREATE TABLE IF NOT EXISTS robot_trajectory (
+            resolution INTEGER NOT NULL,
+            ts INTEGER NOT NULL,
+            sample BLOB NOT NULL,
+            PRIMARY KEY (resolution, ts)
+        ) WITHOUT ROWID
+        '''
+    ]),
+    (5, 'per-table write generations', [
+        # Bumped by triggers on every write from any process; the response
+        # cache compares generations to decide whether a cached body is current
+        '''
+        CREATE TABLE IF NOT EXISTS table_generations (
+            name TEXT PRIMARY KEY,
+            generation INTEGER NOT NULL DEFAULT 0,
+            updated_at INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        """
+        INSERT OR IGNORE INTO table_generations (name, generation, updated_at)
+        VALUES ('inventory_items', 0, CAST(strftime('%s', 'now') AS INTEGER)),
+               ('item_templates', 0, CAST(strftime('%s', 'now') AS INTEGER))
+        """,
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_inventory_items_after_insert AFTER INSERT ON inventory_items
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'inventory_items';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_inventory_items_after_update AFTER UPDATE ON inventory_items
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'inventory_items';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_inventory_items_after_delete AFTER DELETE ON inventory_items
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'inventory_items';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_item_templates_after_insert AFTER INSERT ON item_templates
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'item_templates';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_item_templates_after_update AFTER UPDATE ON item_templates
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'item_templates';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS table_generations_item_templates_after_delete AFTER DELETE ON item_templates
+        BEGIN
+            UPDATE table_generations SET generation = generation + 1, updated_at = CAST(strftime('%s', 'now') AS INTEGER)
+                WHERE name = 'item_templates';
+        END
+        '''
+    ]),
+    (6, 'drop indexes no route query uses', [
+        # Random selection is served by item_sampler, stats by inventory_counts and
+        # template filters by template_catalog, so these only cost writes
+        'DROP INDEX IF EXISTS idx_inventory_items_category_rarity',
+        'DROP INDEX IF EXISTS idx_inventory_items_rarity',
+        'DROP INDEX IF EXISTS idx_inventory_items_type',
+        'DROP INDEX IF EXISTS idx_inventory_items_prefix',
+        'DROP INDEX IF EXISTS idx_item_templates_rarity'
+    ])
+]
+
+LATEST_VERSION = MIGRATIONS[-1][0]
+
+# Schema of the per-session shard files (see session_shards.py), versioned
+# separately from the main database
+SHARD_MIGRATIONS = [
+    (1, 'session robot state and inventory', [
+        # Which shard of how many this file is; checked on every open
+        '''
+        CREATE TABLE IF NOT EXISTS shard_info (
+            key TEXT PRIMARY KEY,
+            value INTEGER NOT NULL
+        )
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_robot_state (
+            session_id TEXT PRIMARY KEY,
+            x REAL,
+            y REAL,
+            direction INTEGER,
+            is_digging BOOLEAN,
+            is_jumping BOOLEAN,
+            timestamp TEXT
+        ) WITHOUT ROWID
+        ''',
+        '''
+        CREATE TABLE IF NOT EXISTS session_inventory_items (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            session_id TEXT NOT NULL,
+            name TEXT,
+            type TEXT,
+            prefix TEXT,
+            color TEXT,
+            symbol TEXT,
+            rarity TEXT,
+            description TEXT,
+            category TEXT,
+            timestamp TEXT
+        )
+        ''',
+        # A session's items, newest first
+        'CREATE INDEX IF NOT EXISTS idx_session_inventory_items_session ON session_inventory_items (session_id, id)',
+        # Row counts for the status page, kept by triggers like inventory_counts
+        '''
+        CREATE TABLE IF NOT EXISTS shard_counts (
+            name TEXT PRIMARY KEY,
+            count INTEGER NOT NULL DEFAULT 0
+        )
+        ''',
+        "INSERT OR IGNORE INTO shard_counts (name, count) VALUES ('sessions', 0), ('inventory_items', 0)",
+        '''
+        CREATE TRIGGER IF NOT EXISTS shard_counts_sessions_after_insert AFTER INSERT ON session_robot_state
+        BEGIN
+            UPDATE shard_counts SET count = count + 1 WHERE name = 'sessions';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shard_counts_sessions_after_delete AFTER DELETE ON session_robot_state
+        BEGIN
+            UPDATE shard_counts SET count = count - 1 WHERE name = 'sessions';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shard_counts_items_after_insert AFTER INSERT ON session_inventory_items
+        BEGIN
+            UPDATE shard_counts SET count = count + 1 WHERE name = 'inventory_items';
+        END
+        ''',
+        '''
+        CREATE TRIGGER IF NOT EXISTS shard_counts_items_after_delete AFTER DELETE ON session_inventory_items
+        BEGIN
+            UPDATE shard_counts SET count = count - 1 WHERE name = 'inventory_items';
+        END
+        '''
+    ])
+]
+
+# Queries the routes run, with the index each one is expected to use.
+# Every secondary index should back at least one entry here.
+HOT_QUERIES = {
+    'inventory_recent': (
+        'SELECT * FROM inventory_items WHERE timestamp IS NOT NULL ORDER BY timestamp DESC, id DESC LIMIT 10',
+        (), 'idx_inventory_items_timestamp'),
+    'inventory_recent_after_cursor': (
+        'SELECT * FROM inventory_items WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC LIMIT 10',
+        ('2025-01-01 00:00:00', 100), 'idx_inventory_items_timestamp'),
+    'inventory_untimestamped': (
+        'SELECT * FROM inventory_items WHERE timestamp IS NULL AND id < ? ORDER BY id DESC LIMIT 10',
+        (100,), 'idx_inventory_items_timestamp'),
+    'inventory_sampler_load': (
+        'SELECT id, category, rarity FROM inventory_items WHERE id > ? ORDER BY id',
+        (0,), 'INTEGER PRIMARY KEY'),
+    'inventory_counts_total': (
+        "SELECT count FROM inventory_counts WHERE dimension = 'total'",
+        (), 'idx_inventory_counts_dimension_key'),
+    'templates_category_rarity_counts': (
+        'SELECT category, rarity, COUNT(*) FROM item_templates GROUP BY category, rarity',
+        (), 'idx_item_templates_category_rarity'),
+    'trajectory_range': (
+        'SELECT ts, sample FROM robot_trajectory WHERE resolution = ? AND ts >= ? AND ts < ? ORDER BY ts',
+        (0, 0, 60000), 'PRIMARY KEY')
+}
+
+
+def ensure_version_table(conn):
+    conn.execute('''
+    CREATE TABLE IF NOT EXISTS schema_version (
+        version INTEGER PRIMARY KEY,
+        name TEXT,
+        applied_at TEXT
+    )
+    ''')
+
+
+def get_version(conn):
+    """Return the highest applied migration version (0 for a fresh database)"""
+    # Stamped into the file header by migrate(): one page read, no table lookups
+    version = conn.execute('PRAGMA user_version').fetchone()[0]
+    if version:
+        return version
+    row = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name = 'schema_version'"
+    ).fetchone()
+    if not row:
+        return 0
+    return conn.execute('SELECT COALESCE(MAX(version), 0) FROM schema_version').fetchone()[0]
+
+
+def migrate(conn, target=None, log=None, migrations=MIGRATIONS):
+    """Apply pending migrations up to target (default: the latest of migrations);
+    returns the list of versions applied"""
+    if target is None:
+        target = migrations[-1][0]
+    current = get_version(conn)
+    if current >= target:
+        if current and not conn.execute('PRAGMA user_version').fetchone()[0]:
+            # Migrated before versions were stamped: stamp once so later checks take the fast path
+            conn.execute(f'PRAGMA user_version = {int(current)}')
+        return []
+
+    applied = []
+    for version, name, statements in migrations:
+        if version > target:
+            break
+        # Each step runs in its own write transaction so concurrent
+        # starters cannot apply the same step twice
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            ensure_version_table(conn)
+            if get_version(conn) >= version:
+                conn.rollback()
+                continue
+            for statement in statements:
+                conn.execute(statement)
+            conn.execute(
+                "INSERT INTO schema_version (version, name, applied_at) VALUES (?, ?, datetime('now'))",
+                (version, name)
+            )
+            conn.execute(f'PRAGMA user_version = {int(version)}')
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+        applied.append(version)
+        if log:
+            log(f'Applied migration {version}: {name}')
+    return applied
+
+
+def explain(conn, sql, params=()):
+    """Return the EXPLAIN QUERY PLAN detail lines for a statement"""
+    return [row[-1] for row in conn.execute(f'EXPLAIN QUERY PLAN {sql}', params).fetchall()]
+
+
+def check_query_plans(conn):
+    """Return {query name: (uses expected index, plan lines)} for HOT_QUERIES"""
+    results = {}
+    for name, (sql, params, index) in HOT_QUERIES.items():
+        plan = explain(conn, sql, params)
+        results[name] = (any(index in line for line in plan), plan)
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Upgrade the Blipp game database schema')
+    parser.add_argument('--db', default=DB_PATH, help='database file (default: %(default)s)')
+    parser.add_argument('--status', action='store_true', help='show applied and pending migrations')
+    parser.add_argument('--plans', action='store_true', help='show query plans for the hot queries')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        if args.status:
+            current = get_version(conn)
+            print(f'Database: {args.db}')
+            print(f'Schema version: {current} (latest {LATEST_VERSION})')
+            for version, name, _ in MIGRATIONS:
+                state = 'applied' if version <= current else 'pending'
+                print(f'  {version:3d}  {state:8s} {name}')
+            return 0
+
+        if args.plans:
+            ok = True
+            for name, (uses_index, plan) in check_query_plans(conn).items():
+                ok = ok and uses_index
+                print(f"{'OK ' if uses_index else 'BAD'} {name}")
+                for line in plan:
+                    print(f'      {line}')
+            return 0 if ok else 1
+
+        applied = migrate(conn, log=print)
+        if not applied:
+            print(f'Schema already at version {get_version(conn)}')
+        return 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
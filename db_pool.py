@@ -0,0 +1,262 @@
+#!/usr/bin/env python
+# SQLite Connection Pool for the Blipp game database server
+
+import sqlite3
+import threading
+import queue
+import time
+from contextlib import contextmanager
+
+# Pragmas applied once when a pooled connection is opened
+DEFAULT_PRAGMAS = {
+    'journal_mode': 'WAL',
+    'synchronous': 'NORMAL',
+    'busy_timeout': 5000,          # milliseconds
+    'mmap_size': 268435456,        # 256 MB
+    'cache_size': -16000,          # negative = KiB, so ~16 MB of page cache
+    'temp_store': 'MEMORY'
+}
+
+
+class TimedCursor(sqlite3.Cursor):
+    """Cursor that reports the time spent executing and fetching to a hook.
+
+    fetchone/fetchmany/fetchall are timed per call. Iterating over the cursor
+    is not timed (a Python-level __next__ would cost every row two clock
+    reads); loops over large results use fetchmany batches instead, or
+    RowTimedCursor when every fetch has to be counted.
+    """
+
+    hook = None
+    _sql = None
+    _parameters = None
+    _iter_time = 0.0
+
+    def execute(self, sql, parameters=()):
+        start = time.perf_counter()
+        try:
+            return super().execute(sql, parameters)
+        finally:
+            self._sql = sql
+            self._parameters = parameters
+            self._iter_time = 0.0
+            self.hook(sql, parameters, time.perf_counter() - start, 'execute')
+
+    def executemany(self, sql, seq_of_parameters):
+        start = time.perf_counter()
+        try:
+            return super().executemany(sql, seq_of_parameters)
+        finally:
+            self._sql = sql
+            self._parameters = None
+            self._iter_time = 0.0
+            self.hook(sql, None, time.perf_counter() - start, 'executemany')
+
+    def fetchone(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchone()
+        finally:
+            self.hook(self._sql, self._parameters, time.perf_counter() - start, 'fetch')
+
+    def fetchmany(self, size=None):
+        start = time.perf_counter()
+        try:
+            return super().fetchmany(self.arraysize if size is None else size)
+        finally:
+            self.hook(self._sql, self._parameters, time.perf_counter() - start, 'fetch')
+
+    def fetchall(self):
+        start = time.perf_counter()
+        try:
+            return super().fetchall()
+        finally:
+            self.hook(self._sql, self._parameters, time.perf_counter() - start, 'fetch')
+
+
+class RowTimedCursor(TimedCursor):
+    """TimedCursor that also times iteration, row by row (opt-in: ConnectionPool(time_rows=True))"""
+
+    def __next__(self):
+        start = time.perf_counter()
+        try:
+            row = super().__next__()
+        except StopIteration:
+            # A loop over the cursor is reported as one fetch once the rows run out
+            self.hook(self._sql, self._parameters, self._iter_time + time.perf_counter() - start, 'fetch')
+            self._iter_time = 0.0
+            raise
+        self._iter_time += time.perf_counter() - start
+        return row
+
+
+class TimedConnection(sqlite3.Connection):
+    """Connection whose cursors (including execute() shortcuts) are TimedCursors"""
+
+    statement_hook = None
+    cursor_class = TimedCursor
+
+    def cursor(self, factory=None):
+        cursor = super().cursor(factory or self.cursor_class)
+        if isinstance(cursor, TimedCursor):
+            cursor.hook = self.statement_hook
+        return cursor
+
+    def execute(self, sql, parameters=()):
+        return self.cursor().execute(sql, parameters)
+
+    def executemany(self, sql, seq_of_parameters):
+        return self.cursor().executemany(sql, seq_of_parameters)
+
+
+class ConnectionPool:
+    """Bounded pool of pre-configured SQLite connections shared by request threads"""
+
+    def __init__(self, db_path, max_size=8, timeout=10.0, cached_statements=256, pragmas=None,
+                 statement_hook=None, time_rows=False):
+        self.db_path = db_path
+        # Called as hook(sql, params, seconds, phase) for every execute/fetch when set;
+        # with time_rows, loops over a cursor are timed too, at a cost per row
+        self.statement_hook = statement_hook
+        self.time_rows = time_rows
+        self.max_size = max_size
+        self.timeout = timeout
+        self.cached_statements = cached_statements
+        self.pragmas = dict(DEFAULT_PRAGMAS if pragmas is None else pragmas)
+
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+        # Pool statistics
+        self._hits = 0
+        self._misses = 0
+        self._waits = 0
+        self._wait_time = 0.0
+        self._checkouts = 0
+
+    def _connect(self):
+        conn = sqlite3.connect(
+            self.db_path,
+            timeout=self.pragmas.get('busy_timeout', 5000) / 1000.0,
+            check_same_thread=False,
+            cached_statements=self.cached_statements,
+            factory=TimedConnection if self.statement_hook else sqlite3.Connection
+        )
+        if self.statement_hook:
+            conn.statement_hook = self.statement_hook
+            if self.time_rows:
+                conn.cursor_class = RowTimedCursor
+        conn.row_factory = sqlite3.Row
+        for name, value in self.pragmas.items():
+            conn.execute(f'PRAGMA {name} = {value}')
+        return conn
+
+    def acquire(self):
+        """Check out a connection, opening a new one while the pool is below max_size"""
+        try:
+            conn = self._idle.get_nowait()
+            with self._lock:
+                self._hits += 1
+                self._checkouts += 1
+            return conn
+        except queue.Empty:
+            pass
+
+        with self._lock:
+            can_create = self._created < self.max_size
+            if can_create:
+                self._created += 1
+                self._misses += 1
+                self._checkouts += 1
+
+        if can_create:
+            try:
+                return self._connect()
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        # Pool exhausted: wait for another thread to release a connection
+        start = time.perf_counter()
+        try:
+            conn = self._idle.get(timeout=self.timeout)
+        except queue.Empty:
+            raise TimeoutError(f'Timed out after {self.timeout}s waiting for a database connection')
+        waited = time.perf_counter() - start
+        with self._lock:
+            self._hits += 1
+            self._waits += 1
+            self._wait_time += waited
+            self._checkouts += 1
+        return conn
+
+    def release(self, conn):
+        """Return a connection to the pool, rolling back anything left uncommitted"""
+        try:
+            if conn.in_transaction:
+                conn.rollback()
+        except sqlite3.Error:
+            # A broken connection is dropped instead of being reused
+            with self._lock:
+                self._created -= 1
+            try:
+                conn.close()
+            except sqlite3.Error:
+                pass
+            return
+        self._idle.put(conn)
+
+    @contextmanager
+    def connection(self):
+        conn = self.acquire()
+        try:
+            yield conn
+        finally:
+            self.release(conn)
+
+    def close_all(self):
+        """Close every idle connection (used on shutdown)"""
+        while True:
+            try:
+                conn = self._idle.get_nowait()
+            except queue.Empty:
+                break
+            with self._lock:
+                self._created -= 1
+            conn.close()
+
+    def reset_after_fork(self):
+        """Forget connections inherited from the parent process.
+
+        SQLite handles must not be used across fork(), and closing them in
+        the child could checkpoint or unlock the parent's database, so they
+        are only dropped from the pool (and kept referenced so they are never
+        finalized here). Call in the child right after fork.
+        """
+        abandoned = []
+        while True:
+            try:
+                abandoned.append(self._idle.get_nowait())
+            except queue.Empty:
+                break
+        self._abandoned = abandoned
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+
+    def stats(self):
+        with self._lock:
+            return {
+                'max_size': self.max_size,
+                'open_connections': self._created,
+                'idle_connections': self._idle.qsize(),
+                'checkouts': self._checkouts,
+                'hits': self._hits,
+                'misses': self._misses,
+                'waits': self._waits,
+                'wait_time_seconds': round(self._wait_time, 6),
+                'cached_statements': self.cached_statements,
+                'pragmas': dict(self.pragmas)
+            }
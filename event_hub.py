@@ -0,0 +1,126 @@
+#!/usr/bin/env python
+# In-process publish/subscribe hub behind the /api/events change feed
+#
+# Write paths publish small change events; every connected client holds one
+# Server-Sent Events stream. Recent events stay in a ring buffer so a client
+# reconnecting with Last-Event-ID replays exactly what it missed. If the
+# gap is no longer buffered (or the server restarted) the client gets a
+# 'reset' event telling it to refetch its state instead.
+
+import threading
+import time
+import uuid
+from collections import deque
+from itertools import islice
+
+from streaming import format_sse
+
+BUFFER_SIZE = 1024
+KEEPALIVE_INTERVAL = 15.0
+# Client reconnect delay advertised in the stream (milliseconds)
+RETRY_MS = 3000
+
+
+class EventHub:
+    def __init__(self, buffer_size=BUFFER_SIZE, keepalive=KEEPALIVE_INTERVAL):
+        self.keepalive = keepalive
+        # Event ids are "<epoch>:<sequence>"; the epoch changes on every
+        # start so ids from a previous process are never mistaken for ours
+        self.epoch = uuid.uuid4().hex[:8]
+
+        self._cond = threading.Condition()
+        self._buffer = deque(maxlen=buffer_size)   # (sequence, event type, encoded message)
+        self._sequence = 0
+
+        # Statistics
+        self._published = 0
+        self._subscribers = 0
+        self._replayed = 0
+        self._resets = 0
+
+    def publish(self, event, data):
+        """Record an event and wake every subscriber; returns its id"""
+        with self._cond:
+            self._sequence += 1
+            event_id = f'{self.epoch}:{self._sequence}'
+            # Encoded once here instead of once per subscriber
+            self._buffer.append((self._sequence, event, format_sse(data, event=event, event_id=event_id)))
+            self._published += 1
+            self._cond.notify_all()
+        return event_id
+
+    def _resume_point(self, last_event_id):
+        """Return the sequence to resume after, or None if the gap cannot be replayed"""
+        if not last_event_id:
+            return self._sequence
+        epoch, _, sequence = last_event_id.partition(':')
+        if epoch != self.epoch or not sequence.isdigit():
+            return None
+        sequence = int(sequence)
+        oldest = self._buffer[0][0] if self._buffer else self._sequence + 1
+        if sequence > self._sequence or sequence < oldest - 1:
+            return None
+        return sequence
+
+    def stream(self, last_event_id=None, events=None):
+        """Yield SSE messages for one client, optionally limited to some event types"""
+        with self._cond:
+            self._subscribers += 1
+            cursor = self._resume_point(last_event_id)
+            if cursor is None:
+                cursor = self._sequence
+                self._resets += 1
+                reset = format_sse({'reason': 'missed events are no longer available'}, event='reset',
+                                   event_id=f'{self.epoch}:{cursor}')
+            else:
+                reset = None
+                self._replayed += self._sequence - cursor
+        try:
+            yield f'retry: {RETRY_MS}\n\n'
+            if reset:
+                yield reset
+            last_write = time.monotonic()
+            while True:
+                with self._cond:
+                    if self._sequence == cursor:
+                        self._cond.wait(self.keepalive)
+                    oldest = self._buffer[0][0] if self._buffer else self._sequence + 1
+                    if cursor < oldest - 1:
+                        # This client fell further behind than the buffer reaches
+                        pending = None
+                        cursor = self._sequence
+                        self._resets += 1
+                    else:
+                        # Sequences in the buffer are contiguous, so skip straight to cursor + 1
+                        pending = list(islice(self._buffer, cursor - oldest + 1, None))
+                        cursor = self._sequence
+
+                if pending is None:
+                    yield format_sse({'reason': 'client fell behind'}, event='reset',
+                                     event_id=f'{self.epoch}:{cursor}')
+                    last_write = time.monotonic()
+                    continue
+                messages = [message for _, event, message in pending if events is None or event in events]
+                if messages:
+                    yield ''.join(messages)
+                    last_write = time.monotonic()
+                elif time.monotonic() - last_write >= self.keepalive:
+                    # Comment line: keeps proxies from timing out an idle stream
+                    yield ': keepalive\n\n'
+                    last_write = time.monotonic()
+        finally:
+            with self._cond:
+                self._subscribers -= 1
+
+    def stats(self):
+        with self._cond:
+            return {
+                'epoch': self.epoch,
+                'last_event_id': f'{self.epoch}:{self._sequence}',
+                'buffered_events': len(self._buffer),
+                'buffer_size': self._buffer.maxlen,
+                'published': self._published,
+                'subscribers': self._subscribers,
+                'replayed': self._replayed,
+                'resets': self._resets
+            }
@@ -1,56 +1,229 @@
-from flask import Flask, request, jsonify, Response
+from flask import Blueprint, Flask, current_app, request, jsonify, Response, g, send_file
+from flask.json import JSONEncoder
 from flask_cors import CORS
 import sqlite3
 import json
-import os
 import logging
+import os
+import base64
 import sys
 import traceback
 import time
+import threading
+import atexit
+import hmac
 from datetime import datetime
+from urllib.parse import urlencode
 
-app = Flask(__name__)
+from game_logging import setup_logging, RequestLogSampler
+from db_pool import ConnectionPool
+from db_migrations import migrate
+from item_sampler import RandomSampler
+from inventory_stats import read_stats, stats_key
+from robot_state_store import RobotStateStore
+from session_shards import SessionStore, valid_session_id
+from robot_trajectory import TrajectoryStore, parse_time, now_ms
+from robot_frames import decode_frames
+from metrics import MetricsRegistry
+from worker_health import read_heartbeats
+from response_cache import ResponseCache
+from dashboard_feed import DashboardFeed
+from event_hub import EventHub
+from request_profiler import RequestProfiler, PROFILE_HEADER
+from template_catalog import TemplateCatalog
+from sql_trace import StatementTracer
+from streaming import negotiate_format, iter_batches, stream_response, sse_response, encoded_response
 
-# Configure logging
-log_format = logging.Formatter('%(asctime)s - %(name)s - %(levelname)s - %(message)s')
+# Routes are registered on the app by create_app(); importing this module
+# opens no files, databases or threads
+api = Blueprint('game_db', __name__)
 
-# Console handler
-console_handler = logging.StreamHandler(sys.stdout)
-console_handler.setFormatter(log_format)
+# Database setup
+# Use a relative path with the script directory to ensure consistency
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 
-# File handler
-file_handler = logging.FileHandler('game_db.log')
-file_handler.setFormatter(log_format)
+def default_config():
+    """Settings from the BLIPP_* environment variables; create_app(config) overrides them by key"""
+    return {
+        'DB_PATH': os.environ.get('BLIPP_DB_PATH', os.path.join(SCRIPT_DIR, 'game_data.db')),
+        # Pooled, pre-configured connections shared by all request threads
+        'DB_POOL_SIZE': int(os.environ.get('BLIPP_DB_POOL_SIZE', 8)),
+        # Request threads only enqueue log records; a background listener writes
+        # them to the console and a size-rotated log file
+        'LOG_FILE': os.environ.get('BLIPP_LOG_FILE', 'game_db.log'),
+        'LOG_JSON': os.environ.get('BLIPP_LOG_JSON', '0') == '1',
+        'LOG_MAX_BYTES': int(os.environ.get('BLIPP_LOG_MAX_BYTES', 10 * 1024 * 1024)),
+        'LOG_BACKUP_COUNT': int(os.environ.get('BLIPP_LOG_BACKUP_COUNT', 5)),
+        # Sample high-volume routes in the request log, e.g. "/api/robot/state=0.01"
+        'LOG_SAMPLE': os.environ.get('BLIPP_LOG_SAMPLE', '/api/robot/state=0.01,/api/robot/state/frames=0.01'),
+        # Per-statement timing by SQL shape, shown at /api/debug/sql. Statements slower
+        # than SLOW_QUERY_MS are logged (logger game_db.slow_sql) with their
+        # parameters and query plan
+        'SQL_TRACE': os.environ.get('BLIPP_SQL_TRACE', '1') == '1',
+        'SLOW_QUERY_MS': float(os.environ.get('BLIPP_SLOW_QUERY_MS', 100)),
+        # Also time loops over a cursor row by row (off: fetch calls are timed per
+        # call, and large results are read with fetchmany)
+        'SQL_TIME_ROWS': os.environ.get('BLIPP_SQL_TIME_ROWS', '0') == '1',
+        # /api/debug/sql shows statement text and bound parameters, so it is only
+        # served to requests sending this token in the X-Blipp-Debug-Token header
+        # (unset: the endpoint is off; tracing still feeds the slow-query log)
+        'DEBUG_TOKEN': os.environ.get('BLIPP_DEBUG_TOKEN') or None,
+        # Item templates are served from memory and reloaded when the table changes
+        'TEMPLATE_CHECK_INTERVAL': float(os.environ.get('BLIPP_TEMPLATE_CHECK_INTERVAL', 1.0)),
+        # Latest robot state is served from memory and flushed to disk periodically
+        'ROBOT_STATE_FLUSH_INTERVAL': float(os.environ.get('BLIPP_ROBOT_STATE_FLUSH_INTERVAL', 0.5)),
+        # Set by serve_prod.py when several worker processes share the database
+        'ROBOT_STATE_SHARED': os.environ.get('BLIPP_ROBOT_STATE_SHARED', '0') == '1',
+        # Per-session robot state and inventory (/api/sessions/<id>/...) live in this
+        # many shard files next to DB_PATH. Changing it on an existing deployment
+        # needs the shard files moved aside: sessions are routed by id hash
+        'SESSION_SHARDS': int(os.environ.get('BLIPP_SESSION_SHARDS', 4)),
+        'SESSION_SHARD_POOL_SIZE': int(os.environ.get('BLIPP_SESSION_SHARD_POOL_SIZE', 4)),
+        'SESSION_IDLE_SECONDS': float(os.environ.get('BLIPP_SESSION_IDLE_SECONDS', 300)),
+        # Change feed behind /api/events; write paths publish to it
+        'EVENT_BUFFER_SIZE': int(os.environ.get('BLIPP_EVENT_BUFFER_SIZE', 1024)),
+        'DASHBOARD_PUSH_INTERVAL': float(os.environ.get('BLIPP_DASHBOARD_PUSH_INTERVAL', 1.0)),
+        # Heartbeat directory of the multi-process launcher (unset for a single process)
+        'RUN_DIR': os.environ.get('BLIPP_RUN_DIR')
+    }
 
-# Set up logger
+# Services shared by the routes, built by create_app()
 logger = logging.getLogger('game_db')
-logger.setLevel(logging.INFO)
-logger.addHandler(console_handler)
-logger.addHandler(file_handler)
+log_listener = None
+request_log_sampler = None
+server_start_time = time.time()
+DB_PATH = None
+RUN_DIR = None
+DEBUG_TOKEN = None
+metrics = None
+sql_tracer = None
+db_pool = None
+inventory_sampler = None
+template_catalog = None
+event_hub = None
+robot_trajectory = None
+robot_state = None
+session_store = None
+dashboard_feed = None
+profiler = None
 
-# Enable CORS for all routes with more specific configuration
-CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"]}})
+# Dependencies versioned by the table_generations table (see db_migrations.py)
+GENERATION_TABLES = ('inventory_items', 'item_templates')
 
-# Track server status
-server_start_time = time.time()
-request_count = 0
+def current_generation(deps):
+    """Return (generation, last_modified) for the response cache, or (None, None)
+    when a dependency cannot be versioned"""
+    generation = []
+    last_modified = server_start_time
+    tables = [dep for dep in deps if dep in GENERATION_TABLES]
+    if tables:
+        with db_pool.connection() as conn:
+            rows = {row['name']: row for row in conn.execute('SELECT name, generation, updated_at FROM table_generations')}
+        for table in tables:
+            generation.append(rows[table]['generation'])
+            last_modified = max(last_modified, rows[table]['updated_at'])
+    if 'robot_state' in deps:
+        robot_generation, updated = robot_state.generation()
+        if robot_generation is None:
+            return None, None
+        generation.append(robot_generation)
+        last_modified = max(last_modified, updated or 0)
+    return tuple(generation), last_modified
+
+# Cached GET bodies with ETag/Last-Modified, revalidated by write generations.
+# Built at import because the route decorators below bind to it
+RESPONSE_CACHE_SIZE = int(os.environ.get('BLIPP_RESPONSE_CACHE_SIZE', 256))
+response_cache = ResponseCache(current_generation, max_entries=RESPONSE_CACHE_SIZE)
+
+class TimedJSONEncoder(JSONEncoder):
+    # jsonify() encodes through app.json_encoder, so this times serialization
+    def encode(self, o):
+        start = time.perf_counter()
+        try:
+            return super().encode(o)
+        finally:
+            metrics.add_serialize_time(time.perf_counter() - start)
+
+def record_statement(sql, params, seconds, phase, db_path=None):
+    metrics.add_sqlite_time(seconds)
+    if sql_tracer:
+        sql_tracer.record(sql, params, seconds, phase, db_path)
+
+_schema_lock = threading.Lock()
+_schema_ready = False
 
-@app.after_request
+def init_db():
+    # Bring the schema up to date (no-op when already at the latest version)
+    global _schema_ready
+    with _schema_lock:
+        if _schema_ready:
+            return
+        with db_pool.connection() as conn:
+            applied = migrate(conn, log=logger.info)
+        if applied:
+            logger.info(f'Database schema upgraded to version {applied[-1]}')
+        _schema_ready = True
+
+def _after_fork_in_child():
+    # Threads and SQLite handles do not survive fork(); workers start clean
+    if db_pool:
+        db_pool.reset_after_fork()
+    if robot_state:
+        robot_state.reset_after_fork()
+    if session_store:
+        session_store.reset_after_fork()
+
+os.register_at_fork(after_in_child=_after_fork_in_child)
+
+def shutdown():
+    """Persist buffered robot state and close the pooled connections"""
+    # Without a first request there is no schema, and nothing was buffered
+    if robot_state is not None and _schema_ready:
+        robot_state.stop()
+    if session_store is not None:
+        session_store.stop()
+    if db_pool is not None:
+        db_pool.close_all()
+
+atexit.register(shutdown)
+
+@api.before_app_request
+def before_request():
+    if not _schema_ready:
+        # The schema is checked once, by the first request
+        init_db()
+    g.request_start = time.perf_counter()
+    metrics.begin_request()
+    if sql_tracer:
+        sql_tracer.begin_request(request.url_rule.rule if request.url_rule else 'unmatched')
+
+@api.after_app_request
 def after_request(response):
-    global request_count
-    request_count += 1
+    route = request.url_rule.rule if request.url_rule else 'unmatched'
+    start = g.get('request_start')
+    duration = time.perf_counter() - start if start is not None else 0.0
+    metrics.end_request(route, request.method, response.status_code, duration)
     
     # Add CORS headers
     response.headers.add('Access-Control-Allow-Origin', '*')
-    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization')
+    response.headers.add('Access-Control-Allow-Headers', 'Content-Type,Authorization,If-None-Match,Last-Event-ID,X-Blipp-Profile,X-Blipp-Debug-Token')
     response.headers.add('Access-Control-Allow-Methods', 'GET,POST,OPTIONS')
+    response.headers.add('Access-Control-Expose-Headers', 'X-Next-Cursor,Link,ETag,Last-Modified,X-Blipp-Profile-Id')
     
-    # Log request details
-    logger.info(f"Request: {request.path} - Status: {response.status_code}")
+    # Log request details (sampled for high-volume routes)
+    if request_log_sampler.should_log(request.path, response.status_code):
+        logger.info(f"Request: {request.path} - Status: {response.status_code}",
+                    extra={'method': request.method, 'path': request.path, 'status': response.status_code})
     
     return response
 
-@app.errorhandler(Exception)
+@api.teardown_app_request
+def teardown_request(exc):
+    # Later statements on this thread (shutdown flushes, unwrapped streams) are background work
+    if sql_tracer:
+        sql_tracer.end_request()
+
+@api.app_errorhandler(Exception)
 def handle_exception(e):
     # Log the error
     logger.error(f"Unhandled exception: {str(e)}")
@@ -63,158 +236,288 @@ def handle_exception(e):
         'timestamp': datetime.now().isoformat()
     }), 500
 
-# Database setup
-# Use a relative path with the script directory to ensure consistency
-SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
-DB_PATH = os.path.join(SCRIPT_DIR, 'game_data.db')
-
-# Log the database path for troubleshooting
-logger.info(f'Using database at: {DB_PATH}')
 
-def init_db():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Create tables if they don't exist
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS robot_state (
-        id INTEGER PRIMARY KEY,
-        x REAL,
-        y REAL,
-        direction INTEGER,
-        is_digging BOOLEAN,
-        is_jumping BOOLEAN,
-        timestamp TEXT
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS inventory_items (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        type TEXT,
-        prefix TEXT,
-        color TEXT,
-        symbol TEXT,
-        rarity TEXT,
-        description TEXT,
-        category TEXT,
-        timestamp TEXT
-    )
-    ''')
-    
-    cursor.execute('''
-    CREATE TABLE IF NOT EXISTS item_templates (
-        id INTEGER PRIMARY KEY AUTOINCREMENT,
-        name TEXT,
-        type TEXT,
-        prefix TEXT,
-        rarity TEXT,
-        description TEXT,
-        category TEXT
-    )
-    ''')
-    
-    conn.commit()
-    conn.close()
-
-# Initialize database
-init_db()
-
-@app.route('/api/robot/state', methods=['POST'])
+@api.route('/api/robot/state', methods=['POST'])
 def update_robot_state():
     data = request.json
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
     
-    # Update or insert robot state
-    cursor.execute('''
-    INSERT OR REPLACE INTO robot_state (id, x, y, direction, is_digging, is_jumping, timestamp)
-    VALUES (1, ?, ?, ?, ?, ?, datetime('now'))
-    ''', (data.get('x'), data.get('y'), data.get('direction'), 
-          data.get('isDigging'), data.get('isJumping')))
+    # Coalesced in memory; the background flusher persists the newest state
+    robot_state.update(data.get('x'), data.get('y'), data.get('direction'),
+                       data.get('isDigging'), data.get('isJumping'))
     
-    conn.commit()
-    conn.close()
     return jsonify({"status": "success"})
 
-@app.route('/api/robot/state', methods=['GET'])
+@api.route('/api/robot/state', methods=['GET'])
+@response_cache.cached('robot_state')
 def get_robot_state():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    cursor.execute('SELECT * FROM robot_state WHERE id = 1')
-    row = cursor.fetchone()
+    state = robot_state.get()
     
-    if row:
-        state = dict(row)
-        conn.close()
+    if state:
         return jsonify(state)
     else:
-        conn.close()
         return jsonify({"status": "not_found"})
 
-@app.route('/api/inventory/add', methods=['POST'])
+# Binary robot state updates: one or more struct-packed frames per request
+# (layout in robot_frames.py), for clients sending state every frame. Applied
+# like the same number of JSON updates, oldest first; age_ms dates each
+# frame's trajectory sample (frames older than MAX_SAMPLE_AGE_MS in
+# robot_trajectory.py only update the state). Answers 204 with no body
+@api.route('/api/robot/state/frames', methods=['POST'])
+def update_robot_state_frames():
+    try:
+        frames = decode_frames(request.get_data(cache=False))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    
+    received = now_ms()
+    for x, y, direction, is_digging, is_jumping, age_ms in frames:
+        robot_state.update(x, y, direction, is_digging, is_jumping, received - age_ms)
+    
+    return Response(status=204)
+
+# Default window of /api/robot/trajectory when "from" is omitted
+TRAJECTORY_DEFAULT_WINDOW_MS = 60 * 1000
+
+@api.route('/api/robot/trajectory', methods=['GET'])
+def get_robot_trajectory():
+    # from/to are epoch milliseconds or ISO-8601; resolution is auto, raw, 1s or 1m
+    try:
+        end = parse_time(request.args['to']) if request.args.get('to') else now_ms()
+        start = parse_time(request.args['from']) if request.args.get('from') else end - TRAJECTORY_DEFAULT_WINDOW_MS
+        name, width = robot_trajectory.resolve_resolution(request.args.get('resolution'), start, end)
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    if start >= end:
+        return jsonify({'error': "'from' must be before 'to'", 'status': 'error'}), 400
+
+    # Make this worker's buffered samples visible to the range query
+    robot_trajectory.flush()
+
+    fmt = negotiate_format(request)
+    if fmt:
+        def batches():
+            with db_pool.connection() as conn:
+                yield from robot_trajectory.iter_range(conn, width, start, end)
+        return stream_response(batches(), fmt)
+
+    with db_pool.connection() as conn:
+        points = [point for batch in robot_trajectory.iter_range(conn, width, start, end) for point in batch]
+
+    return jsonify({
+        'from': start,
+        'to': end,
+        'resolution': name,
+        'resolution_ms': width,
+        'count': len(points),
+        'points': points
+    })
+
+INSERT_INVENTORY_ITEM_SQL = '''
+INSERT INTO inventory_items (name, type, prefix, color, symbol, rarity, description, category, timestamp)
+VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+# Upper bound on items accepted by /api/inventory/add-batch in one request
+MAX_BATCH_ITEMS = int(os.environ.get('BLIPP_MAX_BATCH_ITEMS', 10000))
+
+# Field order of inventory_item_values()
+INVENTORY_ITEM_FIELDS = ('name', 'type', 'prefix', 'color', 'symbol', 'rarity', 'description', 'category')
+
+def inventory_item_values(item):
+    """Map a client item dict to the INSERT parameters (same defaults as /api/inventory/add)"""
+    return (item.get('name'), item.get('type'), item.get('prefix'), 
+            item.get('color'), item.get('symbol'), item.get('rarity', 'Common'),
+            item.get('description', ''), item.get('category', 'unknown'))
+
+def validate_inventory_item(item):
+    """Return an error message for a malformed item, or None if it can be inserted"""
+    if not isinstance(item, dict):
+        return 'item must be a JSON object'
+    for field in ('name', 'type', 'prefix', 'color', 'symbol', 'rarity', 'description', 'category'):
+        value = item.get(field)
+        if value is not None and not isinstance(value, str):
+            return f"field '{field}' must be a string"
+    return None
+
+@api.route('/api/inventory/add', methods=['POST'])
 def add_inventory_item():
     item = request.json
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
+    values = inventory_item_values(item)
+    with db_pool.connection() as conn:
+        cursor = conn.cursor()
+        cursor.execute(INSERT_INVENTORY_ITEM_SQL, values)
+        item_id = cursor.lastrowid
+        conn.commit()
+    
+    inventory_sampler.add(item_id, values[7], values[5])
+    event_hub.publish('inventory_added', {
+        'id': item_id,
+        **dict(zip(INVENTORY_ITEM_FIELDS, values))
+    })
     
-    cursor.execute('''
-    INSERT INTO inventory_items (name, type, prefix, color, symbol, rarity, description, category, timestamp)
-    VALUES (?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
-    ''', (item.get('name'), item.get('type'), item.get('prefix'), 
-          item.get('color'), item.get('symbol'), item.get('rarity', 'Common'),
-          item.get('description', ''), item.get('category', 'unknown')))
+    return jsonify({"status": "success", "id": item_id})
+
+@api.route('/api/inventory/add-batch', methods=['POST'])
+def add_inventory_batch():
+    # Accept a JSON array or an NDJSON body (one item per line)
+    try:
+        body = request.get_data(as_text=True)
+        if 'ndjson' in (request.content_type or ''):
+            items = [json.loads(line) for line in body.splitlines() if line.strip()]
+        else:
+            items = json.loads(body)
+    except ValueError as e:
+        return jsonify({'error': f'Invalid request body: {str(e)}', 'status': 'error'}), 400
+    
+    if not isinstance(items, list):
+        return jsonify({'error': 'Expected a JSON array of items', 'status': 'error'}), 400
+    if not items:
+        return jsonify({'status': 'success', 'count': 0, 'first_id': None, 'last_id': None})
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Batch too large ({len(items)} items, max {MAX_BATCH_ITEMS})',
+                        'status': 'error'}), 413
+    
+    for index, item in enumerate(items):
+        error = validate_inventory_item(item)
+        if error:
+            return jsonify({'error': f'Item {index}: {error}', 'status': 'error', 'index': index}), 400
+    
+    rows = [inventory_item_values(item) for item in items]
+    with db_pool.connection() as conn:
+        # One write transaction: AUTOINCREMENT ids in it are contiguous
+        conn.execute('BEGIN IMMEDIATE')
+        try:
+            conn.executemany(INSERT_INVENTORY_ITEM_SQL, rows)
+            last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+            conn.commit()
+        except Exception:
+            conn.rollback()
+            raise
+    
+    first_id = last_id - len(rows) + 1
+    for item_id, values in enumerate(rows, start=first_id):
+        inventory_sampler.add(item_id, values[7], values[5])
+    # One event per batch; clients refetch the range they care about
+    event_hub.publish('inventory_batch_added', {'count': len(rows), 'first_id': first_id, 'last_id': last_id})
+    
+    return jsonify({"status": "success", "count": len(rows), "first_id": first_id, "last_id": last_id})
+
+# Robot state and inventory of one game session (or player). Each session is
+# stored in one of the SESSION_SHARDS shard files, picked by a hash of its id
+def session_id_error(session_id):
+    """Return a 400 response for a malformed session id, else None"""
+    if not valid_session_id(session_id):
+        return jsonify({'error': 'Session ids are 1-64 letters, digits or _.:- characters',
+                        'status': 'error'}), 400
+    return None
+
+@api.route('/api/sessions/<session_id>/robot/state', methods=['POST'])
+def update_session_robot_state(session_id):
+    error = session_id_error(session_id)
+    if error:
+        return error
+    data = request.json
+    if not isinstance(data, dict):
+        return jsonify({'error': 'Expected a JSON object', 'status': 'error'}), 400
     
-    item_id = cursor.lastrowid
-    conn.commit()
-    conn.close()
+    session_store.update_robot_state(session_id, data.get('x'), data.get('y'), data.get('direction'),
+                                     data.get('isDigging'), data.get('isJumping'))
     
-    return jsonify({"status": "success", "id": item_id})
+    return jsonify({"status": "success"})
+
+@api.route('/api/sessions/<session_id>/robot/state', methods=['GET'])
+def get_session_robot_state(session_id):
+    error = session_id_error(session_id)
+    if error:
+        return error
+    state = session_store.get_robot_state(session_id)
+    
+    if state:
+        return jsonify(state)
+    else:
+        return jsonify({"status": "not_found"})
+
+# Binary frames as for /api/robot/state/frames. Sessions keep no trajectory,
+# so only the newest frame of a batch is applied
+@api.route('/api/sessions/<session_id>/robot/state/frames', methods=['POST'])
+def update_session_robot_state_frames(session_id):
+    error = session_id_error(session_id)
+    if error:
+        return error
+    try:
+        frames = decode_frames(request.get_data(cache=False))
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    
+    x, y, direction, is_digging, is_jumping, _ = frames[-1]
+    session_store.update_robot_state(session_id, x, y, direction, is_digging, is_jumping)
+    
+    return Response(status=204)
 
-@app.route('/api/inventory/random', methods=['GET'])
+# One item object or a JSON array of them (at most MAX_BATCH_ITEMS)
+@api.route('/api/sessions/<session_id>/inventory', methods=['POST'])
+def add_session_inventory(session_id):
+    error = session_id_error(session_id)
+    if error:
+        return error
+    data = request.json
+    items = data if isinstance(data, list) else [data]
+    if len(items) > MAX_BATCH_ITEMS:
+        return jsonify({'error': f'Batch too large ({len(items)} items, max {MAX_BATCH_ITEMS})',
+                        'status': 'error'}), 413
+    for index, item in enumerate(items):
+        error = validate_inventory_item(item)
+        if error:
+            return jsonify({'error': f'Item {index}: {error}', 'status': 'error', 'index': index}), 400
+    if not items:
+        return jsonify({'status': 'success', 'count': 0, 'ids': []})
+    
+    ids = session_store.add_items(session_id, [inventory_item_values(item) for item in items])
+    
+    if isinstance(data, list):
+        return jsonify({"status": "success", "count": len(ids), "ids": ids})
+    return jsonify({"status": "success", "id": ids[0]})
+
+# Newest first; ?cursor= is the X-Next-Cursor header of the previous page
+@api.route('/api/sessions/<session_id>/inventory', methods=['GET'])
+def get_session_inventory(session_id):
+    error = session_id_error(session_id)
+    if error:
+        return error
+    before_id = None
+    if request.args.get('cursor'):
+        before_id = request.args.get('cursor', type=int)
+        if before_id is None:
+            return jsonify({'error': 'Invalid cursor', 'status': 'error'}), 400
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    items = session_store.list_items(session_id, limit + 1, before_id)
+    
+    response = jsonify(items[:limit])
+    if len(items) > limit:
+        next_cursor = str(items[limit - 1]['id'])
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
+    
+    return response
+
+@api.route('/api/inventory/random', methods=['GET'])
 def get_random_inventory_item():
     # Get query parameters
     category = request.args.get('category', None)
     rarity = request.args.get('rarity', None)
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = 'SELECT * FROM inventory_items'
-    params = []
-    
-    # Add filters if provided
-    if category or rarity:
-        query += ' WHERE'
-        
-        if category:
-            query += ' category = ?'
-            params.append(category)
-            
-        if category and rarity:
-            query += ' AND'
-            
-        if rarity:
-            query += ' rarity = ?'
-            params.append(rarity)
-    
-    # Add random order and limit
-    query += ' ORDER BY RANDOM() LIMIT 1'
-    
-    cursor.execute(query, params)
-    row = cursor.fetchone()
+    with db_pool.connection() as conn:
+        rows = inventory_sampler.sample_rows(conn, category, rarity)
+    row = rows[0] if rows else None
     
     if row:
-        item = dict(row)
-        conn.close()
-        return jsonify(item)
+        return jsonify(dict(row))
     else:
         # If no items found, return a default item
-        conn.close()
         return jsonify({
             'name': 'Mystery Item',
             'type': 'unknown',
@@ -227,522 +530,208 @@ def get_random_inventory_item():
             'timestamp': datetime.now().isoformat()
         })
 
-@app.route('/api/item-templates', methods=['GET'])
+@api.route('/api/item-templates', methods=['GET'])
 def get_item_templates():
     category = request.args.get('category', None)
     rarity = request.args.get('rarity', None)
     limit = request.args.get('limit', 100, type=int)
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
-    
-    query = 'SELECT * FROM item_templates'
-    params = []
-    
-    # Add filters if provided
-    if category or rarity:
-        query += ' WHERE'
-        
-        if category:
-            query += ' category = ?'
-            params.append(category)
-            
-        if category and rarity:
-            query += ' AND'
-            
-        if rarity:
-            query += ' rarity = ?'
-            params.append(rarity)
-    
-    query += ' ORDER BY RANDOM() LIMIT ?'
-    params.append(limit)
-    
-    cursor.execute(query, params)
-    rows = cursor.fetchall()
-    
-    templates = [dict(row) for row in rows]
-    conn.close()
-    
-    return jsonify(templates)
+    bodies = template_catalog.sample(category, rarity, limit)
+    return encoded_response(bodies, negotiate_format(request))
 
-@app.route('/api/random-item', methods=['GET'])
+@api.route('/api/random-item', methods=['GET'])
 def get_random_item():
     category = request.args.get('category', None)
     rarity = request.args.get('rarity', None)
     
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+    bodies = template_catalog.sample(category, rarity)
     
-    query = 'SELECT * FROM item_templates'
-    params = []
-    
-    # Add filters if provided
-    if category or rarity:
-        query += ' WHERE'
-        
-        if category:
-            query += ' category = ?'
-            params.append(category)
-            
-        if category and rarity:
-            query += ' AND'
-            
-        if rarity:
-            query += ' rarity = ?'
-            params.append(rarity)
-    
-    query += ' ORDER BY RANDOM() LIMIT 1'
-    
-    cursor.execute(query, params)
-    row = cursor.fetchone()
-    
-    if row:
-        template = dict(row)
-        conn.close()
-        return jsonify(template)
+    if bodies:
+        return Response(bodies[0] + b'\n', mimetype='application/json')
     else:
-        conn.close()
         return jsonify({"status": "not_found"})
 
-@app.route('/api/inventory/items', methods=['GET'])
-def get_inventory_items():
-    conn = sqlite3.connect(DB_PATH)
-    conn.row_factory = sqlite3.Row
-    cursor = conn.cursor()
+# Columns a client may request through ?fields= on /api/inventory/items
+INVENTORY_COLUMNS = ('id', 'name', 'type', 'prefix', 'color', 'symbol', 'rarity',
+                     'description', 'category', 'timestamp')
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+def encode_cursor(timestamp, item_id):
+    raw = json.dumps([timestamp, item_id], separators=(',', ':')).encode('utf-8')
+    return base64.urlsafe_b64encode(raw).decode('ascii').rstrip('=')
+
+def decode_cursor(token):
+    try:
+        padded = token + '=' * (-len(token) % 4)
+        timestamp, item_id = json.loads(base64.urlsafe_b64decode(padded.encode('ascii')))
+    except (ValueError, TypeError, UnicodeError):
+        raise ValueError('Invalid cursor')
+    if not isinstance(item_id, int) or not (timestamp is None or isinstance(timestamp, str)):
+        raise ValueError('Invalid cursor')
+    return timestamp, item_id
+
+def parse_fields(fields_param, allowed):
+    """Turn ?fields=a,b into a column tuple, defaulting to every allowed column"""
+    if not fields_param:
+        return allowed
+    fields = tuple(f.strip() for f in fields_param.split(',') if f.strip())
+    unknown = [f for f in fields if f not in allowed]
+    if unknown:
+        raise ValueError(f"Unknown field(s): {', '.join(unknown)}")
+    return fields or allowed
+
+def iter_inventory_batches(conn, columns, after=None, limit=None):
+    """Yield batches of rows ordered by (timestamp DESC, id DESC) starting after
+    the (timestamp, id) keyset position, reading the cursor with fetchmany"""
+    # Always select the keyset columns; they are dropped from the output if not requested
+    select = ', '.join(dict.fromkeys(columns + ('timestamp', 'id')))
+    remaining = -1 if limit is None else limit
+    
+    # Rows with a timestamp come first; NULL timestamps sort last in DESC order
+    queries = []
+    if after is None:
+        queries.append(('WHERE timestamp IS NOT NULL ORDER BY timestamp DESC, id DESC', ()))
+    elif after[0] is not None:
+        queries.append(('WHERE (timestamp, id) < (?, ?) ORDER BY timestamp DESC, id DESC', after))
+    if after is not None and after[0] is None:
+        queries.append(('WHERE timestamp IS NULL AND id < ? ORDER BY id DESC', (after[1],)))
+    else:
+        queries.append(('WHERE timestamp IS NULL ORDER BY id DESC', ()))
     
-    cursor.execute('SELECT * FROM inventory_items ORDER BY timestamp DESC')
-    rows = cursor.fetchall()
+    cursor = conn.cursor()
+    for clause, params in queries:
+        if remaining == 0:
+            return
+        cursor.execute(f'SELECT {select} FROM inventory_items {clause} LIMIT ?', (*params, remaining))
+        for rows in iter_batches(cursor):
+            if remaining > 0:
+                remaining -= len(rows)
+            yield rows
+
+def fetch_inventory_page(conn, columns, limit, after=None):
+    """Return up to limit rows after the keyset position plus the cursor for the next page"""
+    rows = []
+    for batch in iter_inventory_batches(conn, columns, after, limit + 1):
+        rows.extend(batch)
+    
+    next_cursor = None
+    if len(rows) > limit:
+        rows = rows[:limit]
+        next_cursor = encode_cursor(rows[-1]['timestamp'], rows[-1]['id'])
+    
+    return [{column: row[column] for column in columns} for row in rows], next_cursor
+
+def stream_inventory_items(columns, after, limit, fmt):
+    def batches():
+        with db_pool.connection() as conn:
+            for rows in iter_inventory_batches(conn, columns, after, limit):
+                yield [{column: row[column] for column in columns} for row in rows]
+    return stream_response(batches(), fmt)
+
+@api.route('/api/inventory/items', methods=['GET'])
+@response_cache.cached('inventory_items')
+def get_inventory_items():
+    fmt = negotiate_format(request)
     
-    items = [dict(row) for row in rows]
-    conn.close()
+    try:
+        columns = parse_fields(request.args.get('fields'), INVENTORY_COLUMNS)
+        token = request.args.get('cursor')
+        after = decode_cursor(token) if token else None
+    except ValueError as e:
+        return jsonify({'error': str(e), 'status': 'error'}), 400
+    
+    if fmt:
+        # Streamed exports are unbounded unless a limit is given explicitly
+        limit = request.args.get('limit', None, type=int)
+        return stream_inventory_items(columns, after, limit if limit and limit > 0 else None, fmt)
+    
+    limit = request.args.get('limit', DEFAULT_PAGE_SIZE, type=int)
+    limit = max(1, min(limit, MAX_PAGE_SIZE))
+    
+    with db_pool.connection() as conn:
+        items, next_cursor = fetch_inventory_page(conn, columns, limit, after)
+    
+    response = jsonify(items)
+    if next_cursor:
+        # The body stays a plain array; the next page is advertised in headers
+        response.headers['X-Next-Cursor'] = next_cursor
+        args = request.args.to_dict()
+        args['cursor'] = next_cursor
+        response.headers['Link'] = f'<{request.path}?{urlencode(args)}>; rel="next"'
     
-    return jsonify(items)
+    return response
 
-@app.route('/api/inventory/stats', methods=['GET'])
+@api.route('/api/inventory/stats', methods=['GET'])
+@response_cache.cached('inventory_items')
 def get_inventory_stats():
-    conn = sqlite3.connect(DB_PATH)
-    cursor = conn.cursor()
-    
-    # Get total count
-    cursor.execute('SELECT COUNT(*) FROM inventory_items')
-    total_count = cursor.fetchone()[0]
-    
-    # Get counts by type
-    cursor.execute('SELECT type, COUNT(*) as count FROM inventory_items GROUP BY type')
-    type_counts = {row[0]: row[1] for row in cursor.fetchall()}
+    # Counters are maintained by triggers, so this reads one row per distinct key
+    with db_pool.connection() as conn:
+        stats = read_stats(conn)
     
-    # Get counts by prefix
-    cursor.execute('SELECT prefix, COUNT(*) as count FROM inventory_items GROUP BY prefix')
-    prefix_counts = {row[0]: row[1] for row in cursor.fetchall()}
-    
-    conn.close()
-    
-    return jsonify({
-        "total": total_count,
-        "by_type": type_counts,
-        "by_prefix": prefix_counts
-    })
+    return jsonify(stats)
+
+# Everything the dashboard renders, built in one read transaction
+DASHBOARD_RECENT_ITEMS = 10
+DASHBOARD_ITEM_COLUMNS = ('id', 'name', 'type', 'prefix', 'rarity', 'category', 'timestamp')
+DASHBOARD_SECTIONS = ('robot', 'inventory_stats', 'recent_items', 'template_stats')
+
+def read_template_stats(conn):
+    # Covering scan of idx_item_templates_category_rarity; the table is small and static
+    stats = {'total': 0, 'by_category': {}, 'by_rarity': {}}
+    for category, rarity, count in conn.execute(
+            'SELECT category, rarity, COUNT(*) FROM item_templates GROUP BY category, rarity'):
+        category, rarity = stats_key(category), stats_key(rarity)
+        stats['total'] += count
+        stats['by_category'][category] = stats['by_category'].get(category, 0) + count
+        stats['by_rarity'][rarity] = stats['by_rarity'].get(rarity, 0) + count
+    return stats
 
-@app.route('/api/dashboard', methods=['GET'])
+def build_dashboard_snapshot():
+    robot = robot_state.get()
+    with db_pool.connection() as conn:
+        # One read transaction so every section reflects the same commit
+        conn.execute('BEGIN')
+        try:
+            stats = read_stats(conn)
+            items, _ = fetch_inventory_page(conn, DASHBOARD_ITEM_COLUMNS, DASHBOARD_RECENT_ITEMS)
+            templates = read_template_stats(conn)
+        finally:
+            conn.rollback()
+    return {
+        'robot': robot,
+        'inventory_stats': stats,
+        'recent_items': items,
+        'template_stats': templates
+    }
+
+@api.route('/api/dashboard/snapshot', methods=['GET'])
+@response_cache.cached('robot_state', 'inventory_items', 'item_templates')
+def dashboard_snapshot():
+    sections, _ = dashboard_feed.snapshot()
+    
+    requested = request.args.get('sections')
+    if requested:
+        names = [name.strip() for name in requested.split(',') if name.strip()]
+        unknown = [name for name in names if name not in DASHBOARD_SECTIONS]
+        if unknown:
+            return jsonify({'error': f"Unknown sections: {', '.join(unknown)}", 'status': 'error'}), 400
+        sections = {name: sections[name] for name in names}
+    
+    return jsonify(sections)
+
+@api.route('/api/dashboard/stream', methods=['GET'])
+def dashboard_stream():
+    # Server-Sent Events: a full 'snapshot' first, then 'delta' events with changed sections
+    return sse_response(dashboard_feed.stream())
+
+@api.route('/api/dashboard', methods=['GET'])
 def dashboard():
-    # HTML for a simple dashboard
-    return '''
-    <!DOCTYPE html>
-    <html>
-    <head>
-        <title>Blipp Game Dashboard</title>
-        <style>
-            body { font-family: Arial, sans-serif; margin: 0; padding: 20px; background-color: #f0f0f0; }
-            .container { max-width: 1200px; margin: 0 auto; }
-            .card { background: white; border-radius: 8px; padding: 20px; margin-bottom: 20px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); }
-            h1, h2, h3 { color: #333; }
-            table { width: 100%; border-collapse: collapse; }
-            th, td { text-align: left; padding: 8px; border-bottom: 1px solid #ddd; }
-            th { background-color: #f2f2f2; }
-            .chart { height: 200px; margin-top: 20px; }
-            .stat-box { display: inline-block; width: 120px; text-align: center; background: #007bff; color: white; padding: 15px; margin: 10px; border-radius: 5px; }
-            .stat-box h3 { margin: 0; font-size: 24px; }
-            .stat-box p { margin: 5px 0 0 0; }
-            .tabs { display: flex; margin-bottom: 20px; }
-            .tab { padding: 10px 20px; cursor: pointer; background: #ddd; margin-right: 5px; border-radius: 5px 5px 0 0; }
-            .tab.active { background: #007bff; color: white; }
-            .tab-content { display: none; }
-            .tab-content.active { display: block; }
-            .category-filter { margin-bottom: 15px; }
-            .category-filter select { padding: 8px; margin-right: 10px; }
-            .category-filter button { padding: 8px 15px; background: #007bff; color: white; border: none; border-radius: 4px; cursor: pointer; }
-            .item-card { display: inline-block; width: 220px; margin: 10px; padding: 15px; background: white; border-radius: 8px; box-shadow: 0 2px 4px rgba(0,0,0,0.1); vertical-align: top; }
-            .item-card h3 { margin-top: 0; font-size: 16px; }
-            .item-card p { margin: 5px 0; font-size: 14px; }
-            .item-card .rarity { display: inline-block; padding: 3px 8px; border-radius: 3px; font-size: 12px; margin-top: 5px; }
-            .rarity-Common { background: #aaa; color: white; }
-            .rarity-Uncommon { background: #2ecc71; color: white; }
-            .rarity-Rare { background: #3498db; color: white; }
-            .rarity-Epic { background: #9b59b6; color: white; }
-            .rarity-Legendary { background: #f39c12; color: white; }
-            .rarity-Mythic { background: #e74c3c; color: white; }
-            .rarity-Unique { background: #1abc9c; color: white; }
-            .pagination { margin-top: 20px; text-align: center; }
-            .pagination button { padding: 5px 10px; margin: 0 5px; cursor: pointer; }
-        </style>
-    </head>
-    <body>
-        <div class="container">
-            <h1>Blipp Game Dashboard</h1>
-            
-            <div class="tabs">
-                <div class="tab active" data-tab="game-data">Game Data</div>
-                <div class="tab" data-tab="item-templates">Item Templates</div>
-                <div class="tab" data-tab="item-categories">Item Categories</div>
-            </div>
-            
-            <div id="game-data" class="tab-content active">
-                <div class="card">
-                    <h2>Robot Status</h2>
-                    <div id="robot-status">Loading...</div>
-                </div>
-                
-                <div class="card">
-                    <h2>Inventory Statistics</h2>
-                    <div id="inventory-stats">
-                        <div id="stat-boxes"></div>
-                        <div class="chart" id="type-chart"></div>
-                        <div class="chart" id="prefix-chart"></div>
-                    </div>
-                </div>
-                
-                <div class="card">
-                    <h2>Recent Items</h2>
-                    <table id="items-table">
-                        <thead>
-                            <tr>
-                                <th>ID</th>
-                                <th>Name</th>
-                                <th>Type</th>
-                                <th>Prefix</th>
-                                <th>Rarity</th>
-                                <th>Category</th>
-                                <th>Timestamp</th>
-                            </tr>
-                        </thead>
-                        <tbody>
-                            <tr><td colspan="7">Loading...</td></tr>
-                        </tbody>
-                    </table>
-                </div>
-            </div>
-            
-            <div id="item-templates" class="tab-content">
-                <div class="card">
-                    <h2>Item Templates</h2>
-                    <div class="category-filter">
-                        <select id="template-category">
-                            <option value="">All Categories</option>
-                            <option value="sci-fi">Sci-Fi</option>
-                            <option value="fantasy">Fantasy</option>
-                            <option value="mechanical">Mechanical</option>
-                            <option value="scientific">Scientific</option>
-                            <option value="ancient">Ancient</option>
-                            <option value="futuristic">Futuristic</option>
-                            <option value="magical">Magical</option>
-                            <option value="technological">Technological</option>
-                            <option value="alien">Alien</option>
-                            <option value="mystical">Mystical</option>
-                        </select>
-                        <select id="template-rarity">
-                            <option value="">All Rarities</option>
-                            <option value="Common">Common</option>
-                            <option value="Uncommon">Uncommon</option>
-                            <option value="Rare">Rare</option>
-                            <option value="Epic">Epic</option>
-                            <option value="Legendary">Legendary</option>
-                            <option value="Mythic">Mythic</option>
-                            <option value="Unique">Unique</option>
-                        </select>
-                        <button id="filter-templates">Filter</button>
-                    </div>
-                    <div id="templates-container">Loading templates...</div>
-                    <div class="pagination">
-                        <button id="load-more-templates">Load More</button>
-                    </div>
-                </div>
-            </div>
-            
-            <div id="item-categories" class="tab-content">
-                <div class="card">
-                    <h2>Item Categories</h2>
-                    <div id="categories-stats">Loading category statistics...</div>
-                    
-                    <h3>Category Breakdown</h3>
-                    <div id="category-breakdown"></div>
-                    
-                    <h3>Rarity Distribution</h3>
-                    <div id="rarity-breakdown"></div>
-                </div>
-            </div>
-        </div>
-        
-        <script>
-            // Tab functionality
-            document.querySelectorAll('.tab').forEach(tab => {
-                tab.addEventListener('click', () => {
-                    // Remove active class from all tabs and content
-                    document.querySelectorAll('.tab').forEach(t => t.classList.remove('active'));
-                    document.querySelectorAll('.tab-content').forEach(c => c.classList.remove('active'));
-                    
-                    // Add active class to clicked tab and corresponding content
-                    tab.classList.add('active');
-                    document.getElementById(tab.dataset.tab).classList.add('active');
-                });
-            });
-            
-            // Game data tab functions
-            function updateRobotStatus() {
-                fetch('/api/robot/state')
-                    .then(response => response.json())
-                    .then(data => {
-                        const statusDiv = document.getElementById('robot-status');
-                        if (data.status === 'not_found') {
-                            statusDiv.innerHTML = '<p>No robot data recorded yet</p>';
-                        } else {
-                            statusDiv.innerHTML = `
-                                <p><strong>Position:</strong> X: ${data.x.toFixed(2)}, Y: ${data.y.toFixed(2)}</p>
-                                <p><strong>Direction:</strong> ${data.direction > 0 ? 'Right' : 'Left'}</p>
-                                <p><strong>Status:</strong> 
-                                    ${data.is_digging ? 'Digging' : ''} 
-                                    ${data.is_jumping ? 'Jumping' : ''}
-                                    ${!data.is_digging && !data.is_jumping ? 'Idle' : ''}
-                                </p>
-                                <p><strong>Last Updated:</strong> ${data.timestamp}</p>
-                            `;
-                        }
-                    })
-                    .catch(error => console.error('Error fetching robot state:', error));
-            }
-            
-            function updateInventoryStats() {
-                fetch('/api/inventory/stats')
-                    .then(response => response.json())
-                    .then(data => {
-                        // Update stat boxes
-                        const statBoxesDiv = document.getElementById('stat-boxes');
-                        statBoxesDiv.innerHTML = `
-                            <div class="stat-box">
-                                <h3>${data.total}</h3>
-                                <p>Total Items</p>
-                            </div>
-                            <div class="stat-box">
-                                <h3>${Object.keys(data.by_type).length}</h3>
-                                <p>Item Types</p>
-                            </div>
-                            <div class="stat-box">
-                                <h3>${Object.keys(data.by_prefix).length}</h3>
-                                <p>Prefixes</p>
-                            </div>
-                        `;
-                    })
-                    .catch(error => console.error('Error fetching inventory stats:', error));
-            }
-            
-            function updateItemsTable() {
-                fetch('/api/inventory/items')
-                    .then(response => response.json())
-                    .then(items => {
-                        const tableBody = document.querySelector('#items-table tbody');
-                        if (items.length === 0) {
-                            tableBody.innerHTML = '<tr><td colspan="7">No items collected yet</td></tr>';
-                        } else {
-                            tableBody.innerHTML = items.slice(0, 10).map(item => `
-                                <tr>
-                                    <td>${item.id}</td>
-                                    <td>${item.name}</td>
-                                    <td>${item.type}</td>
-                                    <td>${item.prefix}</td>
-                                    <td>${item.rarity || 'Common'}</td>
-                                    <td>${item.category || 'unknown'}</td>
-                                    <td>${item.timestamp}</td>
-                                </tr>
-                            `).join('');
-                        }
-                    })
-                    .catch(error => console.error('Error fetching items:', error));
-            }
-            
-            // Item templates tab functions
-            let templateOffset = 0;
-            const templateLimit = 20;
-            
-            function loadItemTemplates(offset = 0, append = false) {
-                const category = document.getElementById('template-category').value;
-                const rarity = document.getElementById('template-rarity').value;
-                
-                let url = `/api/item-templates?limit=${templateLimit}`;
-                if (category) url += `&category=${category}`;
-                if (rarity) url += `&rarity=${rarity}`;
-                
-                fetch(url)
-                    .then(response => response.json())
-                    .then(templates => {
-                        const container = document.getElementById('templates-container');
-                        
-                        if (templates.length === 0) {
-                            container.innerHTML = '<p>No item templates found.</p>';
-                            return;
-                        }
-                        
-                        const templatesHtml = templates.map(template => `
-                            <div class="item-card">
-                                <h3>${template.name}</h3>
-                                <p><strong>Type:</strong> ${template.type}</p>
-                                <p><strong>Category:</strong> ${template.category}</p>
-                                <p>${template.description}</p>
-                                <span class="rarity rarity-${template.rarity}">${template.rarity}</span>
-                            </div>
-                        `).join('');
-                        
-                        if (append) {
-                            container.innerHTML += templatesHtml;
-                        } else {
-                            container.innerHTML = templatesHtml;
-                        }
-                        
-                        // Update offset for pagination
-                        templateOffset = offset + templates.length;
-                    })
-                    .catch(error => console.error('Error fetching item templates:', error));
-            }
-            
-            // Item categories tab functions
-            function updateCategoryStats() {
-                fetch('/api/item-templates')
-                    .then(response => response.json())
-                    .then(templates => {
-                        const statsDiv = document.getElementById('categories-stats');
-                        
-                        // Count items by category and rarity
-                        const categories = {};
-                        const rarities = {};
-                        
-                        templates.forEach(template => {
-                            // Count by category
-                            if (!categories[template.category]) {
-                                categories[template.category] = 0;
-                            }
-                            categories[template.category]++;
-                            
-                            // Count by rarity
-                            if (!rarities[template.rarity]) {
-                                rarities[template.rarity] = 0;
-                            }
-                            rarities[template.rarity]++;
-                        });
-                        
-                        // Create stats summary
-                        statsDiv.innerHTML = `
-                            <p><strong>Total Templates:</strong> ${templates.length}</p>
-                            <p><strong>Total Categories:</strong> ${Object.keys(categories).length}</p>
-                            <p><strong>Total Rarities:</strong> ${Object.keys(rarities).length}</p>
-                        `;
-                        
-                        // Create category breakdown
-                        const categoryDiv = document.getElementById('category-breakdown');
-                        categoryDiv.innerHTML = Object.entries(categories)
-                            .sort((a, b) => b[1] - a[1])
-                            .map(([category, count]) => `
-                                <div class="stat-box" style="background-color: ${getCategoryColor(category)};">
-                                    <h3>${count}</h3>
-                                    <p>${category}</p>
-                                </div>
-                            `).join('');
-                        
-                        // Create rarity breakdown
-                        const rarityDiv = document.getElementById('rarity-breakdown');
-                        rarityDiv.innerHTML = Object.entries(rarities)
-                            .sort((a, b) => {
-                                const rarityOrder = {
-                                    'Common': 0,
-                                    'Uncommon': 1,
-                                    'Rare': 2,
-                                    'Epic': 3,
-                                    'Legendary': 4,
-                                    'Mythic': 5,
-                                    'Unique': 6
-                                };
-                                return rarityOrder[a[0]] - rarityOrder[b[0]];
-                            })
-                            .map(([rarity, count]) => `
-                                <div class="stat-box" style="background-color: ${getRarityColor(rarity)};">
-                                    <h3>${count}</h3>
-                                    <p>${rarity}</p>
-                                </div>
-                            `).join('');
-                    })
-                    .catch(error => console.error('Error fetching category stats:', error));
-            }
-            
-            function getCategoryColor(category) {
-                const colors = {
-                    'sci-fi': '#3498db',
-                    'fantasy': '#9b59b6',
-                    'mechanical': '#e67e22',
-                    'scientific': '#2ecc71',
-                    'ancient': '#f1c40f',
-                    'futuristic': '#1abc9c',
-                    'magical': '#e84393',
-                    'technological': '#0984e3',
-                    'alien': '#00b894',
-                    'mystical': '#6c5ce7'
-                };
-                return colors[category] || '#95a5a6';
-            }
-            
-            function getRarityColor(rarity) {
-                const colors = {
-                    'Common': '#aaa',
-                    'Uncommon': '#2ecc71',
-                    'Rare': '#3498db',
-                    'Epic': '#9b59b6',
-                    'Legendary': '#f39c12',
-                    'Mythic': '#e74c3c',
-                    'Unique': '#1abc9c'
-                };
-                return colors[rarity] || '#95a5a6';
-            }
-            
-            // Event listeners
-            document.getElementById('filter-templates').addEventListener('click', () => {
-                templateOffset = 0;
-                loadItemTemplates(0, false);
-            });
-            
-            document.getElementById('load-more-templates').addEventListener('click', () => {
-                loadItemTemplates(templateOffset, true);
-            });
-            
-            // Initial updates
-            updateRobotStatus();
-            updateInventoryStats();
-            updateItemsTable();
-            loadItemTemplates();
-            updateCategoryStats();
-            
-            // Update game data every 5 seconds
-            setInterval(() => {
-                if (document.querySelector('.tab[data-tab="game-data"]').classList.contains('active')) {
-                    updateRobotStatus();
-                    updateInventoryStats();
-                    updateItemsTable();
-                }
-            }, 5000);
-        </script>
-    </body>
-    </html>
-    '''
+    # Plain static file: conditional requests are answered with 304 by send_file
+    return current_app.send_static_file('dashboard.html')
 
 # Server status endpoint
-@app.route('/api/server/status', methods=['GET'])
+@api.route('/api/server/status', methods=['GET'])
 def server_status():
     uptime = time.time() - server_start_time
     hours, remainder = divmod(uptime, 3600)
@@ -752,7 +741,8 @@ def server_status():
         'status': 'running',
         'uptime': f"{int(hours)}h {int(minutes)}m {int(seconds)}s",
         'uptime_seconds': uptime,
-        'request_count': request_count,
+        'request_count': metrics.total_requests(),
+        'pid': os.getpid(),
         'database_path': os.path.abspath(DB_PATH),
         'database_size': os.path.getsize(DB_PATH) if os.path.exists(DB_PATH) else 0,
         'timestamp': datetime.now().isoformat()
@@ -760,37 +750,266 @@ def server_status():
     
     # Get database stats
     try:
-        conn = sqlite3.connect(DB_PATH)
-        cursor = conn.cursor()
-        
-        # Get robot state count
-        cursor.execute('SELECT COUNT(*) FROM robot_state')
-        robot_state_count = cursor.fetchone()[0]
-        
-        # Get inventory item count
-        cursor.execute('SELECT COUNT(*) FROM inventory_items')
-        inventory_item_count = cursor.fetchone()[0]
+        with db_pool.connection() as conn:
+            cursor = conn.cursor()
+            
+            # Get robot state count
+            cursor.execute('SELECT COUNT(*) FROM robot_state')
+            robot_state_count = cursor.fetchone()[0]
+            
+            # Get inventory item count from the materialized counters
+            cursor.execute("SELECT count FROM inventory_counts WHERE dimension = 'total'")
+            row = cursor.fetchone()
+            inventory_item_count = row[0] if row else 0
         
         status_data['database_stats'] = {
             'robot_state_entries': robot_state_count,
             'inventory_items': inventory_item_count
         }
-        
-        conn.close()
     except Exception as e:
         logger.error(f"Error getting database stats: {str(e)}")
         status_data['database_stats'] = {
             'error': str(e)
         }
     
+    # Connection pool hits, misses and wait time
+    status_data['connection_pool'] = db_pool.stats()
+    status_data['robot_state_buffer'] = robot_state.stats()
+    status_data['robot_trajectory'] = robot_trajectory.stats()
+    # Sessions, items and file size per shard, with totals and the session skew
+    status_data['session_shards'] = session_store.stats()
+    status_data['response_cache'] = response_cache.stats()
+    status_data['template_catalog'] = template_catalog.stats()
+    status_data['dashboard_feed'] = dashboard_feed.stats()
+    status_data['event_hub'] = event_hub.stats()
+    status_data['profiler'] = profiler.stats() if profiler else {'enabled': False}
+    status_data['sql_trace'] = sql_tracer.stats() if sql_tracer else {'enabled': False}
+    
+    # Per-route latency percentiles (seconds); full histograms are at /api/metrics
+    status_data['route_latency'] = metrics.summary()
+    
     return jsonify(status_data)
 
+# Server-Sent Events change feed; ?types=inventory_added,robot_state filters event types
+@api.route('/api/events', methods=['GET'])
+def events():
+    # EventSource sends Last-Event-ID when it reconnects; ?last_event_id= works for manual resumes
+    last_event_id = request.headers.get('Last-Event-ID') or request.args.get('last_event_id')
+    types = request.args.get('types')
+    event_types = {name.strip() for name in types.split(',') if name.strip()} if types else None
+    return sse_response(event_hub.stream(last_event_id, event_types))
+
+DEBUG_TOKEN_HEADER = 'X-Blipp-Debug-Token'
+
+def debug_authorized():
+    """True if the request carries the configured debug token"""
+    supplied = request.headers.get(DEBUG_TOKEN_HEADER)
+    return bool(DEBUG_TOKEN and supplied and hmac.compare_digest(supplied, DEBUG_TOKEN))
+
+def debug_token_error():
+    """Return a 404 response if neither a debug nor a profiling token is configured,
+    a 403 if the request carries neither, else None"""
+    if not (DEBUG_TOKEN or (profiler and profiler.token)):
+        # Captures include request paths and query strings: never served without a token
+        return jsonify({'error': 'Set BLIPP_DEBUG_TOKEN or BLIPP_PROFILE_TOKEN to read profile captures',
+                        'status': 'error'}), 404
+    if debug_authorized() or (profiler and profiler.authorized(request)):
+        return None
+    return jsonify({'error': f'Missing or wrong {DEBUG_TOKEN_HEADER} (or {PROFILE_HEADER}) header',
+                    'status': 'error'}), 403
+
+def profiler_error():
+    """Return an error response if the profile captures may not be read, else None"""
+    if profiler is None:
+        return jsonify({'error': 'Profiling is disabled (set BLIPP_PROFILE_SAMPLE or BLIPP_PROFILE_TOKEN)',
+                        'status': 'error'}), 404
+    return debug_token_error()
+
+# Recent profile captures, newest first, with their top functions (?limit=, ?top=)
+@api.route('/api/debug/profiles', methods=['GET'])
+def debug_profiles():
+    error = profiler_error()
+    if error:
+        return error
+    limit = request.args.get('limit', 20, type=int)
+    top = request.args.get('top', 10, type=int)
+    return jsonify({
+        'profiler': profiler.stats(),
+        'profiles': profiler.list(limit, top),
+        'status': 'success'
+    })
+
+# Raw pstats file of one capture, e.g. for snakeviz or python -m pstats
+@api.route('/api/debug/profiles/<capture_id>', methods=['GET'])
+def debug_profile_file(capture_id):
+    error = profiler_error()
+    if error:
+        return error
+    path = profiler.profile_path(capture_id)
+    if not path:
+        return jsonify({'error': f"Unknown profile '{capture_id}'", 'status': 'error'}), 404
+    return send_file(path, mimetype='application/octet-stream', as_attachment=True,
+                     download_name=f'{capture_id}.prof')
+
+# Top SQL statement shapes with their query plans and the routes running them,
+# plus the most recent slow statements (?limit=, ?sort=total|mean|max|calls|slow,
+# ?explain=0 skips the plans, POST ?reset=1 clears the counters)
+@api.route('/api/debug/sql', methods=['GET', 'POST'])
+def debug_sql():
+    if sql_tracer is None:
+        return jsonify({'error': 'SQL tracing is disabled (BLIPP_SQL_TRACE=0)', 'status': 'error'}), 404
+    # Statement text and parameters are never served without the debug token
+    if not DEBUG_TOKEN:
+        return jsonify({'error': 'Set BLIPP_DEBUG_TOKEN to enable this endpoint', 'status': 'error'}), 404
+    if not debug_authorized():
+        return jsonify({'error': f'Missing or wrong {DEBUG_TOKEN_HEADER} header', 'status': 'error'}), 403
+    if request.method == 'POST':
+        if request.args.get('reset') != '1':
+            return jsonify({'error': 'Nothing to do (POST ?reset=1 clears the counters)', 'status': 'error'}), 400
+        sql_tracer.reset()
+        return jsonify({'status': 'success'})
+    sort = request.args.get('sort', 'total')
+    if sort not in ('total', 'mean', 'max', 'calls', 'slow'):
+        return jsonify({'error': f"Unknown sort '{sort}'", 'status': 'error'}), 400
+    limit = request.args.get('limit', 20, type=int)
+    explain = request.args.get('explain', '1') != '0'
+    return jsonify({
+        'sql_trace': sql_tracer.stats(),
+        'statements': sql_tracer.top(limit, sort, explain),
+        'slow_queries': sql_tracer.recent_slow(),
+        'status': 'success'
+    })
+
+# Health of every worker process when running under serve_prod.py
+@api.route('/api/server/workers', methods=['GET'])
+def server_workers():
+    if not RUN_DIR:
+        return jsonify({
+            'mode': 'single-process',
+            'workers': [{
+                'pid': os.getpid(),
+                'requests': metrics.total_requests(),
+                'healthy': True
+            }],
+            'status': 'success'
+        })
+    workers = read_heartbeats(RUN_DIR)
+    return jsonify({
+        'mode': 'multi-process',
+        'served_by': os.getpid(),
+        'workers': workers,
+        'healthy_workers': sum(1 for w in workers if w['healthy']),
+        'status': 'success'
+    })
+
+# Prometheus-style metrics endpoint
+@api.route('/api/metrics', methods=['GET'])
+def metrics_endpoint():
+    pool = db_pool.stats()
+    text = metrics.render_prometheus({
+        'blipp_uptime_seconds': ('gauge', 'Seconds since the server started.', round(time.time() - server_start_time, 3)),
+        'blipp_db_pool_open_connections': ('gauge', 'Open pooled SQLite connections.', pool['open_connections']),
+        'blipp_db_pool_hits_total': ('counter', 'Connection checkouts served by an idle connection.', pool['hits']),
+        'blipp_db_pool_misses_total': ('counter', 'Connection checkouts that opened a new connection.', pool['misses']),
+        'blipp_db_pool_wait_seconds_total': ('counter', 'Time spent waiting for a free connection.', pool['wait_time_seconds'])
+    })
+    return Response(text, mimetype='text/plain; version=0.0.4')
+
 # Health check endpoint for simple connectivity tests
-@app.route('/api/health', methods=['GET'])
+@api.route('/api/health', methods=['GET'])
 def health_check():
     return jsonify({'status': 'ok', 'timestamp': datetime.now().isoformat()})
 
+def create_app(config=None):
+    """Build the Flask app and the services behind its routes.
+
+    config overrides default_config() by key. The services are module-level
+    (serve_prod.py and the tools reach them as game_db.db_pool etc.), so there
+    is one app per process. The schema is checked by the first request.
+    """
+    global log_listener, request_log_sampler, server_start_time, DB_PATH, RUN_DIR, DEBUG_TOKEN, metrics, sql_tracer
+    global db_pool, inventory_sampler, template_catalog, event_hub, robot_trajectory, robot_state
+    global session_store, dashboard_feed, profiler, _schema_ready
+
+    settings = default_config()
+    settings.update(config or {})
+
+    app = Flask(__name__)
+    app.config.update(settings)
+    app.json_encoder = TimedJSONEncoder
+
+    _, log_listener = setup_logging('game_db', settings['LOG_FILE'], json_format=settings['LOG_JSON'],
+                                    max_bytes=settings['LOG_MAX_BYTES'],
+                                    backup_count=settings['LOG_BACKUP_COUNT'])
+    request_log_sampler = RequestLogSampler(settings['LOG_SAMPLE'])
+
+    # Enable CORS for all routes with more specific configuration
+    CORS(app, resources={r"/api/*": {"origins": "*", "methods": ["GET", "POST", "OPTIONS"]}})
+
+    # Track server status
+    server_start_time = time.time()
+    DB_PATH = settings['DB_PATH']
+    RUN_DIR = settings['RUN_DIR']
+    DEBUG_TOKEN = settings['DEBUG_TOKEN']
+
+    # Log the database path for troubleshooting
+    logger.info(f'Using database at: {DB_PATH}')
+
+    # Per-route counters and latency histograms, exposed at /api/metrics
+    metrics = MetricsRegistry()
+    sql_tracer = StatementTracer(DB_PATH, slow_threshold_ms=settings['SLOW_QUERY_MS'],
+                                 logger=logger.getChild('slow_sql')) if settings['SQL_TRACE'] else None
+    db_pool = ConnectionPool(DB_PATH, max_size=settings['DB_POOL_SIZE'], statement_hook=record_statement,
+                             time_rows=settings['SQL_TIME_ROWS'])
+    _schema_ready = False
+    # The cache outlives the app (the routes bind to it at import); bodies of a
+    # previous app would match the fresh stores' generations
+    response_cache.clear()
+
+    # In-memory id index for constant-time random selection
+    inventory_sampler = RandomSampler('inventory_items')
+    template_catalog = TemplateCatalog(db_pool, check_interval=settings['TEMPLATE_CHECK_INTERVAL'])
+    event_hub = EventHub(buffer_size=settings['EVENT_BUFFER_SIZE'])
+
+    # Every update is also appended to the downsampled trajectory history; robot
+    # events go out per flush so clients get the newest state without one event per frame
+    robot_trajectory = TrajectoryStore(db_pool, logger=logger)
+    robot_state = RobotStateStore(db_pool, flush_interval=settings['ROBOT_STATE_FLUSH_INTERVAL'], logger=logger,
+                                  read_through=settings['ROBOT_STATE_SHARED'], trajectory=robot_trajectory,
+                                  on_flush=lambda state: event_hub.publish('robot_state', state))
+    session_store = SessionStore(DB_PATH, shard_count=settings['SESSION_SHARDS'],
+                                 flush_interval=settings['ROBOT_STATE_FLUSH_INTERVAL'],
+                                 pool_size=settings['SESSION_SHARD_POOL_SIZE'], statement_hook=record_statement,
+                                 read_through=settings['ROBOT_STATE_SHARED'],
+                                 idle_seconds=settings['SESSION_IDLE_SECONDS'], logger=logger)
+
+    dashboard_feed = DashboardFeed(build_dashboard_snapshot, current_generation,
+                                   ('robot_state', 'inventory_items', 'item_templates'),
+                                   interval=settings['DASHBOARD_PUSH_INTERVAL'])
+
+    app.register_blueprint(api)
+
+    # Opt-in cProfile captures: BLIPP_PROFILE_SAMPLE profiles a fraction of requests,
+    # BLIPP_PROFILE_TOKEN profiles requests sending it in the X-Blipp-Profile header.
+    # With neither set no hooks are installed at all.
+    profiler = RequestProfiler.from_env(
+        os.path.join(os.path.dirname(os.path.abspath(settings['LOG_FILE'])), 'profiles'), logger=logger)
+    if profiler:
+        profiler.install(app, exclude=('/api/debug/',))
+        logger.info(f'Request profiling enabled, captures in {profiler.directory}')
+
+    # game_db.app is the app the services belong to
+    globals()['app'] = app
+    return app
+
+def __getattr__(name):
+    # game_db.app (WSGI servers pointed at game_db:app) builds the default app on first use
+    if name == 'app':
+        return create_app()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
 if __name__ == '__main__':
+    app = create_app()
     try:
         logger.info("Starting game database server on port 5000...")
         logger.info(f"Database path: {os.path.abspath(DB_PATH)}")
@@ -799,3 +1018,5 @@ if __name__ == '__main__':
         logger.critical(f"Failed to start server: {str(e)}")
         logger.critical(traceback.format_exc())
         sys.exit(1)
+    finally:
+        shutdown()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python
+# Non-blocking logging setup for the Blipp game database server
+#
+# Request threads only put records on an in-memory queue; a background
+# QueueListener writes them to the console and a size-rotated log file.
+
+import atexit
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import random
+import sys
+from datetime import datetime, timezone
+
+# Attributes every LogRecord has; anything else was passed through extra=
+_STANDARD_ATTRS = set(vars(logging.LogRecord('', 0, '', 0, '', (), None))) | {'message', 'asctime'}
+
+TEXT_FORMAT = '%(asctime)s - %(name)s - %(levelname)s - %(message)s'
+
+# The listener started by the latest setup_logging(); the exit and fork
+# hooks below are registered once and act on whichever one this is
+_current_listener = None
+_restart_after_fork = False
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line, including any fields passed through extra="""
+
+    def format(self, record):
+        entry = {
+            'time': datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        for key, value in vars(record).items():
+            if key not in _STANDARD_ATTRS and not key.startswith('_'):
+                entry[key] = value
+        if record.exc_info:
+            entry['exception'] = self.formatException(record.exc_info)
+        elif record.exc_text:
+            entry['exception'] = record.exc_text
+        return json.dumps(entry, default=str)
+
+
+class RequestLogSampler:
+    """Decides which request log lines to keep.
+
+    The spec is a comma-separated list of path=rate pairs, e.g.
+    "/api/robot/state=0.01,/api/health=0". Paths not listed are always
+    logged, and error responses (status >= 400) are never dropped.
+    """
+
+    def __init__(self, spec=''):
+        self.rates = {}
+        for part in (spec or '').split(','):
+            if '=' not in part:
+                continue
+            path, rate = part.rsplit('=', 1)
+            self.rates[path.strip()] = max(0.0, min(1.0, float(rate)))
+
+    def should_log(self, path, status_code):
+        if status_code >= 400:
+            return True
+        rate = self.rates.get(path, 1.0)
+        return rate >= 1.0 or random.random() < rate
+
+
+def setup_logging(name, log_file, json_format=False, max_bytes=10 * 1024 * 1024, backup_count=5,
+                  level=logging.INFO):
+    """Attach a QueueHandler to the named logger and start a listener thread
+    that feeds a console handler and a rotating file handler"""
+    formatter = JsonFormatter() if json_format else logging.Formatter(TEXT_FORMAT)
+
+    console_handler = logging.StreamHandler(sys.stdout)
+    console_handler.setFormatter(formatter)
+
+    file_handler = logging.handlers.RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8')
+    file_handler.setFormatter(formatter)
+
+    log_queue = queue.SimpleQueue()
+    listener = logging.handlers.QueueListener(
+        log_queue, console_handler, file_handler, respect_handler_level=True)
+
+    logger = logging.getLogger(name)
+    logger.setLevel(level)
+    logger.propagate = False
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+    logger.addHandler(_PassThroughQueueHandler(log_queue))
+
+    global _current_listener
+    if _current_listener is not None:
+        # Called again (a new app): the previous listener no longer has a queue feeding it
+        stop_listener(_current_listener)
+        for handler in _current_listener.handlers:
+            handler.close()
+    _current_listener = listener
+    listener.start()
+    return logger, listener
+
+
+def stop_listener(listener):
+    """Drain and stop the listener thread if it is running (safe to call twice)"""
+    if listener._thread is not None:
+        listener.stop()
+
+
+def _start_listener(listener):
+    if listener._thread is None:
+        listener.start()
+
+
+def _stop_current_at_exit():
+    if _current_listener is not None:
+        stop_listener(_current_listener)
+
+
+# The listener thread may hold handler or stream locks; forking while it runs
+# can leave the child deadlocked on its first log call, so drain and stop it
+# around fork() and restart it on both sides, unless it was already stopped
+def _before_fork():
+    global _restart_after_fork
+    _restart_after_fork = _current_listener is not None and _current_listener._thread is not None
+    if _restart_after_fork:
+        _current_listener.stop()
+
+
+def _after_fork():
+    if _restart_after_fork:
+        _start_listener(_current_listener)
+
+
+atexit.register(_stop_current_at_exit)
+os.register_at_fork(before=_before_fork, after_in_parent=_after_fork, after_in_child=_after_fork)
+
+
+def restart_in_worker(listener, worker_id):
+    """Point a forked worker's log files at game_db.worker<N>.log.
+
+    Each worker gets its own file so size-based rotation never races
+    between processes. Call in the child after fork.
+    """
+    stop_listener(listener)
+    for handler in listener.handlers:
+        if isinstance(handler, logging.FileHandler):
+            root, ext = os.path.splitext(handler.baseFilename)
+            if handler.stream is not None:
+                handler.stream.close()
+                handler.stream = None
+            handler.baseFilename = f'{root}.worker{worker_id}{ext}'
+    _start_listener(listener)
+
+
+class _PassThroughQueueHandler(logging.handlers.QueueHandler):
+    """QueueHandler that leaves formatting to the listener's handlers.
+
+    The stock prepare() formats the record on the calling (request) thread;
+    here only the message arguments are merged so the record stays picklable
+    and the extra= fields survive for the JSON formatter.
+    """
+
+    def prepare(self, record):
+        record.msg = record.getMessage()
+        record.args = None
+        if record.exc_info:
+            # Render the traceback now; exception objects can hold request state
+            record.exc_text = logging.Formatter().formatException(record.exc_info)
+            record.exc_info = None
+        return record
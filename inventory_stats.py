@@ -0,0 +1,123 @@
+#!/usr/bin/env python
+# Materialized inventory statistics for the Blipp game database
+#
+# The inventory_counts table is maintained by triggers (see db_migrations.py),
+# so /api/inventory/stats reads a handful of rows instead of scanning
+# inventory_items. This script recomputes the counters from scratch.
+#
+# Usage:
+#   python inventory_stats.py --verify    Compare counters with a full recount
+#   python inventory_stats.py --rebuild   Recount and replace the counters
+
+import argparse
+import sqlite3
+import sys
+
+from db_migrations import DB_PATH, migrate
+
+DIMENSIONS = ('type', 'prefix')
+
+# Items stored without a type or prefix are counted under this key: JSON
+# object keys must be strings, and jsonify sorts them
+NULL_KEY = 'unknown'
+
+
+def stats_key(value):
+    return NULL_KEY if value is None else value
+
+
+def read_stats(conn):
+    """Return the /api/inventory/stats payload from the counter table"""
+    stats = {'total': 0, 'by_type': {}, 'by_prefix': {}}
+    for dimension, key, count in conn.execute('SELECT dimension, key, count FROM inventory_counts'):
+        if dimension == 'total':
+            stats['total'] = count
+        elif dimension in DIMENSIONS:
+            counts = stats[f'by_{dimension}']
+            key = stats_key(key)
+            counts[key] = counts.get(key, 0) + count
+    return stats
+
+
+def compute_stats(conn):
+    """Recount the same payload directly from inventory_items (full scan)"""
+    stats = {'total': conn.execute('SELECT COUNT(*) FROM inventory_items').fetchone()[0]}
+    for dimension in DIMENSIONS:
+        rows = conn.execute(f'SELECT {dimension}, COUNT(*) FROM inventory_items GROUP BY {dimension}')
+        counts = stats[f'by_{dimension}'] = {}
+        for key, count in rows:
+            key = stats_key(key)
+            counts[key] = counts.get(key, 0) + count
+    return stats
+
+
+def verify(conn):
+    """Return a list of (dimension, key, stored, actual) tuples where the counters drifted"""
+    stored = read_stats(conn)
+    actual = compute_stats(conn)
+    drift = []
+    if stored['total'] != actual['total']:
+        drift.append(('total', None, stored['total'], actual['total']))
+    for dimension in DIMENSIONS:
+        stored_counts = stored[f'by_{dimension}']
+        actual_counts = actual[f'by_{dimension}']
+        for key in set(stored_counts) | set(actual_counts):
+            if stored_counts.get(key, 0) != actual_counts.get(key, 0):
+                drift.append((dimension, key, stored_counts.get(key, 0), actual_counts.get(key, 0)))
+    return drift
+
+
+def recount(conn):
+    """Replace the counters with a fresh recount inside the caller's transaction"""
+    conn.execute('DELETE FROM inventory_counts')
+    conn.execute("INSERT INTO inventory_counts (dimension, key, count) "
+                 "SELECT 'total', '', COUNT(*) FROM inventory_items")
+    for dimension in DIMENSIONS:
+        conn.execute(f"INSERT INTO inventory_counts (dimension, key, count) "
+                     f"SELECT '{dimension}', {dimension}, COUNT(*) FROM inventory_items GROUP BY {dimension}")
+
+
+def rebuild(conn):
+    """Replace the counters with a fresh recount in a single write transaction"""
+    conn.execute('BEGIN IMMEDIATE')
+    try:
+        recount(conn)
+        conn.commit()
+    except Exception:
+        conn.rollback()
+        raise
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Verify or rebuild the materialized inventory counters')
+    parser.add_argument('--db', default=DB_PATH, help='database file (default: %(default)s)')
+    group = parser.add_mutually_exclusive_group(required=True)
+    group.add_argument('--verify', action='store_true', help='report drift between counters and a full recount')
+    group.add_argument('--rebuild', action='store_true', help='recount and replace the counters')
+    args = parser.parse_args()
+
+    conn = sqlite3.connect(args.db)
+    try:
+        migrate(conn)
+        drift = verify(conn)
+        for dimension, key, stored, actual in drift:
+            label = dimension if key is None else f'{dimension}={key!r}'
+            print(f'Drift in {label}: stored {stored}, actual {actual}')
+
+        if args.verify:
+            if drift:
+                print(f'{len(drift)} counter(s) out of date; run with --rebuild to fix')
+                return 1
+            print('Inventory counters match the table')
+            return 0
+
+        rebuild(conn)
+        remaining = verify(conn)
+        print(f'Rebuilt inventory counters ({len(drift)} drifted, {len(remaining)} remaining)')
+        return 1 if remaining else 0
+    finally:
+        conn.close()
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,129 @@
+#!/usr/bin/env python
+# Constant-time random row selection for the Blipp game database server
+
+import random
+import threading
+from array import array
+
+# Marker for "no filter" in a (category, rarity) key
+ANY = object()
+# Rows per fetchmany() call when building the index
+LOAD_BATCH_SIZE = 5000
+
+
+class RandomSampler:
+    """Keeps compact arrays of row ids per (category, rarity) filter so a
+    uniformly random row can be picked without ORDER BY RANDOM()"""
+
+    def __init__(self, table, rng=None):
+        self.table = table
+        self._rng = rng or random.Random()
+        self._lock = threading.Lock()
+        self._ids = {}
+        self._max_id = 0
+        self._loaded = False
+
+    @staticmethod
+    def _keys(category, rarity):
+        # Each row is reachable from every filter combination that matches it
+        return ((ANY, ANY), (category, ANY), (ANY, rarity), (category, rarity))
+
+    def _append(self, row_id, category, rarity):
+        for key in self._keys(category, rarity):
+            ids = self._ids.get(key)
+            if ids is None:
+                ids = self._ids[key] = array('q')
+            ids.append(row_id)
+
+    def _load(self, cursor, after_id=0):
+        cursor.execute(f'SELECT id, category, rarity FROM {self.table} WHERE id > ? ORDER BY id', (after_id,))
+        # fetchmany batches keep the fetch timed once per batch rather than per row
+        while True:
+            rows = cursor.fetchmany(LOAD_BATCH_SIZE)
+            if not rows:
+                return
+            for row_id, category, rarity in rows:
+                self._append(row_id, category, rarity)
+            self._max_id = rows[-1][0]
+
+    def invalidate(self):
+        """Drop the in-memory index; it is rebuilt on the next pick"""
+        with self._lock:
+            self._ids = {}
+            self._max_id = 0
+            self._loaded = False
+
+    def add(self, row_id, category, rarity):
+        """Record a freshly inserted row without going back to the database"""
+        with self._lock:
+            if not self._loaded or row_id <= self._max_id:
+                return
+            if row_id == self._max_id + 1:
+                self._append(row_id, category, rarity)
+                self._max_id = row_id
+            # A gap means another writer got in first; refresh() picks both up
+
+    def refresh(self, conn):
+        """Catch up with rows written by other connections or processes"""
+        cursor = conn.cursor()
+        cursor.execute(f'SELECT MAX(id) FROM {self.table}')
+        max_id = cursor.fetchone()[0] or 0
+        with self._lock:
+            if not self._loaded or max_id < self._max_id:
+                # First use, or rows were deleted underneath us: rebuild
+                self._ids = {}
+                self._max_id = 0
+                self._load(cursor)
+                self._loaded = True
+            elif max_id > self._max_id:
+                self._load(cursor, self._max_id)
+
+    def sample_ids(self, category=None, rarity=None, k=1):
+        """Pick up to k distinct ids matching the filters, in random order"""
+        key = (category or ANY, rarity or ANY)
+        with self._lock:
+            ids = self._ids.get(key)
+            if not ids or k == 0:
+                return []
+            if k < 0:
+                # Mirrors LIMIT -1: every matching row, shuffled
+                k = len(ids)
+            if k == 1:
+                return [ids[self._rng.randrange(len(ids))]]
+            positions = self._rng.sample(range(len(ids)), min(k, len(ids)))
+            return [ids[pos] for pos in positions]
+
+    def iter_rows(self, conn, category=None, rarity=None, k=1, batch_size=500):
+        """Yield batches of up to k random rows for streaming; rows deleted since
+        the index was built are skipped rather than retried"""
+        self.refresh(conn)
+        ids = self.sample_ids(category, rarity, k)
+        cursor = conn.cursor()
+        for start in range(0, len(ids), batch_size):
+            chunk = ids[start:start + batch_size]
+            placeholders = ','.join('?' * len(chunk))
+            cursor.execute(f'SELECT * FROM {self.table} WHERE id IN ({placeholders})', chunk)
+            by_id = {row['id']: row for row in cursor.fetchall()}
+            yield [by_id[row_id] for row_id in chunk if row_id in by_id]
+
+    def sample_rows(self, conn, category=None, rarity=None, k=1):
+        """Return up to k random rows (sqlite3.Row) matching the filters"""
+        self.refresh(conn)
+        for _ in range(2):
+            ids = self.sample_ids(category, rarity, k)
+            if not ids:
+                return []
+            cursor = conn.cursor()
+            by_id = {}
+            # Fetch in chunks to stay under SQLite's bound-parameter limit
+            for start in range(0, len(ids), 500):
+                chunk = ids[start:start + 500]
+                placeholders = ','.join('?' * len(chunk))
+                cursor.execute(f'SELECT * FROM {self.table} WHERE id IN ({placeholders})', chunk)
+                by_id.update((row['id'], row) for row in cursor.fetchall())
+            if len(by_id) == len(ids):
+                return [by_id[row_id] for row_id in ids]
+            # Some sampled rows no longer exist: rebuild the index and retry
+            self.invalidate()
+            self.refresh(conn)
+        return [by_id[row_id] for row_id in ids if row_id in by_id]
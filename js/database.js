@@ -12,11 +12,102 @@ const Database = (() => {
     // Flag to enable/disable database logging
     let loggingEnabled = true;
     
+    // Server-Sent Events change feed (/api/events), opened on first subscribe
+    let eventSource = null;
+    const eventHandlers = {};
+    
+    // Game session / player id (?session= in the page URL or setSession()). With a
+    // session, robot state and inventory go to that session's own records
+    const pageParams = new URLSearchParams(window.location.search);
+    let sessionId = pageParams.get('session');
+    
+    // Robot state wire format: 'json' (one request per update) or 'binary'
+    // (?wire=binary or setWireFormat()): updates are packed into fixed-size
+    // frames (layout in robot_frames.py) and sent together every frameBatchMs
+    const FRAME_FORMAT_VERSION = 1;
+    const FRAME_SIZE = 20;
+    const MAX_FRAMES = 1024;
+    let wireFormat = pageParams.get('wire') === 'binary' ? 'binary' : 'json';
+    let frameBatchMs = 100;
+    let pendingFrames = [];
+    let frameTimer = null;
+    
+    // Base URL of the robot state and inventory routes for the current session
+    function dataUrl() {
+        return sessionId ? `${API_BASE_URL}/sessions/${encodeURIComponent(sessionId)}` : API_BASE_URL;
+    }
+    
+    function setSession(id) {
+        // Queued frames belong to the previous session
+        flushRobotFrames();
+        sessionId = id || null;
+        console.log(sessionId ? `Database session: ${sessionId}` : 'Database session cleared');
+    }
+    
+    // Pack robot states (oldest first) into a frames request body
+    function encodeRobotFrames(frames, sentAt) {
+        const buffer = new ArrayBuffer(1 + frames.length * FRAME_SIZE);
+        const view = new DataView(buffer);
+        view.setUint8(0, FRAME_FORMAT_VERSION);
+        frames.forEach((frame, index) => {
+            const offset = 1 + index * FRAME_SIZE;
+            view.setFloat64(offset, frame.x, true);
+            view.setFloat64(offset + 8, frame.y, true);
+            view.setInt8(offset + 16, frame.direction);
+            view.setUint8(offset + 17, (frame.isDigging ? 1 : 0) | (frame.isJumping ? 2 : 0));
+            view.setUint16(offset + 18, Math.min(Math.max(Math.round(sentAt - frame.capturedAt), 0), 65535), true);
+        });
+        return buffer;
+    }
+    
+    // Send the queued binary frames in one request
+    function flushRobotFrames() {
+        clearTimeout(frameTimer);
+        frameTimer = null;
+        if (pendingFrames.length === 0) return;
+        
+        const frames = pendingFrames;
+        pendingFrames = [];
+        fetch(`${dataUrl()}/robot/state/frames`, {
+            method: 'POST',
+            headers: {
+                'Content-Type': 'application/x-blipp-robot-frames'
+            },
+            body: encodeRobotFrames(frames, performance.now())
+        })
+        .catch(error => console.error('Error updating robot state:', error));
+    }
+    
+    // format is 'json' or 'binary'; batchMs is how long binary frames are queued (0 sends each at once)
+    function setWireFormat(format, batchMs) {
+        flushRobotFrames();
+        wireFormat = format === 'binary' ? 'binary' : 'json';
+        if (batchMs !== undefined) frameBatchMs = batchMs;
+        console.log(`Robot state wire format: ${wireFormat}`);
+    }
+    
     // Update robot state in database
     function updateRobotState(robot) {
         if (!loggingEnabled) return;
         
-        fetch(`${API_BASE_URL}/robot/state`, {
+        if (wireFormat === 'binary') {
+            pendingFrames.push({
+                x: robot.x,
+                y: robot.y,
+                direction: robot.direction,
+                isDigging: robot.isDigging,
+                isJumping: robot.isJumping,
+                capturedAt: performance.now()
+            });
+            if (pendingFrames.length >= MAX_FRAMES || frameBatchMs <= 0) {
+                flushRobotFrames();
+            } else if (!frameTimer) {
+                frameTimer = setTimeout(flushRobotFrames, frameBatchMs);
+            }
+            return;
+        }
+        
+        fetch(`${dataUrl()}/robot/state`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -36,7 +127,7 @@ const Database = (() => {
     function addInventoryItem(item) {
         if (!loggingEnabled) return;
         
-        fetch(`${API_BASE_URL}/inventory/add`, {
+        fetch(sessionId ? `${dataUrl()}/inventory` : `${API_BASE_URL}/inventory/add`, {
             method: 'POST',
             headers: {
                 'Content-Type': 'application/json'
@@ -152,12 +243,61 @@ const Database = (() => {
             } else if (connected && reconnectInterval) {
                 stopReconnecting();
             }
+            if (connected) {
+                connectEvents();
+            }
+        }
+    }
+    
+    // Subscribe to a change event type (inventory_added, inventory_batch_added, robot_state, reset)
+    function subscribe(type, handler) {
+        if (typeof handler !== 'function') return;
+        if (!eventHandlers[type]) {
+            eventHandlers[type] = [];
+            if (eventSource) {
+                eventSource.addEventListener(type, dispatchEvent);
+            }
         }
+        eventHandlers[type].push(handler);
+        connectEvents();
+    }
+    
+    function dispatchEvent(event) {
+        const data = JSON.parse(event.data);
+        (eventHandlers[event.type] || []).forEach(handler => {
+            try {
+                handler(data, event);
+            } catch (e) {
+                console.error(`Error in ${event.type} handler:`, e);
+            }
+        });
+    }
+    
+    // Open the change feed; EventSource reconnects by itself and resumes
+    // from the last event id, so no polling timer is needed while it is open
+    function connectEvents() {
+        if (eventSource || !window.EventSource || Object.keys(eventHandlers).length === 0) return;
+        
+        eventSource = new EventSource(`${API_BASE_URL}/events`);
+        Object.keys(eventHandlers).forEach(type => eventSource.addEventListener(type, dispatchEvent));
+        eventSource.onopen = () => setConnectionStatus(true);
+        eventSource.onerror = () => {
+            if (eventSource.readyState === EventSource.CLOSED) {
+                // The browser gave up; fall back to health checks until the server is back
+                eventSource = null;
+            }
+            setConnectionStatus(false, new Error('Event stream disconnected'));
+        };
+    }
+    
+    function hasEventFeed() {
+        return eventSource !== null && eventSource.readyState === EventSource.OPEN;
     }
     
     // Start reconnection attempts
     function startReconnecting() {
-        if (reconnectInterval) return;
+        // An open EventSource is already retrying on its own
+        if (reconnectInterval || eventSource) return;
         
         console.log('Starting automatic reconnection attempts...');
         reconnectInterval = setInterval(() => {
@@ -206,6 +346,12 @@ const Database = (() => {
         openDashboard,
         addStatusListener,
         removeStatusListener,
+        subscribe,
+        hasEventFeed,
+        setSession,
+        setWireFormat,
+        encodeRobotFrames,
+        getSession: () => sessionId,
         isConnected: () => isConnected,
         getConnectionError: () => connectionError,
         getApiUrl: () => API_BASE_URL
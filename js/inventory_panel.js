@@ -12,6 +12,7 @@ const InventoryPanel = (function() {
     // State
     let items = [];
     let isInitialized = false;
+    let refreshTimer = null;
     
     // Initialize the inventory panel
     function init() {
@@ -27,6 +28,13 @@ const InventoryPanel = (function() {
         // Initial inventory load
         refreshInventory();
         
+        // Refresh when the server reports new items instead of on timers
+        if (typeof Database !== 'undefined' && Database.subscribe) {
+            Database.subscribe('inventory_added', scheduleRefresh);
+            Database.subscribe('inventory_batch_added', scheduleRefresh);
+            Database.subscribe('reset', scheduleRefresh);
+        }
+        
         isInitialized = true;
         
         if (window.DebugPanel && DebugPanel.log) {
@@ -218,6 +226,19 @@ const InventoryPanel = (function() {
         }
     }
     
+    // Coalesce bursts of change events into one refresh
+    function scheduleRefresh() {
+        if (refreshTimer) return;
+        refreshTimer = setTimeout(() => {
+            refreshTimer = null;
+            refreshInventory();
+        }, 250);
+    }
+    
+    function hasEventFeed() {
+        return typeof Database !== 'undefined' && Database.hasEventFeed && Database.hasEventFeed();
+    }
+    
     // Refresh inventory from database
     function refreshInventory() {
         if (window.DebugPanel && DebugPanel.log) {
@@ -238,7 +259,7 @@ const InventoryPanel = (function() {
             });
         
         // Get inventory items
-        fetch(`${API_BASE_URL}/api/inventory/items?limit=10`, { mode: 'cors' })
+        fetch(`${API_BASE_URL}/api/inventory/items?limit=10&fields=id,name,prefix,rarity,color,symbol,description`, { mode: 'cors' })
             .then(response => response.json())
             .then(data => {
                 items = data;
@@ -299,8 +320,10 @@ const InventoryPanel = (function() {
                             // Add animation effect
                             showItemFoundAnimation(newItem);
                             
-                            // Refresh the inventory
-                            setTimeout(refreshInventory, 1500);
+                            // The inventory_added event refreshes the panel; poll only without the feed
+                            if (!hasEventFeed()) {
+                                setTimeout(refreshInventory, 1500);
+                            }
                         }
                     })
                     .catch(error => {
@@ -0,0 +1,623 @@
+#!/usr/bin/env python
+# Load-testing harness for the Blipp game database server
+#
+# Starts serve_prod.py on a free local port against a temporary database
+# seeded by data_generator.py (or targets a running server with --url),
+# drives one or more request mixes concurrently for a fixed duration and
+# reports throughput, latency percentiles and error rates per endpoint.
+# Comparing against a stored baseline turns the run into a regression check;
+# --max-error-rate fails the run outright when requests error, none complete
+# or an event stream held open by --sse-clients drops (e.g. because the
+# streams starve the server's request threads).
+#
+# A mix is given as NAME=CLIENTS[@RATE]: CLIENTS keep-alive connections
+# issue requests back to back, or RATE requests per second each. GET
+# requests revalidate with If-None-Match like a browser does, so cached
+# routes answer 304 once their ETag is known.
+#
+# Usage:
+#   python load_test.py --mix game=16 --mix dashboard=4@2 --duration 30
+#   python load_test.py --mix all=8 --output report.json --save-baseline baseline.json
+#   python load_test.py --mix game=16 --mix dashboard=4@2 --baseline baseline.json --tolerance 0.25
+#   python load_test.py --url http://localhost:5000 --mix catalog=8
+#   python load_test.py --server async --sse-clients 64 --mix game=16 --max-error-rate 0.01
+
+import argparse
+import http.client
+import json
+import math
+import multiprocessing
+import os
+import random
+import shutil
+import signal
+import socket
+import sqlite3
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from urllib.parse import urlsplit
+
+import data_generator
+import populate_database as inventory_vocab
+from db_migrations import migrate
+from robot_frames import CONTENT_TYPE as FRAMES_CONTENT_TYPE, encode_frames
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+
+# Default size of the seeded database
+SEED_ITEMS = 100000
+SEED_TEMPLATES = 500
+
+SERVER_START_TIMEOUT = 30.0
+REQUEST_TIMEOUT = 10.0
+PERCENTILES = (50, 90, 95, 99)
+# Session ids the /api/sessions/<id>/... endpoints spread over
+SESSIONS = 64
+
+
+def _robot_state(rng):
+    return {'x': rng.uniform(0, 800), 'y': rng.uniform(0, 600), 'direction': rng.choice((-1, 1)),
+            'isDigging': rng.random() < 0.2, 'isJumping': rng.random() < 0.1}
+
+
+def _inventory_item(rng):
+    item = inventory_vocab.generate_random_item(rng)
+    del item['timestamp']
+    return item
+
+
+def _robot_frames(rng):
+    """A batch of binary robot state frames, as js/database.js sends them"""
+    frames = []
+    for age_ms in range(112, -1, -16):
+        state = _robot_state(rng)
+        frames.append((state['x'], state['y'], state['direction'], state['isDigging'], state['isJumping'], age_ms))
+    return encode_frames(frames)
+
+
+def _category(rng):
+    return rng.choice(inventory_vocab.CATEGORIES)
+
+
+def _session(rng):
+    return f'/api/sessions/load-{rng.randrange(SESSIONS)}'
+
+
+# label -> (method, path(rng), body(rng) or None); bytes bodies are binary robot frames, the rest JSON
+ENDPOINTS = {
+    'POST /api/robot/state': ('POST', lambda rng: '/api/robot/state', _robot_state),
+    'GET /api/robot/state': ('GET', lambda rng: '/api/robot/state', None),
+    'POST /api/robot/state/frames': ('POST', lambda rng: '/api/robot/state/frames', _robot_frames),
+    'GET /api/robot/trajectory': ('GET', lambda rng: '/api/robot/trajectory', None),
+    'POST /api/sessions/<id>/robot/state': ('POST', lambda rng: f'{_session(rng)}/robot/state', _robot_state),
+    'GET /api/sessions/<id>/robot/state': ('GET', lambda rng: f'{_session(rng)}/robot/state', None),
+    'POST /api/sessions/<id>/robot/state/frames': ('POST', lambda rng: f'{_session(rng)}/robot/state/frames',
+                                                   _robot_frames),
+    'POST /api/sessions/<id>/inventory': ('POST', lambda rng: f'{_session(rng)}/inventory', _inventory_item),
+    'GET /api/sessions/<id>/inventory': ('GET', lambda rng: f'{_session(rng)}/inventory?limit=50', None),
+    'POST /api/inventory/add': ('POST', lambda rng: '/api/inventory/add', _inventory_item),
+    'POST /api/inventory/add-batch': ('POST', lambda rng: '/api/inventory/add-batch',
+                                      lambda rng: [_inventory_item(rng) for _ in range(50)]),
+    'GET /api/inventory/random': ('GET', lambda rng: f'/api/inventory/random?category={_category(rng)}', None),
+    'GET /api/inventory/items': ('GET', lambda rng: '/api/inventory/items?limit=50', None),
+    'GET /api/inventory/stats': ('GET', lambda rng: '/api/inventory/stats', None),
+    'GET /api/item-templates': ('GET', lambda rng: '/api/item-templates?limit=20', None),
+    'GET /api/random-item': ('GET', lambda rng: '/api/random-item', None),
+    'GET /api/dashboard': ('GET', lambda rng: '/api/dashboard', None),
+    'GET /api/dashboard/snapshot': ('GET', lambda rng: '/api/dashboard/snapshot', None),
+    'GET /api/server/status': ('GET', lambda rng: '/api/server/status', None),
+    'GET /api/server/workers': ('GET', lambda rng: '/api/server/workers', None),
+    'GET /api/metrics': ('GET', lambda rng: '/api/metrics', None),
+    'GET /api/health': ('GET', lambda rng: '/api/health', None)
+}
+
+# Mix name -> {endpoint label: weight}
+MIXES = {
+    # The game client: position updates every frame, occasional finds
+    'game': {
+        'POST /api/robot/state': 70,
+        'GET /api/robot/state': 20,
+        'GET /api/random-item': 5,
+        'POST /api/inventory/add': 3,
+        'GET /api/inventory/random': 2
+    },
+    # An open dashboard polling its panels
+    'dashboard': {
+        'GET /api/dashboard/snapshot': 40,
+        'GET /api/inventory/stats': 20,
+        'GET /api/inventory/items': 20,
+        'GET /api/server/status': 10,
+        'GET /api/robot/trajectory': 10
+    },
+    'catalog': {
+        'GET /api/random-item': 50,
+        'GET /api/item-templates': 50
+    },
+    'writes': {
+        'POST /api/inventory/add': 80,
+        'POST /api/inventory/add-batch': 20
+    },
+    # Many players at once, each with their own session
+    'sessions': {
+        'POST /api/sessions/<id>/robot/state': 45,
+        'POST /api/sessions/<id>/robot/state/frames': 25,
+        'GET /api/sessions/<id>/robot/state': 20,
+        'POST /api/sessions/<id>/inventory': 5,
+        'GET /api/sessions/<id>/inventory': 5
+    },
+    'all': {label: 1 for label in ENDPOINTS}
+}
+
+# Long-lived Server-Sent Events streams held open by --sse-clients. They are
+# not in ENDPOINTS (or the all mix) because a stream never completes as a
+# request; the report counts streams held open and messages received instead.
+SSE_PATHS = ('/api/events', '/api/dashboard/stream')
+
+
+def parse_mix(value):
+    """Parse NAME=CLIENTS[@RATE] into (name, clients, rate or None)"""
+    name, _, rest = value.partition('=')
+    if name not in MIXES:
+        raise ValueError(f"Unknown mix '{name}' (expected one of {', '.join(MIXES)})")
+    clients, _, rate = rest.partition('@')
+    try:
+        clients = int(clients or 1)
+        rate = float(rate) if rate else None
+    except ValueError:
+        raise ValueError(f"Invalid mix '{value}': expected NAME=CLIENTS[@RATE]")
+    if clients <= 0 or (rate is not None and rate <= 0):
+        raise ValueError(f"Invalid mix '{value}': clients and rate must be positive")
+    return name, clients, rate
+
+
+class Results:
+    """Latencies and error counts per endpoint label, mergeable across processes"""
+
+    def __init__(self):
+        self.latencies = {}
+        self.errors = {}
+        self.not_modified = {}
+        self.error_samples = []
+
+    def record(self, label, seconds, status):
+        self.latencies.setdefault(label, []).append(seconds)
+        if status == 304:
+            self.not_modified[label] = self.not_modified.get(label, 0) + 1
+        elif status is None or status >= 400:
+            self.errors[label] = self.errors.get(label, 0) + 1
+
+    def merge(self, other):
+        for label, values in other.latencies.items():
+            self.latencies.setdefault(label, []).extend(values)
+        for mine, theirs in ((self.errors, other.errors), (self.not_modified, other.not_modified)):
+            for label, count in theirs.items():
+                mine[label] = mine.get(label, 0) + count
+        self.error_samples.extend(other.error_samples[:10 - len(self.error_samples)])
+
+
+def _client(host, port, mix, rate, start_at, warmup_until, deadline, seed, results, lock):
+    """One keep-alive connection issuing requests from mix until the deadline"""
+    rng = random.Random(seed)
+    labels = list(mix)
+    cum_weights = []
+    total = 0
+    for label in labels:
+        total += mix[label]
+        cum_weights.append(total)
+
+    local = Results()
+    etags = {}
+    conn = None
+    interval = 1.0 / rate if rate else 0.0
+    # Stagger paced clients so they do not all fire at once
+    next_at = start_at + (rng.random() * interval if rate else 0.0)
+    time.sleep(max(0.0, start_at - time.time()))
+
+    while True:
+        if rate:
+            delay = next_at - time.time()
+            if delay > 0:
+                time.sleep(delay)
+            # Measure from the intended send time so a slow server cannot hide queueing delay
+            started = next_at
+            next_at += interval
+        else:
+            started = time.time()
+        if started >= deadline:
+            break
+
+        label = rng.choices(labels, cum_weights=cum_weights)[0]
+        method, path_for, body_for = ENDPOINTS[label]
+        path = path_for(rng)
+        headers = {'Connection': 'keep-alive'}
+        body = None
+        if body_for is not None:
+            body = body_for(rng)
+            if isinstance(body, bytes):
+                headers['Content-Type'] = FRAMES_CONTENT_TYPE
+            else:
+                body = json.dumps(body).encode('utf-8')
+                headers['Content-Type'] = 'application/json'
+        elif path in etags:
+            headers['If-None-Match'] = etags[path]
+
+        status = None
+        try:
+            if conn is None:
+                conn = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+            conn.request(method, path, body=body, headers=headers)
+            response = conn.getresponse()
+            response.read()
+            status = response.status
+            etag = response.getheader('ETag')
+            if etag and method == 'GET':
+                etags[path] = etag
+            if response.will_close:
+                conn.close()
+                conn = None
+        except (OSError, http.client.HTTPException) as e:
+            if len(local.error_samples) < 10:
+                local.error_samples.append(f'{label}: {type(e).__name__}: {e}')
+            if conn is not None:
+                conn.close()
+            conn = None
+        finished = time.time()
+        if started >= warmup_until:
+            local.record(label, finished - started, status)
+
+    if conn is not None:
+        conn.close()
+    with lock:
+        results.merge(local)
+
+
+def _sse_client(host, port, path, deadline, counters, lock):
+    """Hold one event stream open until the deadline, counting messages"""
+    events = 0
+    connected = 0
+    conn = http.client.HTTPConnection(host, port, timeout=REQUEST_TIMEOUT)
+    try:
+        conn.request('GET', path, headers={'Accept': 'text/event-stream'})
+        # getresponse() detaches the socket from conn when the server will close it after the stream
+        sock = conn.sock
+        response = conn.getresponse()
+        connected = int(response.status == 200)
+        # A read timing out means the deadline passed: a timed-out socket file cannot be read again
+        sock.settimeout(max(0.1, deadline - time.time()))
+        while True:
+            line = response.fp.readline()
+            if not line or time.time() >= deadline:
+                break
+            if line.startswith(b'data:'):
+                events += 1
+    except socket.timeout:
+        pass
+    except (OSError, http.client.HTTPException):
+        connected = 0
+    finally:
+        conn.close()
+    with lock:
+        counters['connected'] += connected
+        counters['events'] += events
+
+
+def run_clients(task):
+    """Run a share of the clients in this process and return their Results"""
+    host, port, clients, sse_paths, start_at, warmup_until, deadline, seed = task
+    results = Results()
+    sse = {'connected': 0, 'events': 0}
+    lock = threading.Lock()
+    threads = []
+    for index, (mix_name, rate) in enumerate(clients):
+        threads.append(threading.Thread(
+            target=_client, daemon=True,
+            args=(host, port, MIXES[mix_name], rate, start_at, warmup_until, deadline,
+                  f'{seed}:{index}', results, lock)))
+    for path in sse_paths:
+        threads.append(threading.Thread(target=_sse_client, daemon=True,
+                                        args=(host, port, path, deadline, sse, lock)))
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join(deadline - time.time() + REQUEST_TIMEOUT + 5)
+    return results, sse
+
+
+def percentile(sorted_values, pct):
+    """Nearest-rank percentile of an ascending list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, math.ceil(pct / 100.0 * len(sorted_values)))
+    return sorted_values[rank - 1]
+
+
+def summarize(latencies, errors, not_modified, seconds):
+    values = sorted(latencies)
+    count = len(values)
+    latency = {f'p{pct}': round(percentile(values, pct) * 1000, 3) for pct in PERCENTILES}
+    latency['mean'] = round(sum(values) / count * 1000, 3) if count else 0.0
+    latency['max'] = round(values[-1] * 1000, 3) if count else 0.0
+    return {
+        'requests': count,
+        'errors': errors,
+        'not_modified': not_modified,
+        'error_rate': round(errors / count, 5) if count else 0.0,
+        'throughput_rps': round(count / seconds, 2) if seconds else 0.0,
+        'latency_ms': latency
+    }
+
+
+def build_report(results, sse, seconds, config):
+    endpoints = {
+        label: summarize(values, results.errors.get(label, 0), results.not_modified.get(label, 0), seconds)
+        for label, values in sorted(results.latencies.items())
+    }
+    every = [value for values in results.latencies.values() for value in values]
+    return {
+        'config': config,
+        'measured_seconds': round(seconds, 3),
+        'total': summarize(every, sum(results.errors.values()), sum(results.not_modified.values()), seconds),
+        'endpoints': endpoints,
+        'sse': sse,
+        'error_samples': results.error_samples
+    }
+
+
+def compare(report, baseline, tolerance, latency_floor_ms=1.0, error_rate_margin=0.01):
+    """Return a list of regression messages for report against baseline.
+
+    Throughput may drop and p99 latency may grow by tolerance (a fraction)
+    before it counts; latency changes under latency_floor_ms are noise.
+    """
+    regressions = []
+    scopes = [('total', baseline.get('total'), report['total'])]
+    for label, base in baseline.get('endpoints', {}).items():
+        scopes.append((label, base, report['endpoints'].get(label)))
+
+    for label, base, current in scopes:
+        if not base:
+            continue
+        if current is None:
+            regressions.append(f'{label}: missing from this run')
+            continue
+        if current['throughput_rps'] < base['throughput_rps'] * (1 - tolerance):
+            regressions.append(f"{label}: throughput {current['throughput_rps']} req/s, "
+                               f"baseline {base['throughput_rps']} req/s")
+        p99, base_p99 = current['latency_ms']['p99'], base['latency_ms']['p99']
+        if p99 > base_p99 * (1 + tolerance) and p99 - base_p99 > latency_floor_ms:
+            regressions.append(f'{label}: p99 {p99} ms, baseline {base_p99} ms')
+        if current['error_rate'] > base['error_rate'] + error_rate_margin:
+            regressions.append(f"{label}: error rate {current['error_rate']:.2%}, "
+                               f"baseline {base['error_rate']:.2%}")
+    return regressions
+
+
+def check_run(report, sse_clients, max_error_rate):
+    """Return a list of failure messages for a run that should not pass on its own"""
+    failures = []
+    total = report['total']
+    if not total['requests']:
+        failures.append('no request completed')
+    elif total['error_rate'] > max_error_rate:
+        failures.append(f"error rate {total['error_rate']:.2%}, allowed {max_error_rate:.2%}")
+    if report['sse']['connected'] < sse_clients:
+        failures.append(f"{report['sse']['connected']} of {sse_clients} event streams stayed open")
+    return failures
+
+
+def print_report(report):
+    header = f"{'endpoint':<44}{'reqs':>9}{'req/s':>10}{'err%':>8}{'304':>8}" + \
+             ''.join(f"{'p' + str(pct):>9}" for pct in PERCENTILES) + f"{'max':>9}"
+    print(header)
+    print('-' * len(header))
+    rows = list(report['endpoints'].items()) + [('TOTAL', report['total'])]
+    for label, stats in rows:
+        latency = stats['latency_ms']
+        print(f"{label:<44}{stats['requests']:>9}{stats['throughput_rps']:>10.1f}"
+              f"{stats['error_rate'] * 100:>8.2f}{stats['not_modified']:>8}" +
+              ''.join(f"{latency['p' + str(pct)]:>9.2f}" for pct in PERCENTILES) + f"{latency['max']:>9.2f}")
+    if report['sse']['connected']:
+        print(f"SSE streams held open: {report['sse']['connected']}, messages received: {report['sse']['events']}")
+    for sample in report['error_samples']:
+        print(f'error: {sample}')
+
+
+def seed_database(path, items, templates, seed):
+    conn = sqlite3.connect(path, isolation_level=None)
+    migrate(conn)
+    conn.execute('PRAGMA journal_mode=WAL')
+    for table, rows in (('inventory_items', items), ('item_templates', templates)):
+        if rows > 0:
+            chunks = data_generator.generate_chunks(table, rows, seed)
+            data_generator.load(conn, table, chunks, defer_triggers=True)
+    conn.close()
+
+
+def free_port():
+    with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+        sock.bind(('127.0.0.1', 0))
+        return sock.getsockname()[1]
+
+
+def wait_for_server(host, port, timeout=SERVER_START_TIMEOUT, process=None):
+    deadline = time.time() + timeout
+    while time.time() < deadline:
+        if process is not None and process.poll() is not None:
+            raise RuntimeError(f'server exited with status {process.returncode}')
+        try:
+            conn = http.client.HTTPConnection(host, port, timeout=1.0)
+            conn.request('GET', '/api/health')
+            if conn.getresponse().status == 200:
+                conn.close()
+                return
+        except (OSError, http.client.HTTPException):
+            pass
+        time.sleep(0.2)
+    raise RuntimeError(f'server did not answer /api/health within {timeout:.0f}s')
+
+
+def start_server(workdir, args):
+    """Seed a database in workdir and start serve_prod.py on it; returns (process, port)"""
+    db_path = os.path.join(workdir, 'load_test.db')
+    print(f'Seeding {db_path}: {args.items} inventory items, {args.templates} templates (seed {args.seed})')
+    seed_database(db_path, args.items, args.templates, args.seed)
+
+    port = free_port()
+    env = dict(os.environ,
+               BLIPP_DB_PATH=db_path,
+               BLIPP_LOG_FILE=os.path.join(workdir, 'game_db.log'),
+               BLIPP_RUN_DIR=os.path.join(workdir, 'run'))
+    log = open(os.path.join(workdir, 'server.out'), 'wb')
+    process = subprocess.Popen(
+        [sys.executable, os.path.join(SCRIPT_DIR, 'serve_prod.py'), '--host', '127.0.0.1', '--port', str(port),
+         '--workers', str(args.server_workers), '--server', args.server],
+        env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    try:
+        wait_for_server('127.0.0.1', port, process=process)
+    except Exception:
+        stop_server(process)
+        raise
+    print(f'Server started on port {port} ({args.server_workers} worker(s), {args.server} server)')
+    return process, port
+
+
+def stop_server(process, timeout=30.0):
+    if process.poll() is None:
+        process.send_signal(signal.SIGTERM)
+        try:
+            process.wait(timeout)
+        except subprocess.TimeoutExpired:
+            process.kill()
+            process.wait()
+
+
+def run(host, port, mixes, args):
+    """Run the mixes against host:port and return the report"""
+    clients = [(name, rate) for name, count, rate in mixes for _ in range(count)]
+    sse_paths = [SSE_PATHS[i % len(SSE_PATHS)] for i in range(args.sse_clients)]
+    processes = max(1, min(args.client_processes, len(clients)))
+
+    start_at = time.time() + 0.5 + 0.2 * processes
+    warmup_until = start_at + args.warmup
+    deadline = warmup_until + args.duration
+    tasks = [(host, port, clients[i::processes], sse_paths[i::processes], start_at, warmup_until, deadline,
+              f'{args.seed}:{i}') for i in range(processes)]
+
+    mix_text = ', '.join(f"{name}={count}{'@' + str(rate) if rate else ''}" for name, count, rate in mixes)
+    print(f'Running {mix_text} for {args.duration:g}s after {args.warmup:g}s warmup '
+          f'({processes} client process(es))')
+    results = Results()
+    sse = {'connected': 0, 'events': 0}
+    if processes == 1:
+        outcomes = [run_clients(tasks[0])]
+    else:
+        with multiprocessing.Pool(processes) as pool:
+            outcomes = pool.map(run_clients, tasks)
+    for partial, partial_sse in outcomes:
+        results.merge(partial)
+        sse['connected'] += partial_sse['connected']
+        sse['events'] += partial_sse['events']
+
+    config = {
+        'mixes': [{'name': name, 'clients': count, 'rate': rate} for name, count, rate in mixes],
+        'duration_seconds': args.duration,
+        'warmup_seconds': args.warmup,
+        'sse_clients': args.sse_clients,
+        'target': args.url or 'local',
+        'server': None if args.url else {'workers': args.server_workers, 'mode': args.server,
+                                         'items': args.items, 'templates': args.templates, 'seed': args.seed}
+    }
+    return build_report(results, sse, args.duration, config)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Load-test the Blipp game database server')
+    parser.add_argument('--mix', action='append', default=[],
+                        help=f"NAME=CLIENTS[@RATE], repeatable; mixes: {', '.join(MIXES)} (default: game=8)")
+    parser.add_argument('--duration', type=float, default=20, help='measured seconds (default: %(default)s)')
+    parser.add_argument('--warmup', type=float, default=3, help='unmeasured seconds first (default: %(default)s)')
+    parser.add_argument('--sse-clients', type=int, default=0, help='event streams to hold open during the run')
+    parser.add_argument('--client-processes', type=int, default=1,
+                        help='processes to spread the clients over (default: %(default)s)')
+    parser.add_argument('--url', help='target a running server instead of starting one, e.g. http://localhost:5000')
+    parser.add_argument('--server-workers', type=int, default=1, help='serve_prod.py workers (default: %(default)s)')
+    parser.add_argument('--server', choices=('threaded', 'async'), default='threaded',
+                        help='serve_prod.py server type (default: %(default)s)')
+    parser.add_argument('--items', type=int, default=SEED_ITEMS, help='seeded inventory items (default: %(default)s)')
+    parser.add_argument('--templates', type=int, default=SEED_TEMPLATES,
+                        help='seeded item templates (default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='seed for the database and the request streams')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database and server logs')
+    parser.add_argument('--output', help='write the JSON report here')
+    parser.add_argument('--save-baseline', help='write the JSON report here as the new baseline')
+    parser.add_argument('--baseline', help='fail if this run regressed against the given baseline report')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed throughput drop / p99 growth as a fraction (default: %(default)s)')
+    parser.add_argument('--max-error-rate', type=float,
+                        help='fail if the error rate exceeds this fraction, no request completed or an '
+                             'event stream from --sse-clients did not stay open')
+    args = parser.parse_args()
+
+    try:
+        mixes = [parse_mix(value) for value in args.mix or ['game=8']]
+    except ValueError as e:
+        parser.error(str(e))
+    if args.duration <= 0 or args.warmup < 0:
+        parser.error('--duration must be positive and --warmup not negative')
+
+    process = workdir = None
+    try:
+        if args.url:
+            target = urlsplit(args.url)
+            host, port = target.hostname, target.port or 80
+            wait_for_server(host, port, timeout=5)
+        else:
+            workdir = tempfile.mkdtemp(prefix='blipp-load-')
+            process, port = start_server(workdir, args)
+            host = '127.0.0.1'
+        report = run(host, port, mixes, args)
+    finally:
+        if process is not None:
+            stop_server(process)
+        if workdir:
+            if args.keep:
+                print(f'Kept database and logs in {workdir}')
+            else:
+                shutil.rmtree(workdir, ignore_errors=True)
+
+    print()
+    print_report(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'Wrote {path}')
+
+    if args.max_error_rate is not None:
+        failures = check_run(report, args.sse_clients, args.max_error_rate)
+        if failures:
+            print('\nRun failed:')
+            for message in failures:
+                print(f'  {message}')
+            sys.exit(1)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        if baseline.get('config', {}).get('mixes') != report['config']['mixes']:
+            print('Warning: baseline was recorded with different mixes; per-endpoint numbers may not compare')
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f'\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):')
+            for message in regressions:
+                print(f'  {message}')
+            sys.exit(1)
+        print(f'\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+
+
+if __name__ == '__main__':
+    main()
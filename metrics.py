@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+# Thread-safe request metrics for the Blipp game database server
+#
+# Per-route/per-status counters and fixed-bucket latency histograms, with
+# SQLite and JSON serialization time tracked separately, rendered in the
+# Prometheus text exposition format.
+
+import threading
+
+# Upper bounds (seconds) of the latency buckets; +Inf is implicit
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+class Histogram:
+    """Fixed-bucket histogram; callers hold the registry lock"""
+
+    def __init__(self, buckets=LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+
+    def observe(self, value):
+        # Buckets are few, so a linear scan beats bisect's call overhead
+        for index, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[index] += 1
+                break
+        else:
+            self.counts[-1] += 1
+        self.total += value
+        self.count += 1
+
+    def quantile(self, q):
+        """Estimate a quantile by linear interpolation inside its bucket"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        lower = 0.0
+        for index, bucket_count in enumerate(self.counts):
+            upper = self.buckets[index] if index < len(self.buckets) else self.buckets[-1]
+            if bucket_count and seen + bucket_count >= rank:
+                if index == len(self.buckets):
+                    return upper
+                return lower + (upper - lower) * (rank - seen) / bucket_count
+            seen += bucket_count
+            lower = upper
+        return self.buckets[-1]
+
+
+class _RequestTimers(threading.local):
+    def __init__(self):
+        self.active = False
+        self.sqlite = 0.0
+        self.serialize = 0.0
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._timers = _RequestTimers()
+        self._requests = {}       # (route, method, status) -> count
+        self._latency = {}        # (route, method) -> Histogram
+        self._sqlite = {}         # route -> Histogram
+        self._serialize = {}      # route -> Histogram
+        self._total = 0
+
+    # Per-request accumulation (one request per thread at a time)
+
+    def begin_request(self):
+        timers = self._timers
+        timers.active = True
+        timers.sqlite = 0.0
+        timers.serialize = 0.0
+
+    def add_sqlite_time(self, seconds):
+        if self._timers.active:
+            self._timers.sqlite += seconds
+
+    def add_serialize_time(self, seconds):
+        if self._timers.active:
+            self._timers.serialize += seconds
+
+    def end_request(self, route, method, status, duration):
+        timers = self._timers
+        sqlite_time, serialize_time = timers.sqlite, timers.serialize
+        timers.active = False
+
+        with self._lock:
+            self._total += 1
+            key = (route, method, status)
+            self._requests[key] = self._requests.get(key, 0) + 1
+            self._histogram(self._latency, (route, method)).observe(duration)
+            self._histogram(self._sqlite, route).observe(sqlite_time)
+            self._histogram(self._serialize, route).observe(serialize_time)
+
+    @staticmethod
+    def _histogram(table, key):
+        histogram = table.get(key)
+        if histogram is None:
+            histogram = table[key] = Histogram()
+        return histogram
+
+    # Reporting
+
+    def total_requests(self):
+        with self._lock:
+            return self._total
+
+    def summary(self):
+        """Per-route counts and latency percentiles (seconds) as plain dicts"""
+        with self._lock:
+            routes = {}
+            for (route, method), histogram in self._latency.items():
+                sqlite = self._sqlite.get(route)
+                serialize = self._serialize.get(route)
+                routes[f'{method} {route}'] = {
+                    'count': histogram.count,
+                    'mean': histogram.total / histogram.count if histogram.count else 0.0,
+                    **{f'p{int(q * 100)}': histogram.quantile(q) for q in QUANTILES},
+                    'sqlite_seconds_total': sqlite.total if sqlite else 0.0,
+                    'serialize_seconds_total': serialize.total if serialize else 0.0
+                }
+            return routes
+
+    def render_prometheus(self, extra=None):
+        """Render all metrics in the Prometheus text exposition format; extra maps
+        metric name -> (type, help, value) for process-level values"""
+        lines = []
+        with self._lock:
+            lines.append('# HELP blipp_requests_total Requests handled, by route, method and status.')
+            lines.append('# TYPE blipp_requests_total counter')
+            for (route, method, status), count in sorted(self._requests.items()):
+                lines.append(f'blipp_requests_total{_labels(route=route, method=method, status=status)} {count}')
+
+            _render_histograms(lines, 'blipp_request_duration_seconds',
+                               'Request latency in seconds.',
+                               {_labels(route=route, method=method, inner=True): h
+                                for (route, method), h in self._latency.items()})
+            _render_histograms(lines, 'blipp_sqlite_duration_seconds',
+                               'Time spent in SQLite per request in seconds.',
+                               {_labels(route=route, inner=True): h for route, h in self._sqlite.items()})
+            _render_histograms(lines, 'blipp_serialization_duration_seconds',
+                               'Time spent encoding JSON per request in seconds.',
+                               {_labels(route=route, inner=True): h for route, h in self._serialize.items()})
+
+            lines.append('# HELP blipp_request_duration_quantile_seconds Estimated request latency quantiles.')
+            lines.append('# TYPE blipp_request_duration_quantile_seconds gauge')
+            for (route, method), histogram in sorted(self._latency.items()):
+                for q in QUANTILES:
+                    labels = _labels(route=route, method=method, quantile=q)
+                    lines.append(f'blipp_request_duration_quantile_seconds{labels} {histogram.quantile(q):.6f}')
+
+        for name, (metric_type, help_text, value) in sorted((extra or {}).items()):
+            lines.append(f'# HELP {name} {help_text}')
+            lines.append(f'# TYPE {name} {metric_type}')
+            lines.append(f'{name} {value}')
+        return '\n'.join(lines) + '\n'
+
+
+def _escape(value):
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _labels(inner=False, **labels):
+    body = ','.join(f'{key}="{_escape(value)}"' for key, value in labels.items())
+    return body if inner else '{' + body + '}'
+
+
+def _render_histograms(lines, name, help_text, histograms):
+    lines.append(f'# HELP {name} {help_text}')
+    lines.append(f'# TYPE {name} histogram')
+    for labels, histogram in sorted(histograms.items()):
+        cumulative = 0
+        for bound, count in zip(histogram.buckets, histogram.counts):
+            cumulative += count
+            lines.append(f'{name}_bucket{{{labels},le="{bound}"}} {cumulative}')
+        lines.append(f'{name}_bucket{{{labels},le="+Inf"}} {histogram.count}')
+        lines.append(f'{name}_sum{{{labels}}} {histogram.total:.6f}')
+        lines.append(f'{name}_count{{{labels}}} {histogram.count}')
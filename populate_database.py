@@ -5,14 +5,12 @@ import sqlite3
 import os
 import json
 import random
-from datetime import datetime
+from datetime import datetime, timezone
 
 # Use the same database path as the server
 SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
 DB_PATH = os.path.join(SCRIPT_DIR, 'game_data.db')
 
-print(f"Using database at: {DB_PATH}")
-
 # Item categories
 CATEGORIES = [
     "mineral", "tech", "artifact", "fossil", "crystal", "tool", "gem", "relic"
@@ -107,18 +105,18 @@ ITEM_TEMPLATES = {
     ]
 }
 
-def generate_random_item():
+def generate_random_item(rng=random):
     """Generate a random item based on templates"""
     # Select category and rarity
-    category = random.choice(CATEGORIES)
-    rarity = random.choices(list(RARITIES.keys()), weights=list(RARITIES.values()))[0]
+    category = rng.choice(CATEGORIES)
+    rarity = rng.choices(list(RARITIES.keys()), weights=list(RARITIES.values()))[0]
     
     # Select a template from the category
-    template = random.choice(ITEM_TEMPLATES[category])
+    template = rng.choice(ITEM_TEMPLATES[category])
     
     # Select prefix and color based on rarity
-    prefix = random.choice(PREFIXES[rarity])
-    color = random.choice(COLORS[rarity])
+    prefix = rng.choice(PREFIXES[rarity])
+    color = rng.choice(COLORS[rarity])
     
     # Create the item
     item = {
@@ -130,7 +128,8 @@ def generate_random_item():
         "rarity": rarity,
         "description": template["description"],
         "category": category,
-        "timestamp": datetime.now().isoformat()
+        # UTC in SQLite's datetime('now') format, as the server stores items, so rows sort together
+        "timestamp": datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
     }
     
     return item
@@ -148,29 +147,32 @@ def populate_database(num_items=50):
         conn.close()
         return False
     
-    # Generate and insert items
-    items_added = 0
+    # Generate all items, then insert them in one executemany call
+    rows = []
     for _ in range(num_items):
         item = generate_random_item()
-        
-        try:
-            cursor.execute('''
-            INSERT INTO inventory_items (name, type, prefix, color, symbol, rarity, description, category, timestamp)
-            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
-            ''', (
-                item["name"], 
-                item["type"], 
-                item["prefix"], 
-                item["color"], 
-                item["symbol"], 
-                item["rarity"],
-                item["description"],
-                item["category"],
-                item["timestamp"]
-            ))
-            items_added += 1
-        except sqlite3.Error as e:
-            print(f"Error adding item: {e}")
+        rows.append((
+            item["name"], 
+            item["type"], 
+            item["prefix"], 
+            item["color"], 
+            item["symbol"], 
+            item["rarity"],
+            item["description"],
+            item["category"],
+            item["timestamp"]
+        ))
+    
+    items_added = 0
+    try:
+        cursor.executemany('''
+        INSERT INTO inventory_items (name, type, prefix, color, symbol, rarity, description, category, timestamp)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        ''', rows)
+        items_added = len(rows)
+    except sqlite3.Error as e:
+        print(f"Error adding items: {e}")
+        conn.rollback()
     
     # Commit and close
     conn.commit()
@@ -219,6 +221,8 @@ def check_database_contents():
 
 def main():
     print("==== Blipp Robot Game Database Population Tool ====\n")
+    print(f"Using database at: {DB_PATH}")
+    print("(For larger or reproducible data sets use data_generator.py)\n")
     
     # Check if database exists
     if not os.path.exists(DB_PATH):
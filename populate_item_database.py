@@ -28,9 +28,6 @@ def init_db():
     conn.commit()
     conn.close()
 
-# Initialize the database
-init_db()
-
 # Item categories
 CATEGORIES = [
     "sci-fi",
@@ -140,34 +137,42 @@ DESCRIPTION_TEMPLATES = [
     "This {prefix} {type} changes color depending on who is holding it."
 ]
 
+# Keywords that tie an item type to a category, checked in order
+CATEGORY_KEYWORDS = [
+    ("sci-fi", ["quantum", "plasma", "neural", "holographic", "gravity", "warp", "energy", "tachyon", "fusion"]),
+    ("fantasy", ["dragon", "phoenix", "unicorn", "elven", "dwarven", "enchanted", "fairy", "wizard", "mermaid"]),
+    ("mechanical", ["gear", "piston", "clockwork", "valve", "wheel", "spring", "bearing", "shaft", "turbine"]),
+    ("scientific", ["microscope", "chemical", "laboratory", "experimental", "research", "spectrum", "isotope", "genetic", "crystalline"]),
+    ("ancient", ["fossilized", "hieroglyphic", "prehistoric", "antediluvian", "primordial", "ancestral", "forgotten", "tribal", "stone", "antique"]),
+    ("alien", ["xenomorph", "extraterrestrial", "alien", "otherworldly", "interstellar", "cosmic", "stellar", "xenotech", "interdimensional"])
+]
+
+def category_for_type(item_type):
+    """Return the keyword category for an item type, or None if no keyword matches"""
+    lowered = item_type.lower()
+    for category, keywords in CATEGORY_KEYWORDS:
+        if any(keyword in lowered for keyword in keywords):
+            return category
+    return None
+
+# Computed once: the keyword scan depends only on the item type
+TYPE_CATEGORIES = {item_type: category_for_type(item_type) for item_type in ITEM_TYPES}
+
 # Generate a large number of unique items
-def generate_items(count=500):
+def generate_items(count=500, rng=random):
     items = []
     
     for _ in range(count):
-        item_type = random.choice(ITEM_TYPES)
-        prefix = random.choice(ITEM_PREFIXES)
+        item_type = rng.choice(ITEM_TYPES)
+        prefix = rng.choice(ITEM_PREFIXES)
         
         # Determine a suitable category based on the item type
-        if any(sci_term in item_type.lower() for sci_term in ["quantum", "plasma", "neural", "holographic", "gravity", "warp", "energy", "tachyon", "fusion"]):
-            category = "sci-fi"
-        elif any(fantasy_term in item_type.lower() for fantasy_term in ["dragon", "phoenix", "unicorn", "elven", "dwarven", "enchanted", "fairy", "wizard", "mermaid"]):
-            category = "fantasy"
-        elif any(mech_term in item_type.lower() for mech_term in ["gear", "piston", "clockwork", "valve", "wheel", "spring", "bearing", "shaft", "turbine"]):
-            category = "mechanical"
-        elif any(sci_term in item_type.lower() for sci_term in ["microscope", "chemical", "laboratory", "experimental", "research", "spectrum", "isotope", "genetic", "crystalline"]):
-            category = "scientific"
-        elif any(ancient_term in item_type.lower() for ancient_term in ["fossilized", "hieroglyphic", "prehistoric", "antediluvian", "primordial", "ancestral", "forgotten", "tribal", "stone", "antique"]):
-            category = "ancient"
-        elif any(alien_term in item_type.lower() for alien_term in ["xenomorph", "extraterrestrial", "alien", "otherworldly", "interstellar", "cosmic", "stellar", "xenotech", "interdimensional"]):
-            category = "alien"
-        else:
-            category = random.choice(CATEGORIES)
+        category = TYPE_CATEGORIES[item_type] or rng.choice(CATEGORIES)
         
-        rarity = random.choice(RARITY_LEVELS)
+        rarity = rng.choice(RARITY_LEVELS)
         
         # Generate a description
-        description = random.choice(DESCRIPTION_TEMPLATES).format(
+        description = rng.choice(DESCRIPTION_TEMPLATES).format(
             prefix=prefix.lower(),
             type=item_type.lower(),
             category=category
@@ -192,19 +197,18 @@ def populate_database(items):
     # Clear existing items if needed
     cursor.execute('DELETE FROM item_templates')
     
-    # Insert new items
-    for item in items:
-        cursor.execute('''
-        INSERT INTO item_templates (name, type, prefix, rarity, description, category)
-        VALUES (?, ?, ?, ?, ?, ?)
-        ''', (
-            item["name"],
-            item["type"],
-            item["prefix"],
-            item["rarity"],
-            item["description"],
-            item["category"]
-        ))
+    # Insert new items in one executemany call
+    cursor.executemany('''
+    INSERT INTO item_templates (name, type, prefix, rarity, description, category)
+    VALUES (?, ?, ?, ?, ?, ?)
+    ''', [(
+        item["name"],
+        item["type"],
+        item["prefix"],
+        item["rarity"],
+        item["description"],
+        item["category"]
+    ) for item in items])
     
     conn.commit()
     print(f"Successfully added {len(items)} items to the database.")
@@ -218,10 +222,18 @@ def populate_database(items):
     
     conn.close()
 
-# Generate and populate the database
-items = generate_items(500)  # Generate 500 unique items
-populate_database(items)
+def main():
+    # Initialize the database
+    init_db()
+
+    # Generate and populate the database
+    items = generate_items(500)  # Generate 500 unique items
+    populate_database(items)
+
+    print("\nDatabase population complete!")
+    print(f"The database now contains {len(items)} unique item templates.")
+    print("You can now start the game and the database server to see these items in action.")
+    print("For larger or reproducible data sets use data_generator.py.")
 
-print("\nDatabase population complete!")
-print(f"The database now contains {len(items)} unique item templates.")
-print("You can now start the game and the database server to see these items in action.")
+if __name__ == "__main__":
+    main()
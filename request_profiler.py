@@ -0,0 +1,229 @@
+#!/usr/bin/env python
+# Opt-in cProfile captures of individual requests
+#
+# A request is profiled when it carries the configured token in the
+# X-Blipp-Profile header, or when it falls in the sampled fraction. Each
+# capture is written as a .prof file (load it with pstats or snakeviz) plus
+# a JSON summary of the hottest functions, and only the newest captures are
+# kept on disk. Nothing is installed on the app unless profiling is
+# configured, so there is no per-request cost when it is off.
+#
+# Streamed responses are profiled up to the point the view returns, not
+# while the body is being generated.
+
+import cProfile
+import hmac
+import json
+import os
+import pstats
+import random
+import re
+import threading
+import time
+
+from flask import g, request
+
+PROFILE_HEADER = 'X-Blipp-Profile'
+PROFILE_ID_HEADER = 'X-Blipp-Profile-Id'
+
+KEEP = 100
+TOP_FUNCTIONS = 25
+
+_ID_PATTERN = re.compile(r'^[0-9]+-[0-9]+-[0-9]+$')
+
+
+def _function_name(key):
+    filename, line, name = key
+    if filename == '~':
+        # Built-ins such as {method 'execute' of 'sqlite3.Connection' objects}
+        return name
+    return f'{os.path.basename(filename)}:{line}({name})'
+
+
+def summarize(profile, top=TOP_FUNCTIONS):
+    """Return the top functions by own time and by cumulative time"""
+    stats = pstats.Stats(profile)
+    entries = []
+    for key, (primitive_calls, calls, own_time, cumulative_time, _) in stats.stats.items():
+        entries.append({
+            'function': _function_name(key),
+            'calls': calls,
+            'primitive_calls': primitive_calls,
+            'own_ms': round(own_time * 1000, 3),
+            'cumulative_ms': round(cumulative_time * 1000, 3)
+        })
+    return {
+        'total_calls': stats.total_calls,
+        'hot': sorted(entries, key=lambda e: e['own_ms'], reverse=True)[:top],
+        'cumulative': sorted(entries, key=lambda e: e['cumulative_ms'], reverse=True)[:top]
+    }
+
+
+class RequestProfiler:
+    def __init__(self, directory, sample_rate=0.0, token=None, keep=KEEP, top=TOP_FUNCTIONS,
+                 logger=None, rng=None):
+        self.directory = directory
+        self.sample_rate = sample_rate
+        self.token = token
+        self.keep = keep
+        self.top = top
+        self.logger = logger
+        self._rng = rng or random.Random()
+
+        # One capture at a time: concurrent requests are simply not profiled,
+        # which also caps the overhead under load
+        self._active = threading.Lock()
+        self._lock = threading.Lock()
+        self._sequence = 0
+
+        # Statistics
+        self._captured = 0
+        self._skipped_busy = 0
+
+        os.makedirs(directory, exist_ok=True)
+
+    @classmethod
+    def from_env(cls, default_directory, logger=None):
+        """Build a profiler from BLIPP_PROFILE_* variables, or return None when profiling is off"""
+        sample_rate = float(os.environ.get('BLIPP_PROFILE_SAMPLE', 0) or 0)
+        token = os.environ.get('BLIPP_PROFILE_TOKEN') or None
+        if sample_rate <= 0 and not token:
+            return None
+        return cls(os.environ.get('BLIPP_PROFILE_DIR', default_directory),
+                   sample_rate=min(sample_rate, 1.0), token=token,
+                   keep=int(os.environ.get('BLIPP_PROFILE_KEEP', KEEP)),
+                   top=int(os.environ.get('BLIPP_PROFILE_TOP', TOP_FUNCTIONS)),
+                   logger=logger)
+
+    def authorized(self, req):
+        """True if the request carries the profiling token"""
+        supplied = req.headers.get(PROFILE_HEADER)
+        return bool(self.token and supplied and hmac.compare_digest(supplied, self.token))
+
+    def install(self, app, exclude=()):
+        """Register the request hooks; exclude lists paths that are never profiled"""
+        exclude = tuple(exclude)
+
+        @app.before_request
+        def start_profile():
+            if request.path.startswith(exclude):
+                return
+            if self.authorized(request):
+                trigger = 'header'
+            elif self.sample_rate and self._rng.random() < self.sample_rate:
+                trigger = 'sample'
+            else:
+                return
+            if not self._active.acquire(blocking=False):
+                with self._lock:
+                    self._skipped_busy += 1
+                return
+            profile = cProfile.Profile()
+            g.profile = (profile, trigger, time.time(), time.perf_counter())
+            profile.enable()
+
+        @app.after_request
+        def stop_profile(response):
+            capture = g.pop('profile', None)
+            if capture is not None:
+                capture_id = self._finish(capture, response.status_code)
+                if capture_id:
+                    response.headers[PROFILE_ID_HEADER] = capture_id
+            return response
+
+        @app.teardown_request
+        def abandon_profile(exc):
+            # after_request did not run (e.g. the client went away): just release
+            capture = g.pop('profile', None)
+            if capture is not None:
+                capture[0].disable()
+                self._active.release()
+
+    def _finish(self, capture, status):
+        profile, trigger, started_at, started = capture
+        profile.disable()
+        duration = time.perf_counter() - started
+        self._active.release()
+        try:
+            return self._save(profile, trigger, started_at, duration, status)
+        except Exception as e:
+            if self.logger:
+                self.logger.error(f'Could not save request profile: {str(e)}')
+            return None
+
+    def _save(self, profile, trigger, started_at, duration, status):
+        with self._lock:
+            self._sequence += 1
+            # Sortable by time; the pid keeps workers of one launcher apart
+            capture_id = f'{int(started_at * 1000)}-{os.getpid()}-{self._sequence}'
+        rule = request.url_rule.rule if request.url_rule else 'unmatched'
+        summary = {
+            'id': capture_id,
+            'method': request.method,
+            'path': request.full_path.rstrip('?'),
+            'route': rule,
+            'status': status,
+            'trigger': trigger,
+            'pid': os.getpid(),
+            'started_at': started_at,
+            'duration_ms': round(duration * 1000, 3),
+            **summarize(profile, self.top)
+        }
+        base = os.path.join(self.directory, capture_id)
+        profile.dump_stats(base + '.prof')
+        tmp = base + '.json.tmp'
+        with open(tmp, 'w') as f:
+            json.dump(summary, f)
+        # The summary appearing last marks the capture complete
+        os.replace(tmp, base + '.json')
+        with self._lock:
+            self._captured += 1
+        self._prune()
+        return capture_id
+
+    def _capture_ids(self):
+        names = [name[:-5] for name in os.listdir(self.directory) if name.endswith('.json')]
+        return sorted((name for name in names if _ID_PATTERN.match(name)),
+                      key=lambda name: tuple(int(part) for part in name.split('-')))
+
+    def _prune(self):
+        """Drop the oldest captures beyond keep (shared by every process using the directory)"""
+        ids = self._capture_ids()
+        for capture_id in ids[:max(0, len(ids) - self.keep)]:
+            for suffix in ('.json', '.prof'):
+                try:
+                    os.remove(os.path.join(self.directory, capture_id + suffix))
+                except FileNotFoundError:
+                    pass
+
+    def list(self, limit=20, top=10):
+        """Newest captures first, each with its top-N functions"""
+        captures = []
+        for capture_id in reversed(self._capture_ids()[-limit:] if limit > 0 else []):
+            try:
+                with open(os.path.join(self.directory, capture_id + '.json')) as f:
+                    summary = json.load(f)
+            except (OSError, ValueError):
+                continue
+            summary['hot'] = summary['hot'][:top]
+            summary['cumulative'] = summary['cumulative'][:top]
+            captures.append(summary)
+        return captures
+
+    def profile_path(self, capture_id):
+        """Path of a capture's .prof file, or None for an unknown id"""
+        if not _ID_PATTERN.match(capture_id or ''):
+            return None
+        path = os.path.join(self.directory, capture_id + '.prof')
+        return path if os.path.exists(path) else None
+
+    def stats(self):
+        return {
+            'enabled': True,
+            'directory': os.path.abspath(self.directory),
+            'sample_rate': self.sample_rate,
+            'token_enabled': bool(self.token),
+            'keep': self.keep,
+            'captured': self._captured,
+            'skipped_busy': self._skipped_busy
+        }
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Generation-validated response cache with ETag / 304 support
+#
+# A cached body stays valid while the write generations of the tables it
+# was built from are unchanged. Generations come from the table_generations
+# table (bumped by triggers, so writes from any process count) or from an
+# in-memory counter. Every cached response carries a strong ETag and a
+# Last-Modified date, and If-None-Match / If-Modified-Since are answered
+# with 304; on a cache hit the view is not run at all.
+
+import functools
+import hashlib
+import threading
+from collections import OrderedDict
+from datetime import datetime, timezone
+
+from flask import Response, current_app, request
+
+from streaming import negotiate_format
+
+# Responses larger than this are served but not kept
+MAX_CACHED_BODY_BYTES = 1024 * 1024
+
+# Headers the view sets that are replayed on cache hits
+_REPLAYED_HEADERS = ('X-Next-Cursor', 'Link')
+
+
+def make_etag(body):
+    return hashlib.blake2b(body, digest_size=12).hexdigest()
+
+
+class _Entry:
+    __slots__ = ('generation', 'body', 'mimetype', 'headers', 'etag', 'last_modified')
+
+    def __init__(self, generation, body, mimetype, headers, last_modified):
+        self.generation = generation
+        self.body = body
+        self.mimetype = mimetype
+        self.headers = headers
+        self.etag = make_etag(body)
+        self.last_modified = last_modified
+
+
+class ResponseCache:
+    """LRU of GET response bodies keyed by route, query string and negotiated format.
+
+    generation_source(deps) returns (generation, last_modified) for a tuple of
+    dependency names, or (None, None) when a dependency cannot be versioned;
+    such responses still get an ETag but are rebuilt on every request.
+    """
+
+    def __init__(self, generation_source, max_entries=256):
+        self.generation_source = generation_source
+        self.max_entries = max_entries
+
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+
+        # Statistics
+        self._hits = 0
+        self._misses = 0
+        self._not_modified = 0
+        self._uncacheable = 0
+
+    def cached(self, *deps):
+        """Decorator for GET views whose output depends only on deps and the query string"""
+        def decorator(view):
+            @functools.wraps(view)
+            def wrapper(*args, **kwargs):
+                return self._serve(view, deps, args, kwargs)
+            return wrapper
+        return decorator
+
+    def _serve(self, view, deps, args, kwargs):
+        generation, last_modified = self.generation_source(deps)
+        # The same URL answers with a JSON array or a stream depending on Accept
+        key = (request.path, tuple(sorted(request.args.items(multi=True))), negotiate_format(request))
+
+        if generation is not None:
+            with self._lock:
+                entry = self._entries.get(key)
+                if entry is not None and entry.generation == generation:
+                    self._entries.move_to_end(key)
+                    self._hits += 1
+                else:
+                    entry = None
+                    self._misses += 1
+            if entry is not None:
+                return self._respond(entry)
+
+        response = current_app.make_response(view(*args, **kwargs))
+        if response.status_code != 200 or response.is_streamed:
+            response.vary.add('Accept')
+            return response
+
+        body = response.get_data()
+        headers = [(name, response.headers[name]) for name in _REPLAYED_HEADERS if name in response.headers]
+        entry = _Entry(generation, body, response.mimetype, headers, last_modified)
+        if generation is None or len(body) > MAX_CACHED_BODY_BYTES:
+            with self._lock:
+                self._uncacheable += 1
+        else:
+            with self._lock:
+                self._entries[key] = entry
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        return self._respond(entry)
+
+    def _respond(self, entry):
+        response = Response(entry.body, mimetype=entry.mimetype)
+        for name, value in entry.headers:
+            response.headers[name] = value
+        response.set_etag(entry.etag)
+        if entry.last_modified is not None:
+            response.last_modified = datetime.fromtimestamp(entry.last_modified, timezone.utc)
+        # Clients may keep the body but must revalidate it on every poll
+        response.cache_control.no_cache = True
+        response.vary.add('Accept')
+        response.make_conditional(request)
+        if response.status_code == 304:
+            with self._lock:
+                self._not_modified += 1
+        return response
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self._hits,
+                'misses': self._misses,
+                'not_modified': self._not_modified,
+                'uncacheable': self._uncacheable
+            }
@@ -0,0 +1,66 @@
+#!/usr/bin/env python
+# Binary wire format for robot state updates
+#
+# An alternative to the JSON body of POST /api/robot/state for clients that
+# send state every frame. A request body is one version byte followed by one
+# or more fixed-size frames, oldest first, all little-endian:
+#
+#   offset  size  field
+#   0       8     x          float64
+#   8       8     y          float64
+#   16      1     direction  int8
+#   17      1     flags      uint8: bit 0 is_digging, bit 1 is_jumping
+#   18      2     age_ms     uint16: how long before the request the frame
+#                            was captured (0 when sent immediately)
+#
+# Positions are float64 so a binary update stores exactly what the JSON one
+# would. js/database.js has the matching encoder.
+
+import math
+import struct
+
+FORMAT_VERSION = 1
+CONTENT_TYPE = 'application/x-blipp-robot-frames'
+
+FRAME = struct.Struct('<ddbBH')
+FRAME_SIZE = FRAME.size
+
+FLAG_DIGGING = 0x01
+FLAG_JUMPING = 0x02
+
+# Upper bound on frames accepted in one request
+MAX_FRAMES = 1024
+
+
+def decode_frames(body, max_frames=MAX_FRAMES):
+    """Return (x, y, direction, is_digging, is_jumping, age_ms) tuples from a request body;
+    raises ValueError for a malformed one"""
+    if not body:
+        raise ValueError('Empty body')
+    if body[0] != FORMAT_VERSION:
+        raise ValueError(f'Unsupported frame format version {body[0]} (expected {FORMAT_VERSION})')
+    payload = memoryview(body)[1:]
+    count, extra = divmod(len(payload), FRAME_SIZE)
+    if extra or not count:
+        raise ValueError(f'Body must be 1 + N * {FRAME_SIZE} bytes, got {len(body)}')
+    if count > max_frames:
+        raise ValueError(f'Too many frames ({count}, max {max_frames})')
+    frames = [(x, y, direction, flags & FLAG_DIGGING, (flags & FLAG_JUMPING) >> 1, age_ms)
+              for x, y, direction, flags, age_ms in FRAME.iter_unpack(payload)]
+    for index, frame in enumerate(frames):
+        # NaN and infinity would be served back as invalid JSON
+        if not (math.isfinite(frame[0]) and math.isfinite(frame[1])):
+            raise ValueError(f'Frame {index}: x and y must be finite numbers')
+    return frames
+
+
+def encode_frames(frames):
+    """Encode (x, y, direction, is_digging, is_jumping[, age_ms]) tuples; the inverse
+    of decode_frames, used by tools and the wire benchmark"""
+    parts = [bytes((FORMAT_VERSION,))]
+    for frame in frames:
+        x, y, direction, is_digging, is_jumping = frame[:5]
+        age_ms = frame[5] if len(frame) > 5 else 0
+        flags = (FLAG_DIGGING if is_digging else 0) | (FLAG_JUMPING if is_jumping else 0)
+        parts.append(FRAME.pack(x, y, direction, flags, age_ms))
+    return b''.join(parts)
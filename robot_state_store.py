@@ -0,0 +1,196 @@
+#!/usr/bin/env python
+# Write-coalescing store for high-frequency robot state updates
+#
+# The game posts its robot state every frame but only the latest row is ever
+# read back. Updates land in memory and a background thread persists the
+# newest one every flush_interval seconds (and on shutdown), so at most
+# flush_interval seconds of state can be lost if the process dies.
+
+import threading
+import time
+from datetime import datetime, timezone
+
+
+def _real(value):
+    # Mirror SQLite REAL affinity for the values the game sends
+    return float(value) if isinstance(value, (int, float)) and not isinstance(value, bool) else value
+
+
+def _integer(value):
+    # Mirror SQLite INTEGER/NUMERIC affinity (booleans are stored as 0/1)
+    if isinstance(value, bool):
+        return int(value)
+    if isinstance(value, float) and value.is_integer():
+        return int(value)
+    return value
+
+
+class RobotStateStore:
+    """Latest-value robot state cache with a periodic background flusher"""
+
+    def __init__(self, pool, flush_interval=0.5, logger=None, read_through=False, trajectory=None,
+                 on_flush=None):
+        self.pool = pool
+        self.flush_interval = flush_interval
+        self.logger = logger
+        # Optional TrajectoryStore that receives every update and is flushed
+        # (and downsampled) by the same background thread
+        self.trajectory = trajectory
+        # Called with each persisted state, i.e. at most once per flush_interval
+        self.on_flush = on_flush
+        # With several worker processes another worker may hold the newest
+        # state, so reads go to the shared database unless a local write is
+        # still pending (staleness stays bounded by flush_interval)
+        self.read_through = read_through
+
+        self._lock = threading.Lock()
+        self._state = None
+        self._loaded = False
+        self._dirty = False
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Bumped on every update; lets the response cache validate GET /api/robot/state
+        self._generation = 0
+        self._last_update = None
+
+        # Statistics
+        self._updates = 0
+        self._flushes = 0
+        self._last_flush = None
+
+    def update(self, x, y, direction, is_digging, is_jumping, ts=None):
+        """Record a new state; ts (epoch ms) dates the trajectory sample when it
+        was captured earlier than now"""
+        state = {
+            'id': 1,
+            'x': _real(x),
+            'y': _real(y),
+            'direction': _integer(direction),
+            'is_digging': _integer(is_digging),
+            'is_jumping': _integer(is_jumping),
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock:
+            self._state = state
+            self._loaded = True
+            self._dirty = True
+            self._updates += 1
+            self._generation += 1
+            self._last_update = time.time()
+        if self.trajectory is not None:
+            self.trajectory.append(state['x'], state['y'], state['direction'],
+                                   state['is_digging'], state['is_jumping'], ts)
+
+        if self.flush_interval <= 0:
+            # Write-through mode: persist every update like the original route
+            self.flush()
+            if self.trajectory is not None:
+                self.trajectory.flush()
+        else:
+            self._ensure_flusher()
+
+    def get(self):
+        """Return the latest state dict, or None if no state was ever recorded"""
+        with self._lock:
+            if self._loaded and (self._dirty or not self.read_through):
+                return dict(self._state) if self._state else None
+
+        # First read after startup: seed memory from the persisted row
+        with self.pool.connection() as conn:
+            row = conn.execute('SELECT * FROM robot_state WHERE id = 1').fetchone()
+        with self._lock:
+            if not self._loaded or (self.read_through and not self._dirty):
+                self._state = dict(row) if row else None
+                self._loaded = True
+            return dict(self._state) if self._state else None
+
+    def generation(self):
+        """Return (generation, last update time), or (None, None) in read-through
+        mode where other processes can change the state without this one knowing"""
+        if self.read_through:
+            return None, None
+        with self._lock:
+            return self._generation, self._last_update
+
+    def flush(self):
+        """Persist the newest state if it changed since the last flush"""
+        with self._lock:
+            if not self._dirty:
+                return False
+            state = self._state
+            self._dirty = False
+
+        try:
+            with self.pool.connection() as conn:
+                conn.execute('''
+                INSERT OR REPLACE INTO robot_state (id, x, y, direction, is_digging, is_jumping, timestamp)
+                VALUES (1, ?, ?, ?, ?, ?, ?)
+                ''', (state['x'], state['y'], state['direction'],
+                      state['is_digging'], state['is_jumping'], state['timestamp']))
+                conn.commit()
+        except Exception:
+            # Keep the state pending so the next flush retries it
+            with self._lock:
+                if self._state is state:
+                    self._dirty = True
+            raise
+
+        with self._lock:
+            self._flushes += 1
+            self._last_flush = time.time()
+        if self.on_flush is not None:
+            self.on_flush(dict(state))
+        return True
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='robot-state-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+                if self.trajectory is not None:
+                    self.trajectory.flush()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'Error flushing robot state: {str(e)}')
+
+    def stop(self):
+        """Stop the flusher and persist any pending state (call on shutdown)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+        if self.trajectory is not None:
+            self.trajectory.flush()
+
+    def reset_after_fork(self):
+        """Drop the parent's flusher thread and cached state in a forked child"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._state = None
+        self._loaded = False
+        self._dirty = False
+        if self.trajectory is not None:
+            self.trajectory.reset_after_fork()
+
+    def stats(self):
+        with self._lock:
+            return {
+                'flush_interval_seconds': self.flush_interval,
+                'max_loss_window_seconds': max(self.flush_interval, 0),
+                'updates_received': self._updates,
+                'flushes': self._flushes,
+                'pending': self._dirty,
+                'last_flush': datetime.fromtimestamp(self._last_flush).isoformat() if self._last_flush else None
+            }
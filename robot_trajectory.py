@@ -0,0 +1,266 @@
+#!/usr/bin/env python
+# Append-only robot trajectory store with tiered downsampling
+#
+# Every robot state update is appended as a 10-byte fixed-width sample in
+# the robot_trajectory table, keyed by (resolution, ts). Raw samples are
+# kept for a short window; older movement survives as averaged buckets of
+# one second and then one minute, each tier with its own retention.
+
+import math
+import struct
+import threading
+import time
+from datetime import datetime
+
+# x and y as float32, direction as int8, then flag bits
+SAMPLE = struct.Struct('<ffbB')
+FLAG_DIGGING = 1
+FLAG_JUMPING = 2
+
+# Largest magnitude a float32 holds; positions beyond it have no sample
+MAX_COORDINATE = 3.4028234663852886e38
+
+# Timestamps accepted by parse_time: up to the end of year 9999, either side of the epoch
+MAX_TIME_MS = 253402300800000
+
+# (name, bucket width in ms, retention in seconds); the first tier holds raw samples
+TIERS = (
+    ('raw', 0, 3600),
+    ('1s', 1000, 24 * 3600),
+    ('1m', 60000, 30 * 24 * 3600)
+)
+
+# Seconds between downsampling passes, run from the robot state flusher
+DOWNSAMPLE_INTERVAL = 10.0
+
+# Buckets are only aggregated once they are this old, so samples still
+# buffered in another worker process land before their bucket is built
+SETTLE_MS = 5000
+
+# Samples dated further back than this (binary frames carry an age of up to
+# 65535 ms) are dropped and counted: their bucket may already be aggregated.
+# The rest of SETTLE_MS covers the time they spend buffered before a flush
+MAX_SAMPLE_AGE_MS = 3000
+
+# Auto resolution picks the finest tier returning at most this many points;
+# raw samples are assumed to arrive once per frame
+MAX_POINTS = 10000
+RAW_SAMPLE_MS = 16
+
+
+def now_ms():
+    return int(time.time() * 1000)
+
+
+def encode_sample(x, y, direction, is_digging, is_jumping):
+    try:
+        direction = max(-128, min(127, int(direction or 0)))
+    except (TypeError, ValueError):
+        direction = 0
+    flags = (FLAG_DIGGING if is_digging else 0) | (FLAG_JUMPING if is_jumping else 0)
+    return SAMPLE.pack(x, y, direction, flags)
+
+
+def decode_sample(ts, blob):
+    x, y, direction, flags = SAMPLE.unpack(blob)
+    return {
+        'timestamp': ts,
+        'x': x,
+        'y': y,
+        'direction': direction,
+        'is_digging': bool(flags & FLAG_DIGGING),
+        'is_jumping': bool(flags & FLAG_JUMPING)
+    }
+
+
+def parse_time(value):
+    """Parse epoch milliseconds or an ISO-8601 timestamp into epoch milliseconds;
+    raises ValueError for anything else, including non-finite or out-of-range numbers"""
+    try:
+        number = float(value)
+    except ValueError:
+        number = None
+    if number is None:
+        ms = int(datetime.fromisoformat(value.replace('Z', '+00:00')).timestamp() * 1000)
+    elif math.isfinite(number):
+        ms = int(number)
+    else:
+        raise ValueError(f"Invalid time '{value}'")
+    if abs(ms) >= MAX_TIME_MS:
+        raise ValueError(f"Time '{value}' is out of range")
+    return ms
+
+
+class TrajectoryStore:
+    """Buffers trajectory samples in memory and writes them in batches"""
+
+    def __init__(self, pool, tiers=TIERS, downsample_interval=DOWNSAMPLE_INTERVAL, logger=None):
+        self.pool = pool
+        self.tiers = tiers
+        self.downsample_interval = downsample_interval
+        self.logger = logger
+
+        self._lock = threading.Lock()
+        self._pending = []
+        self._last_downsample = 0.0
+
+        # Statistics
+        self._appended = 0
+        self._skipped = 0
+        self._late = 0
+        self._written = 0
+        self._downsampled = 0
+        self._pruned = 0
+
+    def append(self, x, y, direction, is_digging, is_jumping, ts=None):
+        """Queue one raw sample; positions that are not numbers, or that a float32
+        cannot hold, are skipped, as are samples older than MAX_SAMPLE_AGE_MS.
+        Never raises: the state update still stands"""
+        if not all(isinstance(v, (int, float)) and not isinstance(v, bool) for v in (x, y)):
+            return False
+        now = now_ms()
+        if ts is not None and ts < now - MAX_SAMPLE_AGE_MS:
+            with self._lock:
+                self._late += 1
+            return False
+        try:
+            if not all(math.isfinite(v) and abs(v) <= MAX_COORDINATE for v in (x, y)):
+                raise ValueError('position out of float32 range')
+            row = (0, now if ts is None else int(ts), encode_sample(x, y, direction, is_digging, is_jumping))
+        except (ValueError, OverflowError, struct.error):
+            with self._lock:
+                self._skipped += 1
+            return False
+        with self._lock:
+            self._pending.append(row)
+            self._appended += 1
+        return True
+
+    def flush(self):
+        """Write buffered samples and, every downsample_interval, roll up older tiers"""
+        with self._lock:
+            rows, self._pending = self._pending, []
+
+        if rows:
+            try:
+                with self.pool.connection() as conn:
+                    # Two updates within the same millisecond keep the newest
+                    conn.executemany(
+                        'INSERT OR REPLACE INTO robot_trajectory (resolution, ts, sample) VALUES (?, ?, ?)', rows)
+                    conn.commit()
+            except Exception:
+                with self._lock:
+                    self._pending[:0] = rows
+                raise
+            with self._lock:
+                self._written += len(rows)
+
+        if time.time() - self._last_downsample >= self.downsample_interval:
+            self._last_downsample = time.time()
+            with self.pool.connection() as conn:
+                self.downsample(conn)
+        return len(rows)
+
+    def downsample(self, conn, now=None):
+        """Aggregate settled buckets of each tier from the tier below it, then
+        drop rows past their tier's retention"""
+        now = now_ms() if now is None else now
+        aggregated = pruned = 0
+        for (_, source_width, _), (_, width, _) in zip(self.tiers, self.tiers[1:]):
+            row = conn.execute('SELECT MAX(ts) FROM robot_trajectory WHERE resolution = ?', (width,)).fetchone()
+            if row[0] is not None:
+                start = row[0] + width
+            else:
+                row = conn.execute('SELECT MIN(ts) FROM robot_trajectory WHERE resolution = ?',
+                                   (source_width,)).fetchone()
+                if row[0] is None:
+                    continue
+                start = row[0] // width * width
+            end = (now - SETTLE_MS) // width * width
+            if start >= end:
+                continue
+
+            cursor = conn.execute(
+                'SELECT ts, sample FROM robot_trajectory WHERE resolution = ? AND ts >= ? AND ts < ? ORDER BY ts',
+                (source_width, start, end))
+            buckets = []
+            bucket = None
+            while True:
+                rows = cursor.fetchmany(500)
+                if not rows:
+                    break
+                for ts, blob in rows:
+                    bucket_ts = ts // width * width
+                    if bucket is None or bucket[0] != bucket_ts:
+                        bucket = [bucket_ts, 0.0, 0.0, 0, 0, 0]
+                        buckets.append(bucket)
+                    x, y, direction, flags = SAMPLE.unpack(blob)
+                    bucket[1] += x
+                    bucket[2] += y
+                    bucket[3] = direction   # direction at the end of the bucket
+                    bucket[4] |= flags      # digging/jumping at any point in the bucket
+                    bucket[5] += 1
+            conn.executemany(
+                'INSERT OR REPLACE INTO robot_trajectory (resolution, ts, sample) VALUES (?, ?, ?)',
+                [(width, b[0], SAMPLE.pack(b[1] / b[5], b[2] / b[5], b[3], b[4])) for b in buckets])
+            aggregated += len(buckets)
+
+        for _, width, retention in self.tiers:
+            cursor = conn.execute('DELETE FROM robot_trajectory WHERE resolution = ? AND ts < ?',
+                                  (width, now - retention * 1000))
+            pruned += cursor.rowcount
+        conn.commit()
+
+        with self._lock:
+            self._downsampled += aggregated
+            self._pruned += pruned
+        return aggregated, pruned
+
+    def resolve_resolution(self, name, start, end, now=None):
+        """Return the (name, width) tier to answer a range query with.
+
+        'auto' picks the finest tier that still retains data from start and
+        returns at most MAX_POINTS points; otherwise name must be a tier name
+        or its width in milliseconds.
+        """
+        if name in (None, '', 'auto'):
+            now = now_ms() if now is None else now
+            for tier_name, width, retention in self.tiers:
+                covers = start >= now - retention * 1000
+                if covers and (end - start) / (width or RAW_SAMPLE_MS) <= MAX_POINTS:
+                    return tier_name, width
+            return self.tiers[-1][0], self.tiers[-1][1]
+        for tier_name, width, _ in self.tiers:
+            if name == tier_name or name == str(width):
+                return tier_name, width
+        raise ValueError(f"Unknown resolution '{name}'")
+
+    def iter_range(self, conn, width, start, end, batch_size=500):
+        """Yield lists of decoded samples in [start, end) via the primary key"""
+        cursor = conn.execute(
+            'SELECT ts, sample FROM robot_trajectory WHERE resolution = ? AND ts >= ? AND ts < ? ORDER BY ts',
+            (width, start, end))
+        while True:
+            rows = cursor.fetchmany(batch_size)
+            if not rows:
+                return
+            yield [decode_sample(ts, blob) for ts, blob in rows]
+
+    def reset_after_fork(self):
+        self._lock = threading.Lock()
+        self._pending = []
+
+    def stats(self):
+        with self._lock:
+            return {
+                'tiers': [{'resolution': name, 'bucket_ms': width, 'retention_seconds': retention}
+                          for name, width, retention in self.tiers],
+                'samples_appended': self._appended,
+                'samples_skipped': self._skipped,
+                'samples_late': self._late,
+                'samples_written': self._written,
+                'pending': len(self._pending),
+                'buckets_downsampled': self._downsampled,
+                'rows_pruned': self._pruned,
+                'sample_bytes': SAMPLE.size
+            }
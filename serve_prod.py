@@ -0,0 +1,324 @@
+#!/usr/bin/env python
+# Multi-process production launcher for the Blipp game database server
+#
+# The master process builds the app once (running the schema migrations a
+# single time), binds the listening socket and forks N workers that all
+# accept on it. With --reuse-port each worker binds its own SO_REUSEPORT
+# socket instead and the kernel spreads connections between them. Workers
+# share the WAL database file; robot state reads go through to it so every
+# worker serves the newest flushed state.
+#
+# Signals sent to the master:
+#   SIGHUP    rolling restart: each worker is replaced, then drained
+#   SIGTERM   graceful stop: workers finish in-flight requests and flush
+#   SIGINT    same as SIGTERM
+#
+# Usage:
+#   python serve_prod.py [--host 0.0.0.0] [--port 5000] [--workers 4] [--server threaded|async]
+
+import argparse
+import asyncio
+import os
+import signal
+import socket
+import tempfile
+import threading
+import time
+
+from worker_health import HEARTBEAT_INTERVAL, heartbeat_path, read_heartbeat, remove_heartbeat, write_heartbeat
+
+GRACEFUL_TIMEOUT = 30.0
+# A worker whose heartbeat is older than this is considered hung and killed
+HEARTBEAT_TIMEOUT = HEARTBEAT_INTERVAL * 10
+
+
+def bind_socket(host, port, reuse_port=False, backlog=1024):
+    family = socket.AF_INET6 if ':' in host else socket.AF_INET
+    # IPPROTO_TCP explicitly: asyncio only enables TCP_NODELAY on accepted sockets whose proto says TCP
+    sock = socket.socket(family, socket.SOCK_STREAM, socket.IPPROTO_TCP)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(backlog)
+    sock.set_inheritable(True)
+    return sock
+
+
+class Worker:
+    """Runs inside a forked child: serves requests until SIGTERM"""
+
+    def __init__(self, worker_id, args, sock, app):
+        self.worker_id = worker_id
+        self.args = args
+        self.sock = sock
+        self.app = app
+        self.started = time.time()
+        self.stopping = threading.Event()
+
+    def run(self):
+        import game_db
+        from game_logging import restart_in_worker, stop_listener
+
+        signal.signal(signal.SIGHUP, signal.SIG_IGN)
+        signal.signal(signal.SIGINT, signal.SIG_IGN)
+        restart_in_worker(game_db.log_listener, self.worker_id)
+
+        if self.args.reuse_port:
+            self.sock = bind_socket(self.args.host, self.args.port, reuse_port=True)
+
+        threading.Thread(target=self._heartbeat, args=(game_db,), name='worker-heartbeat', daemon=True).start()
+        game_db.logger.info(f'Worker {self.worker_id} (pid {os.getpid()}) serving with the {self.args.server} server')
+        try:
+            if self.args.server == 'async':
+                self._serve_async(self.app)
+            else:
+                self._serve_threaded(self.app)
+        finally:
+            self.stopping.set()
+            game_db.shutdown()
+            remove_heartbeat(self.args.run_dir, self.worker_id, os.getpid())
+            game_db.logger.info(f'Worker {self.worker_id} (pid {os.getpid()}) stopped')
+            stop_listener(game_db.log_listener)
+
+    def _serve_threaded(self, app):
+        from werkzeug.serving import make_server
+
+        server = make_server(self.args.host, self.args.port, app, threaded=True, fd=self.sock.fileno())
+        # Join in-flight request threads on server_close() so stopping drains them
+        server.daemon_threads = False
+        server.block_on_close = True
+
+        def stop(signum, frame):
+            # shutdown() waits for serve_forever(), so it cannot run on this thread
+            threading.Thread(target=server.shutdown, daemon=True).start()
+
+        signal.signal(signal.SIGTERM, stop)
+        server.serve_forever()
+        server.server_close()
+
+    def _serve_async(self, app):
+        from async_server import AsyncWSGIServer
+
+        server = AsyncWSGIServer(app, self.args.host, self.args.port, self.args.threads,
+                                 max_event_streams=self.args.max_event_streams)
+
+        async def serve():
+            task = asyncio.ensure_future(server.serve_forever(sock=self.sock))
+            asyncio.get_running_loop().add_signal_handler(signal.SIGTERM, task.cancel)
+            try:
+                await task
+            except asyncio.CancelledError:
+                pass
+
+        try:
+            asyncio.run(serve())
+        finally:
+            server.shutdown()
+
+    def _heartbeat(self, game_db):
+        while not self.stopping.is_set():
+            try:
+                write_heartbeat(self.args.run_dir, self.worker_id, {
+                    'started': self.started,
+                    'requests': game_db.metrics.total_requests(),
+                    'connection_pool': game_db.db_pool.stats(),
+                    'robot_state_buffer': game_db.robot_state.stats()
+                })
+            except OSError as e:
+                game_db.logger.error(f'Error writing worker heartbeat: {str(e)}')
+            self.stopping.wait(HEARTBEAT_INTERVAL)
+
+
+class Master:
+    """Forks and supervises the worker processes"""
+
+    def __init__(self, args):
+        self.args = args
+        self.sock = None
+        self.slots = {}         # worker id -> pid
+        self.spawned_at = {}    # pid -> fork time
+        self.retiring = set()   # pids draining after a restart
+        self.stopping = False
+        self.reload_requested = False
+
+    def run(self):
+        # The app is built and migrated once, here in the master; workers inherit it
+        import game_db
+        self.app = game_db.create_app()
+        game_db.init_db()
+        self.logger = game_db.logger
+        # Workers must open their own SQLite connections
+        game_db.db_pool.close_all()
+
+        if not self.args.reuse_port:
+            # Bound once here and inherited by every worker
+            self.sock = bind_socket(self.args.host, self.args.port)
+        signal.signal(signal.SIGTERM, self._request_stop)
+        signal.signal(signal.SIGINT, self._request_stop)
+        signal.signal(signal.SIGHUP, self._request_reload)
+
+        self.logger.info(f'Starting {self.args.workers} workers on {self.args.host}:{self.args.port} '
+                         f'(heartbeats in {self.args.run_dir})')
+        for worker_id in range(self.args.workers):
+            self.spawn(worker_id)
+
+        try:
+            while not self.stopping:
+                if self.reload_requested:
+                    self.reload_requested = False
+                    self.rolling_restart()
+                self.reap()
+                self.check_heartbeats()
+                time.sleep(0.5)
+        finally:
+            self.stop_workers()
+            if self.sock is not None:
+                self.sock.close()
+
+    def _request_stop(self, signum, frame):
+        self.stopping = True
+
+    def _request_reload(self, signum, frame):
+        self.reload_requested = True
+
+    def spawn(self, worker_id):
+        pid = os.fork()
+        if pid == 0:
+            code = 0
+            try:
+                Worker(worker_id, self.args, self.sock, self.app).run()
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                code = 1
+            finally:
+                # Skip the master's atexit handlers; the worker already cleaned up
+                os._exit(code)
+        self.slots[worker_id] = pid
+        self.spawned_at[pid] = time.time()
+        self.logger.info(f'Spawned worker {worker_id} (pid {pid})')
+        return pid
+
+    def reap(self):
+        while True:
+            try:
+                pid, status = os.waitpid(-1, os.WNOHANG)
+            except ChildProcessError:
+                return
+            if pid == 0:
+                return
+            self.spawned_at.pop(pid, None)
+            if pid in self.retiring:
+                self.retiring.discard(pid)
+                continue
+            for worker_id, slot_pid in list(self.slots.items()):
+                if slot_pid == pid:
+                    del self.slots[worker_id]
+                    remove_heartbeat(self.args.run_dir, worker_id, pid)
+                    if not self.stopping:
+                        self.logger.warning(f'Worker {worker_id} (pid {pid}) exited with status {status}; restarting')
+                        self.spawn(worker_id)
+
+    def check_heartbeats(self):
+        now = time.time()
+        for worker_id, pid in list(self.slots.items()):
+            entry = read_heartbeat(heartbeat_path(self.args.run_dir, worker_id))
+            if entry is not None and entry.get('pid') == pid:
+                last_seen = entry['heartbeat']
+            else:
+                last_seen = self.spawned_at.get(pid, now)
+            if now - last_seen > HEARTBEAT_TIMEOUT:
+                self.logger.error(f'Worker {worker_id} (pid {pid}) missed its heartbeat; killing it')
+                self._signal(pid, signal.SIGKILL)
+
+    def rolling_restart(self):
+        """Replace workers one at a time so the socket never stops accepting"""
+        self.logger.info('Rolling restart of all workers')
+        for worker_id, old_pid in list(self.slots.items()):
+            new_pid = self.spawn(worker_id)
+            self._wait_ready(worker_id, new_pid)
+            self.retiring.add(old_pid)
+            self._signal(old_pid, signal.SIGTERM)
+            if self.stopping:
+                return
+
+    def _wait_ready(self, worker_id, pid, timeout=HEARTBEAT_TIMEOUT):
+        deadline = time.time() + timeout
+        while time.time() < deadline and not self.stopping:
+            entry = read_heartbeat(heartbeat_path(self.args.run_dir, worker_id))
+            if entry is not None and entry.get('pid') == pid:
+                return True
+            time.sleep(0.1)
+        return False
+
+    def stop_workers(self):
+        pids = set(self.slots.values()) | self.retiring
+        for pid in pids:
+            self._signal(pid, signal.SIGTERM)
+
+        deadline = time.time() + self.args.graceful_timeout
+        while pids and time.time() < deadline:
+            for pid in list(pids):
+                try:
+                    done, _ = os.waitpid(pid, os.WNOHANG)
+                except ChildProcessError:
+                    done = pid
+                if done:
+                    pids.discard(pid)
+            time.sleep(0.1)
+
+        for pid in pids:
+            self.logger.warning(f'Worker pid {pid} did not stop in time; killing it')
+            self._signal(pid, signal.SIGKILL)
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        for worker_id in list(self.slots):
+            remove_heartbeat(self.args.run_dir, worker_id)
+        self.logger.info('All workers stopped')
+
+    @staticmethod
+    def _signal(pid, signum):
+        try:
+            os.kill(pid, signum)
+        except ProcessLookupError:
+            pass
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Serve the Blipp game database API with several worker processes')
+    parser.add_argument('--host', default='0.0.0.0')
+    parser.add_argument('--port', type=int, default=5000)
+    parser.add_argument('--workers', type=int, default=int(os.environ.get('BLIPP_WORKERS', os.cpu_count() or 2)),
+                        help='worker processes (default: %(default)s)')
+    parser.add_argument('--server', choices=('threaded', 'async'), default='threaded',
+                        help='per-worker server: werkzeug threads or the asyncio front end (default: %(default)s)')
+    parser.add_argument('--threads', type=int, default=int(os.environ.get('BLIPP_ASYNC_WORKERS', 16)),
+                        help='Flask/SQLite threads per worker with --server async (default: %(default)s)')
+    parser.add_argument('--max-event-streams', type=int, default=int(os.environ.get('BLIPP_MAX_EVENT_STREAMS', 256)),
+                        help='open Server-Sent Events streams per worker with --server async, each on its own '
+                             'thread (default: %(default)s)')
+    parser.add_argument('--reuse-port', action='store_true',
+                        help='let each worker bind its own SO_REUSEPORT socket')
+    parser.add_argument('--run-dir', default=os.environ.get('BLIPP_RUN_DIR'),
+                        help='directory for worker heartbeat files (default: a per-port temp directory)')
+    parser.add_argument('--graceful-timeout', type=float, default=GRACEFUL_TIMEOUT,
+                        help='seconds workers get to drain before being killed (default: %(default)s)')
+    args = parser.parse_args()
+
+    if args.run_dir is None:
+        args.run_dir = os.path.join(tempfile.gettempdir(), f'blipp-{args.port}')
+    os.makedirs(args.run_dir, exist_ok=True)
+
+    # Read by game_db.create_app(), so set before the master builds the app
+    os.environ['BLIPP_RUN_DIR'] = args.run_dir
+    if args.workers > 1:
+        os.environ.setdefault('BLIPP_ROBOT_STATE_SHARED', '1')
+
+    Master(args).run()
+
+
+if __name__ == '__main__':
+    main()
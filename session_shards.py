@@ -0,0 +1,348 @@
+#!/usr/bin/env python
+# Per-session robot state and inventory, spread over several SQLite files
+#
+# Each game session (or player) has its own robot state and inventory. A
+# session lives in one shard file, chosen by a stable hash of its id, so
+# sessions on different shards never wait for each other's write lock.
+# Robot state updates are coalesced in memory like RobotStateStore's: a
+# background thread writes the newest state of every changed session with
+# one transaction per shard, every flush_interval seconds (and on shutdown).
+# Inventory items are written through.
+#
+# The shard count is part of the data layout: every file records its index
+# and the count it was created for, and opening it with a different count
+# fails instead of silently routing sessions to the wrong file.
+
+import os
+import re
+import threading
+import time
+import zlib
+from datetime import datetime, timezone
+from functools import partial
+
+from db_migrations import SHARD_MIGRATIONS, migrate
+from db_pool import ConnectionPool
+from robot_state_store import _integer, _real
+
+SHARDS = 4
+POOL_SIZE = 4
+# Clean sessions not updated for this long are dropped from memory
+IDLE_SECONDS = 300
+
+SESSION_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.:-]{1,64}$')
+
+UPSERT_ROBOT_STATE_SQL = '''
+    INSERT INTO session_robot_state (session_id, x, y, direction, is_digging, is_jumping, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?)
+    ON CONFLICT (session_id) DO UPDATE SET
+        x = excluded.x, y = excluded.y, direction = excluded.direction, is_digging = excluded.is_digging,
+        is_jumping = excluded.is_jumping, timestamp = excluded.timestamp
+'''
+
+INSERT_ITEM_SQL = '''
+    INSERT INTO session_inventory_items
+        (session_id, name, type, prefix, color, symbol, rarity, description, category, timestamp)
+    VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, datetime('now'))
+'''
+
+ITEM_COLUMNS = ('id', 'name', 'type', 'prefix', 'color', 'symbol', 'rarity', 'description', 'category',
+                'timestamp')
+
+_STATE_FIELDS = ('x', 'y', 'direction', 'is_digging', 'is_jumping', 'timestamp')
+
+
+def valid_session_id(session_id):
+    return bool(session_id and SESSION_ID_PATTERN.match(session_id))
+
+
+def shard_index(session_id, count):
+    """Shard of a session: CRC-32 of the id, stable across processes and restarts"""
+    return zlib.crc32(session_id.encode('utf-8')) % count
+
+
+def shard_paths(db_path, count):
+    """Shard files next to the main database: game_data.shard0.db, game_data.shard1.db, ..."""
+    base, ext = os.path.splitext(db_path)
+    return [f'{base}.shard{index}{ext or ".db"}' for index in range(count)]
+
+
+class Shard:
+    """One shard file: its connection pool and a lazily applied schema"""
+
+    def __init__(self, index, count, path, pool_size=POOL_SIZE, statement_hook=None):
+        self.index = index
+        self.count = count
+        self.path = path
+        self.pool = ConnectionPool(path, max_size=pool_size, statement_hook=statement_hook)
+        self._ready = False
+        self._lock = threading.Lock()
+
+    def connection(self):
+        if not self._ready:
+            self._prepare()
+        return self.pool.connection()
+
+    def _prepare(self):
+        with self._lock:
+            if self._ready:
+                return
+            with self.pool.connection() as conn:
+                migrate(conn, migrations=SHARD_MIGRATIONS)
+                conn.execute("INSERT OR IGNORE INTO shard_info (key, value) VALUES ('index', ?), ('count', ?)",
+                             (self.index, self.count))
+                conn.commit()
+                info = {row['key']: row['value'] for row in conn.execute('SELECT key, value FROM shard_info')}
+            if info != {'index': self.index, 'count': self.count}:
+                raise RuntimeError(f"{self.path} is shard {info.get('index')} of {info.get('count')}, "
+                                   f"not {self.index} of {self.count} (BLIPP_SESSION_SHARDS changed?)")
+            self._ready = True
+
+    def stats(self):
+        entry = {
+            'index': self.index,
+            'path': os.path.abspath(self.path),
+            'db_bytes': os.path.getsize(self.path) if os.path.exists(self.path) else 0,
+            'sessions': 0,
+            'inventory_items': 0
+        }
+        if os.path.exists(self.path):
+            with self.connection() as conn:
+                for row in conn.execute('SELECT name, count FROM shard_counts'):
+                    entry[row['name']] = row['count']
+        entry['connection_pool'] = self.pool.stats()
+        return entry
+
+
+class SessionStore:
+    """Session-keyed robot state and inventory over hash-routed shard files"""
+
+    def __init__(self, db_path, shard_count=SHARDS, flush_interval=0.5, pool_size=POOL_SIZE,
+                 statement_hook=None, read_through=False, idle_seconds=IDLE_SECONDS, logger=None):
+        if shard_count < 1:
+            raise ValueError('shard_count must be at least 1')
+        self.flush_interval = flush_interval
+        self.idle_seconds = idle_seconds
+        self.logger = logger
+        # As in RobotStateStore: with several worker processes, reads go to the
+        # shard unless this process still has the session's newest state pending
+        self.read_through = read_through
+
+        # statement_hook(sql, params, seconds, phase, db_path=...) is told which file ran the statement
+        self.shards = [
+            Shard(index, shard_count, path, pool_size,
+                  partial(statement_hook, db_path=path) if statement_hook else None)
+            for index, path in enumerate(shard_paths(db_path, shard_count))
+        ]
+
+        self._lock = threading.Lock()
+        # session_id -> (state dict, last update time)
+        self._states = {}
+        self._dirty = set()
+        self._stop = threading.Event()
+        self._thread = None
+
+        # Statistics
+        self._updates = 0
+        self._flushes = 0
+        self._rows_flushed = 0
+        self._evicted = 0
+        self._last_flush = None
+
+    def shard_for(self, session_id):
+        return self.shards[shard_index(session_id, len(self.shards))]
+
+    # Robot state
+
+    def update_robot_state(self, session_id, x, y, direction, is_digging, is_jumping):
+        state = {
+            'session_id': session_id,
+            'x': _real(x),
+            'y': _real(y),
+            'direction': _integer(direction),
+            'is_digging': _integer(is_digging),
+            'is_jumping': _integer(is_jumping),
+            'timestamp': datetime.now(timezone.utc).strftime('%Y-%m-%d %H:%M:%S')
+        }
+        with self._lock:
+            self._states[session_id] = (state, time.monotonic())
+            self._dirty.add(session_id)
+            self._updates += 1
+
+        if self.flush_interval <= 0:
+            self.flush()
+        else:
+            self._ensure_flusher()
+
+    def get_robot_state(self, session_id):
+        """Return the session's latest state dict, or None if it never sent one"""
+        with self._lock:
+            cached = self._states.get(session_id)
+            if cached and (session_id in self._dirty or not self.read_through):
+                return dict(cached[0])
+
+        with self.shard_for(session_id).connection() as conn:
+            row = conn.execute('SELECT * FROM session_robot_state WHERE session_id = ?', (session_id,)).fetchone()
+        if row is None:
+            return None
+        state = dict(row)
+        with self._lock:
+            # An update may have arrived while reading; it wins
+            if not self.read_through:
+                self._states.setdefault(session_id, (state, time.monotonic()))
+        return dict(state)
+
+    def flush(self):
+        """Write the newest state of every changed session, one transaction per shard;
+        returns the number of sessions written"""
+        with self._lock:
+            if not self._dirty:
+                return 0
+            pending = {session_id: self._states[session_id][0] for session_id in self._dirty}
+            self._dirty = set()
+
+        by_shard = {}
+        for session_id, state in pending.items():
+            by_shard.setdefault(self.shard_for(session_id), []).append(
+                (session_id, *(state[field] for field in _STATE_FIELDS)))
+
+        written = 0
+        failed = None
+        for shard, rows in by_shard.items():
+            try:
+                with shard.connection() as conn:
+                    conn.execute('BEGIN IMMEDIATE')
+                    try:
+                        conn.executemany(UPSERT_ROBOT_STATE_SQL, rows)
+                        conn.commit()
+                    except Exception:
+                        conn.rollback()
+                        raise
+                written += len(rows)
+            except Exception as e:
+                # Keep this shard's sessions pending (unless updated since) so the next flush retries them
+                with self._lock:
+                    for row in rows:
+                        current = self._states.get(row[0])
+                        if current and current[0] is pending[row[0]]:
+                            self._dirty.add(row[0])
+                failed = e
+
+        with self._lock:
+            self._flushes += 1
+            self._rows_flushed += written
+            self._last_flush = time.time()
+        self._evict_idle()
+        if failed is not None:
+            raise failed
+        return written
+
+    def _evict_idle(self):
+        if self.idle_seconds <= 0:
+            return
+        cutoff = time.monotonic() - self.idle_seconds
+        with self._lock:
+            idle = [session_id for session_id, (_, updated) in self._states.items()
+                    if updated < cutoff and session_id not in self._dirty]
+            for session_id in idle:
+                del self._states[session_id]
+            self._evicted += len(idle)
+
+    def _ensure_flusher(self):
+        if self._thread is not None and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._thread.is_alive():
+                return
+            self._stop.clear()
+            self._thread = threading.Thread(target=self._run, name='session-state-flusher', daemon=True)
+            self._thread.start()
+
+    def _run(self):
+        while not self._stop.wait(self.flush_interval):
+            try:
+                self.flush()
+            except Exception as e:
+                if self.logger:
+                    self.logger.error(f'Error flushing session robot state: {str(e)}')
+
+    # Inventory
+
+    def add_items(self, session_id, rows):
+        """Insert inventory_item_values() tuples for a session in one transaction; returns their ids"""
+        with self.shard_for(session_id).connection() as conn:
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                conn.executemany(INSERT_ITEM_SQL, [(session_id, *values) for values in rows])
+                last_id = conn.execute('SELECT last_insert_rowid()').fetchone()[0]
+                conn.commit()
+            except Exception:
+                conn.rollback()
+                raise
+        # AUTOINCREMENT ids within one write transaction are contiguous
+        return list(range(last_id - len(rows) + 1, last_id + 1))
+
+    def list_items(self, session_id, limit, before_id=None):
+        """Up to limit of the session's items, newest first, with ids below before_id"""
+        clause, params = ('AND id < ?', (before_id,)) if before_id is not None else ('', ())
+        with self.shard_for(session_id).connection() as conn:
+            rows = conn.execute(f'''
+                SELECT {', '.join(ITEM_COLUMNS)} FROM session_inventory_items
+                WHERE session_id = ? {clause} ORDER BY id DESC LIMIT ?
+            ''', (session_id, *params, limit)).fetchall()
+        return [dict(row) for row in rows]
+
+    # Lifecycle
+
+    def stop(self):
+        """Stop the flusher and persist any pending state (call on shutdown)"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout=5)
+            self._thread = None
+        self.flush()
+        for shard in self.shards:
+            shard.pool.close_all()
+
+    def reset_after_fork(self):
+        """Drop the parent's flusher thread, cached states and connections in a forked child"""
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+        self._states = {}
+        self._dirty = set()
+        for shard in self.shards:
+            shard.pool.reset_after_fork()
+            shard._lock = threading.Lock()
+
+    def stats(self):
+        """Per-shard sizes and row counts plus totals, for /api/server/status"""
+        shards = []
+        for shard in self.shards:
+            try:
+                shards.append(shard.stats())
+            except Exception as e:
+                shards.append({'index': shard.index, 'path': os.path.abspath(shard.path), 'error': str(e)})
+        sessions = [entry.get('sessions', 0) for entry in shards]
+        total_sessions = sum(sessions)
+        with self._lock:
+            buffer = {
+                'flush_interval_seconds': self.flush_interval,
+                'cached_sessions': len(self._states),
+                'pending_sessions': len(self._dirty),
+                'updates_received': self._updates,
+                'flushes': self._flushes,
+                'rows_flushed': self._rows_flushed,
+                'evicted_sessions': self._evicted,
+                'last_flush': datetime.fromtimestamp(self._last_flush).isoformat() if self._last_flush else None
+            }
+        return {
+            'shard_count': len(self.shards),
+            'sessions': total_sessions,
+            'inventory_items': sum(entry.get('inventory_items', 0) for entry in shards),
+            'db_bytes': sum(entry.get('db_bytes', 0) for entry in shards),
+            # Largest shard's share of sessions relative to an even split (1.0 = balanced)
+            'session_skew': round(max(sessions) * len(sessions) / total_sessions, 3) if total_sessions else None,
+            'state_buffer': buffer,
+            'shards': shards
+        }
@@ -0,0 +1,255 @@
+#!/usr/bin/env python
+# Per-statement SQL timing for the Blipp game database server
+#
+# Fed by the pooled connections' TimedCursor hook, so every execute and
+# fetch is counted without touching the route code. Statements are grouped
+# by shape: literals become ?, IN (?, ?, ...) lists collapse and whitespace
+# is normalized, so a query built with different values is one entry. Each
+# shape also records which routes ran it. Statements slower than the
+# threshold are logged with their bound parameters and EXPLAIN QUERY PLAN
+# and kept in a short in-memory list.
+
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+
+SLOW_THRESHOLD_MS = 100.0
+MAX_SHAPES = 500
+RECENT_SLOW = 50
+
+# Longest parameter repr kept in the slow log
+MAX_PARAM_CHARS = 200
+
+# Shape used once MAX_SHAPES distinct shapes have been seen
+OTHER_SHAPE = '<other statements>'
+
+_STRING = re.compile(r"'(?:[^']|'')*'")
+_NUMBER = re.compile(r'(?<![\w.])-?\d+(?:\.\d+)?(?:[eE][-+]?\d+)?\b')
+_IN_LIST = re.compile(r'\(\s*\?(?:\s*,\s*\?)+\s*\)')
+_SPACE = re.compile(r'\s+')
+
+# Only these can be passed to EXPLAIN QUERY PLAN
+_EXPLAINABLE = ('SELECT', 'INSERT', 'UPDATE', 'DELETE', 'WITH', 'REPLACE')
+
+_shape_cache = {}
+_SHAPE_CACHE_SIZE = 4096
+
+
+def normalize_sql(sql):
+    """Return the shape of a statement: literals as ?, IN-lists collapsed, single spaces"""
+    shape = _shape_cache.get(sql)
+    if shape is None:
+        shape = _STRING.sub('?', sql)
+        shape = _NUMBER.sub('?', shape)
+        shape = _SPACE.sub(' ', shape).strip()
+        shape = _IN_LIST.sub('(?, ...)', shape)
+        if len(_shape_cache) >= _SHAPE_CACHE_SIZE:
+            # Ad hoc SQL with inlined values would otherwise grow this forever
+            _shape_cache.clear()
+        _shape_cache[sql] = shape
+    return shape
+
+
+def is_full_scan(plan):
+    """True if a query plan scans a table without an index"""
+    for line in plan:
+        if line.startswith('SCAN ') and ' USING ' not in line:
+            return True
+    return False
+
+
+def _format_params(params):
+    if params is None:
+        return None
+    text = repr(tuple(params) if isinstance(params, list) else params)
+    return text if len(text) <= MAX_PARAM_CHARS else text[:MAX_PARAM_CHARS] + '...'
+
+
+class _Shape:
+    __slots__ = ('sql', 'calls', 'batches', 'total', 'execute', 'fetch', 'max', 'slow', 'routes',
+                 'example', 'params', 'db_path')
+
+    def __init__(self, sql):
+        self.sql = sql
+        self.calls = 0
+        self.batches = 0
+        self.total = 0.0
+        self.execute = 0.0
+        self.fetch = 0.0
+        self.max = 0.0
+        self.slow = 0
+        self.routes = {}
+        # Latest statement text and parameters, for EXPLAIN at read time
+        self.example = sql
+        self.params = ()
+        self.db_path = None
+
+
+class _RouteContext(threading.local):
+    def __init__(self):
+        self.route = None
+
+
+class StatementTracer:
+    def __init__(self, db_path, slow_threshold_ms=SLOW_THRESHOLD_MS, logger=None, max_shapes=MAX_SHAPES,
+                 recent_slow=RECENT_SLOW):
+        self.db_path = db_path
+        self.slow_threshold = slow_threshold_ms / 1000.0
+        self.logger = logger
+        self.max_shapes = max_shapes
+
+        self._shapes = {}
+        self._recent_slow = deque(maxlen=recent_slow)
+        self._context = _RouteContext()
+        self._lock = threading.Lock()
+
+        # Plans come from separate read-only connections (one per database
+        # file), so EXPLAIN never runs through the traced cursors or inside
+        # the caller's transaction
+        self._explain_conns = {}
+        self._explain_lock = threading.Lock()
+
+        # Statistics
+        self._statements = 0
+        self._slow_total = 0
+
+    def begin_request(self, route):
+        """Attribute statements on this thread to route until the next request"""
+        self._context.route = route
+
+    def end_request(self):
+        self._context.route = None
+
+    def record(self, sql, params, seconds, phase, db_path=None):
+        """TimedCursor hook: phase is 'execute', 'executemany' or 'fetch'; db_path
+        names the database when it is not the main one"""
+        if sql is None:
+            return
+        shape_sql = normalize_sql(sql)
+        route = self._context.route or 'background'
+        with self._lock:
+            shape = self._shapes.get(shape_sql)
+            if shape is None:
+                if len(self._shapes) >= self.max_shapes:
+                    shape_sql = OTHER_SHAPE
+                shape = self._shapes.get(shape_sql)
+                if shape is None:
+                    shape = self._shapes[shape_sql] = _Shape(shape_sql)
+            if phase == 'fetch':
+                shape.fetch += seconds
+            else:
+                self._statements += 1
+                shape.calls += 1
+                shape.routes[route] = shape.routes.get(route, 0) + 1
+                shape.execute += seconds
+                shape.example = sql
+                shape.params = params
+                shape.db_path = db_path
+                if phase == 'executemany':
+                    shape.batches += 1
+            shape.total += seconds
+            if seconds > shape.max:
+                shape.max = seconds
+            slow = seconds >= self.slow_threshold
+            if slow:
+                shape.slow += 1
+                self._slow_total += 1
+        if slow:
+            self._log_slow(sql, params, seconds, phase, route, db_path)
+
+    def _log_slow(self, sql, params, seconds, phase, route, db_path):
+        plan = self.explain(sql, params, db_path)
+        entry = {
+            'time': time.time(),
+            'route': route,
+            'phase': phase,
+            'ms': round(seconds * 1000, 3),
+            'sql': _SPACE.sub(' ', sql).strip(),
+            'params': _format_params(params),
+            'plan': plan
+        }
+        self._recent_slow.append(entry)
+        if self.logger:
+            plan_text = f" plan={' | '.join(plan)}" if plan else ''
+            self.logger.warning(f"Slow SQL ({entry['ms']} ms {phase}, {route}): {entry['sql']} "
+                                f"params={entry['params']}{plan_text}",
+                                extra={'slow_sql_ms': entry['ms'], 'route': route})
+
+    def explain(self, sql, params=None, db_path=None):
+        """EXPLAIN QUERY PLAN lines for sql, or a one-line note if it cannot be explained"""
+        statement = sql.strip()
+        if not statement.upper().startswith(_EXPLAINABLE):
+            return []
+        if params is None:
+            # executemany: the plan does not depend on the values
+            params = (None,) * statement.count('?')
+        try:
+            path = db_path or self.db_path
+            with self._explain_lock:
+                conn = self._explain_conns.get(path)
+                if conn is None:
+                    conn = self._explain_conns[path] = sqlite3.connect(
+                        f'file:{path}?mode=ro', uri=True, isolation_level=None, check_same_thread=False)
+                rows = conn.execute(f'EXPLAIN QUERY PLAN {statement}', params).fetchall()
+        except sqlite3.Error as e:
+            return [f'(no plan: {str(e)})']
+        return [row[3] for row in rows]
+
+    def top(self, limit=20, sort='total', explain=True):
+        """Statement shapes ordered by sort: total, mean, max, calls or slow"""
+        with self._lock:
+            shapes = [(shape.sql, shape.calls, shape.batches, shape.total, shape.execute, shape.fetch,
+                       shape.max, shape.slow, dict(shape.routes), shape.example, shape.params, shape.db_path)
+                      for shape in self._shapes.values()]
+        keys = {
+            'total': lambda s: s[3],
+            'mean': lambda s: s[3] / max(s[1], 1),
+            'max': lambda s: s[6],
+            'calls': lambda s: s[1],
+            'slow': lambda s: s[7]
+        }
+        shapes.sort(key=keys.get(sort, keys['total']), reverse=True)
+
+        statements = []
+        for (sql, calls, batches, total, execute, fetch, max_seconds, slow, routes, example, params,
+             db_path) in shapes[:limit]:
+            entry = {
+                'sql': sql,
+                'calls': calls,
+                'executemany_calls': batches,
+                'total_ms': round(total * 1000, 3),
+                'mean_ms': round(total / max(calls, 1) * 1000, 3),
+                'execute_ms': round(execute * 1000, 3),
+                'fetch_ms': round(fetch * 1000, 3),
+                'max_ms': round(max_seconds * 1000, 3),
+                'slow': slow,
+                'routes': dict(sorted(routes.items(), key=lambda item: item[1], reverse=True))
+            }
+            if explain and sql != OTHER_SHAPE:
+                entry['plan'] = self.explain(example, params, db_path)
+                entry['full_scan'] = is_full_scan(entry['plan'])
+            statements.append(entry)
+        return statements
+
+    def recent_slow(self):
+        """Newest slow statements first"""
+        return list(reversed(self._recent_slow))
+
+    def reset(self):
+        with self._lock:
+            self._shapes.clear()
+            self._recent_slow.clear()
+            self._statements = 0
+            self._slow_total = 0
+
+    def stats(self):
+        return {
+            'enabled': True,
+            'slow_threshold_ms': round(self.slow_threshold * 1000, 3),
+            'statements': self._statements,
+            'shapes': len(self._shapes),
+            'max_shapes': self.max_shapes,
+            'slow_statements': self._slow_total
+        }
@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+# Import and cold-start benchmark for the Blipp game database server
+#
+# Every run is a fresh interpreter in a scratch directory, timing the phases
+# a cold start goes through: interpreter start, `import game_db`,
+# create_app() and the first request (which checks the schema). The first
+# request is timed twice: against a new database (migrations run) and an
+# existing one (the stored version matches, nothing is checked). Medians
+# over the runs go into a JSON report; comparing against a stored baseline
+# turns the run into a regression check.
+#
+# Usage:
+#   python startup_benchmark.py --runs 20 --output startup.json --save-baseline startup_baseline.json
+#   python startup_benchmark.py --baseline startup_baseline.json --tolerance 0.25
+#   python startup_benchmark.py --importtime 15   (also list the slowest imports)
+
+import argparse
+import json
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+SCRIPT_DIR = os.path.dirname(os.path.abspath(__file__))
+RUNS = 10
+
+# Runs in the child interpreter; prints one JSON line of phase timings (seconds)
+_CHILD = '''
+import json, sys, time
+started = time.perf_counter()
+sys.path.insert(0, {script_dir!r})
+import game_db
+imported = time.perf_counter()
+app = game_db.create_app()
+created = time.perf_counter()
+response = app.test_client().get('/api/health')
+first = time.perf_counter()
+assert response.status_code == 200, response.status_code
+game_db.shutdown()
+print(json.dumps({{
+    'import_game_db': imported - started,
+    'create_app': created - imported,
+    'first_request': first - created,
+    'process_ready': first - started
+}}))
+'''
+
+PHASES = ('interpreter', 'import_game_db', 'create_app', 'first_request_new_db',
+          'first_request_existing_db', 'cold_start_new_db', 'cold_start_existing_db')
+
+
+def _child_env(workdir):
+    env = dict(os.environ)
+    env['BLIPP_DB_PATH'] = os.path.join(workdir, 'startup.db')
+    env['BLIPP_LOG_FILE'] = os.path.join(workdir, 'game_db.log')
+    env.pop('BLIPP_PROFILE_SAMPLE', None)
+    env.pop('BLIPP_PROFILE_TOKEN', None)
+    return env
+
+
+def _run(args, env, cwd):
+    result = subprocess.run(args, env=env, cwd=cwd, capture_output=True, text=True)
+    if result.returncode != 0:
+        raise RuntimeError(f'{args[:2]} failed:\n{result.stderr.strip()}')
+    return result
+
+
+def _timed_python(code, env, cwd):
+    """Wall time of a whole interpreter run, from spawn to exit"""
+    start = time.perf_counter()
+    _run([sys.executable, '-c', code], env, cwd)
+    return time.perf_counter() - start
+
+
+def measure_once(workdir):
+    """One sample of every phase, each from a fresh interpreter"""
+    env = _child_env(workdir)
+    db_path = env['BLIPP_DB_PATH']
+    for suffix in ('', '-wal', '-shm'):
+        if os.path.exists(db_path + suffix):
+            os.remove(db_path + suffix)
+
+    code = _CHILD.format(script_dir=SCRIPT_DIR)
+    sample = {'interpreter': _timed_python('pass', env, workdir)}
+    new_db = json.loads(_run([sys.executable, '-c', code], env, workdir).stdout.strip().splitlines()[-1])
+    existing_db = json.loads(_run([sys.executable, '-c', code], env, workdir).stdout.strip().splitlines()[-1])
+
+    sample['import_game_db'] = existing_db['import_game_db']
+    sample['create_app'] = existing_db['create_app']
+    sample['first_request_new_db'] = new_db['first_request']
+    sample['first_request_existing_db'] = existing_db['first_request']
+    # Interpreter start plus everything up to the first response
+    sample['cold_start_new_db'] = sample['interpreter'] + new_db['process_ready']
+    sample['cold_start_existing_db'] = sample['interpreter'] + existing_db['process_ready']
+    return sample
+
+
+def slowest_imports(workdir, top):
+    """Top modules by cumulative import time under -X importtime (microseconds)"""
+    env = _child_env(workdir)
+    code = f'import sys; sys.path.insert(0, {SCRIPT_DIR!r}); import game_db'
+    stderr = _run([sys.executable, '-X', 'importtime', '-c', code], env, workdir).stderr
+    modules = []
+    for line in stderr.splitlines():
+        # "import time:  <own us> | <cumulative us> | <indented module name>"
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        own, cumulative, name = line[len('import time:'):].split('|')
+        modules.append({'module': name.strip(), 'own_us': int(own), 'cumulative_us': int(cumulative)})
+    return sorted(modules, key=lambda m: m['cumulative_us'], reverse=True)[:top]
+
+
+def summarize(samples):
+    summary = {}
+    for phase in PHASES:
+        values = sorted(sample[phase] * 1000 for sample in samples)
+        summary[phase] = {
+            'median_ms': round(statistics.median(values), 3),
+            'min_ms': round(values[0], 3),
+            'max_ms': round(values[-1], 3)
+        }
+    return summary
+
+
+def compare(report, baseline, tolerance, floor_ms=5.0):
+    """Return regression messages: a phase median grew by more than tolerance
+    (a fraction) and by more than floor_ms"""
+    regressions = []
+    for phase, base in baseline.get('phases', {}).items():
+        current = report['phases'].get(phase)
+        if current is None:
+            continue
+        grown = current['median_ms'] - base['median_ms']
+        if current['median_ms'] > base['median_ms'] * (1 + tolerance) and grown > floor_ms:
+            regressions.append(f"{phase}: median {current['median_ms']} ms, baseline {base['median_ms']} ms")
+    return regressions
+
+
+def print_report(report):
+    print(f"\n{'phase':<28}{'median':>12}{'min':>12}{'max':>12}")
+    for phase, stats in report['phases'].items():
+        print(f"{phase:<28}{stats['median_ms']:>10.1f}ms{stats['min_ms']:>10.1f}ms{stats['max_ms']:>10.1f}ms")
+    if report.get('slowest_imports'):
+        print('\nSlowest imports (cumulative):')
+        for entry in report['slowest_imports']:
+            print(f"  {entry['cumulative_us'] / 1000:>8.1f} ms  {entry['module']}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Measure import and cold-start time of the game database server')
+    parser.add_argument('--runs', type=int, default=RUNS, help='fresh interpreters per phase (default: %(default)s)')
+    parser.add_argument('--importtime', type=int, default=0, metavar='N',
+                        help='also report the N slowest imports from python -X importtime')
+    parser.add_argument('--output', default='startup_benchmark.json', help='JSON report (default: %(default)s)')
+    parser.add_argument('--save-baseline', help='write the JSON report here as the new baseline')
+    parser.add_argument('--baseline', help='fail if this run regressed against the given baseline report')
+    parser.add_argument('--tolerance', type=float, default=0.2,
+                        help='allowed growth of a phase median as a fraction (default: %(default)s)')
+    args = parser.parse_args()
+    if args.runs <= 0:
+        parser.error('--runs must be positive')
+
+    workdir = tempfile.mkdtemp(prefix='blipp-startup-')
+    try:
+        samples = []
+        for run in range(args.runs):
+            samples.append(measure_once(workdir))
+            print(f'Run {run + 1}/{args.runs}: cold start {samples[-1]["cold_start_existing_db"] * 1000:.1f} ms')
+        report = {
+            'config': {'runs': args.runs, 'python': sys.version.split()[0]},
+            'phases': summarize(samples)
+        }
+        if args.importtime > 0:
+            report['slowest_imports'] = slowest_imports(workdir, args.importtime)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    print_report(report)
+    for path in (args.output, args.save_baseline):
+        if path:
+            with open(path, 'w') as f:
+                json.dump(report, f, indent=2)
+            print(f'Wrote {path}')
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(report, baseline, args.tolerance)
+        if regressions:
+            print(f'\nRegressions against {args.baseline} (tolerance {args.tolerance:.0%}):')
+            for message in regressions:
+                print(f'  {message}')
+            return 1
+        print(f'\nNo regressions against {args.baseline} (tolerance {args.tolerance:.0%})')
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
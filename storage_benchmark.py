@@ -0,0 +1,245 @@
+#!/usr/bin/env python
+# Offline storage benchmark: route SQL latency against inventory size
+#
+# Grows one database through a series of inventory_items sizes (rows come
+# from data_generator.py) and, at each size, times the same code the routes
+# run, in-process and on a connection configured like the server's pool:
+# random and filtered-random selection, stats from the counters and from a
+# full recount, the newest-first listing and single / batched inserts.
+# Writes a JSON report and, with matplotlib installed, a latency plot.
+#
+# Usage:
+#   python storage_benchmark.py --sizes 1k,10k,100k,1m --output storage.json --plot storage.png
+#   python storage_benchmark.py --sizes 10m --db /tmp/bench.db --keep   (reuse the grown database later)
+
+import argparse
+import json
+import os
+import random
+import shutil
+import sqlite3
+import sys
+import tempfile
+import time
+
+import data_generator
+import populate_database as inventory_vocab
+from db_migrations import check_query_plans, migrate
+from db_pool import ConnectionPool
+from inventory_stats import compute_stats, read_stats
+from item_sampler import RandomSampler
+
+DEFAULT_SIZES = '1k,10k,100k,1m'
+# Each operation runs for at most this long (and at least MIN_ITERATIONS times)
+TIME_BUDGET = 2.0
+MAX_ITERATIONS = 500
+MIN_ITERATIONS = 3
+PAGE_SIZE = 100
+INSERT_BATCH = 100
+
+
+def parse_size(value):
+    value = value.strip().lower()
+    multiplier = {'k': 1000, 'm': 1000000}.get(value[-1:], 1)
+    if multiplier > 1:
+        value = value[:-1]
+    size = int(float(value) * multiplier)
+    if size <= 0:
+        raise ValueError(f'size must be positive: {value}')
+    return size
+
+
+def time_operation(operation, budget=TIME_BUDGET, max_iterations=MAX_ITERATIONS):
+    """Run operation repeatedly within the time budget and summarize its latency"""
+    timings = []
+    deadline = time.perf_counter() + budget
+    while len(timings) < max_iterations and (len(timings) < MIN_ITERATIONS or time.perf_counter() < deadline):
+        start = time.perf_counter()
+        operation()
+        timings.append(time.perf_counter() - start)
+    timings.sort()
+
+    def pct(p):
+        return round(timings[min(len(timings) - 1, int(p / 100.0 * len(timings)))] * 1000, 4)
+    return {
+        'iterations': len(timings),
+        'p50_ms': pct(50),
+        'p90_ms': pct(90),
+        'p99_ms': pct(99),
+        'mean_ms': round(sum(timings) / len(timings) * 1000, 4),
+        'max_ms': round(timings[-1] * 1000, 4)
+    }
+
+
+def grow(db_path, target, seed):
+    """Top inventory_items up to target rows; returns seconds spent"""
+    conn = sqlite3.connect(db_path, isolation_level=None)
+    try:
+        migrate(conn)
+        current = conn.execute('SELECT COUNT(*) FROM inventory_items').fetchone()[0]
+        if current >= target:
+            return 0.0
+        started = time.monotonic()
+        # Each top-up has its own seed so rows are not repeats of the previous step
+        chunks = data_generator.generate_chunks('inventory_items', target - current, f'{seed}:{target}')
+        data_generator.load(conn, 'inventory_items', chunks, defer_triggers=True)
+        conn.execute('PRAGMA optimize')
+        return time.monotonic() - started
+    finally:
+        conn.close()
+
+
+def benchmark_size(db_path, budget, seed, routes):
+    """Time every operation against the database as it is now"""
+    pool = ConnectionPool(db_path, max_size=1)
+    rng = random.Random(seed)
+    results = {}
+    try:
+        with pool.connection() as conn:
+            rows = conn.execute('SELECT COUNT(*) FROM inventory_items').fetchone()[0]
+
+            sampler = RandomSampler('inventory_items', rng=random.Random(seed))
+            start = time.perf_counter()
+            sampler.refresh(conn)
+            results['sampler_index_build'] = {'iterations': 1,
+                                              'seconds': round(time.perf_counter() - start, 4)}
+
+            filters = [(category, rarity) for category in inventory_vocab.CATEGORIES
+                       for rarity in inventory_vocab.RARITIES]
+            _, first_cursor = routes.fetch_inventory_page(conn, routes.INVENTORY_COLUMNS, PAGE_SIZE)
+            after = routes.decode_cursor(first_cursor) if first_cursor else None
+
+            operations = {
+                'random': lambda: sampler.sample_rows(conn),
+                'random_filtered': lambda: sampler.sample_rows(conn, *rng.choice(filters)),
+                'stats_counters': lambda: read_stats(conn),
+                'stats_full_scan': lambda: compute_stats(conn),
+                'recent_items': lambda: routes.fetch_inventory_page(conn, routes.INVENTORY_COLUMNS, PAGE_SIZE),
+                'recent_items_next_page': lambda: routes.fetch_inventory_page(
+                    conn, routes.INVENTORY_COLUMNS, PAGE_SIZE, after)
+            }
+            for name, operation in operations.items():
+                results[name] = time_operation(operation, budget)
+
+            # Writes last so the reads above see exactly `rows` rows
+            def insert_single():
+                item = inventory_vocab.generate_random_item(rng)
+                conn.execute(routes.INSERT_INVENTORY_ITEM_SQL, routes.inventory_item_values(item))
+                conn.commit()
+
+            def insert_batch():
+                values = [routes.inventory_item_values(inventory_vocab.generate_random_item(rng))
+                          for _ in range(INSERT_BATCH)]
+                conn.execute('BEGIN IMMEDIATE')
+                conn.executemany(routes.INSERT_INVENTORY_ITEM_SQL, values)
+                conn.commit()
+
+            results['insert_single'] = time_operation(insert_single, budget, max_iterations=100)
+            results[f'insert_batch_{INSERT_BATCH}'] = time_operation(insert_batch, budget, max_iterations=20)
+
+            plans = {name: lines for name, (_, lines) in check_query_plans(conn).items()}
+    finally:
+        pool.close_all()
+    return rows, results, plans
+
+
+def plot(report, path):
+    """Plot p50 latency per operation against row count; needs matplotlib"""
+    try:
+        import matplotlib
+        matplotlib.use('Agg')
+        import matplotlib.pyplot as plt
+    except ImportError:
+        print('matplotlib is not installed; skipping the plot (pip install matplotlib)', file=sys.stderr)
+        return False
+
+    sizes = [entry['rows'] for entry in report['sizes']]
+    names = [name for name, stats in report['sizes'][0]['operations'].items() if 'p50_ms' in stats]
+    fig, ax = plt.subplots(figsize=(9, 6))
+    for name in names:
+        ax.plot(sizes, [entry['operations'][name]['p50_ms'] for entry in report['sizes']], marker='o', label=name)
+    ax.set_xscale('log')
+    ax.set_yscale('log')
+    ax.set_xlabel('inventory_items rows')
+    ax.set_ylabel('p50 latency (ms)')
+    ax.set_title('Blipp route SQL latency vs. inventory size')
+    ax.grid(True, which='both', alpha=0.3)
+    ax.legend()
+    fig.tight_layout()
+    fig.savefig(path)
+    plt.close(fig)
+    return True
+
+
+def print_size(entry):
+    print(f"\n{entry['rows']} rows, {entry['db_bytes'] / 1e6:.1f} MB (grown in {entry['build_seconds']:.1f}s)")
+    for name, stats in entry['operations'].items():
+        if 'p50_ms' in stats:
+            print(f"  {name:<26} p50 {stats['p50_ms']:>10.3f} ms   p99 {stats['p99_ms']:>10.3f} ms"
+                  f"   ({stats['iterations']} runs)")
+        else:
+            print(f"  {name:<26} {stats['seconds'] * 1000:>14.3f} ms")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark route SQL against growing inventory sizes')
+    parser.add_argument('--sizes', default=DEFAULT_SIZES,
+                        help='comma-separated inventory sizes, k/m suffixes allowed (default: %(default)s)')
+    parser.add_argument('--db', help='database to grow and reuse (default: a temporary file)')
+    parser.add_argument('--keep', action='store_true', help='keep the temporary database')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed for generated rows and samples')
+    parser.add_argument('--budget', type=float, default=TIME_BUDGET,
+                        help='seconds spent timing each operation per size (default: %(default)s)')
+    parser.add_argument('--output', default='storage_benchmark.json', help='JSON report (default: %(default)s)')
+    parser.add_argument('--plot', help='write a latency-vs-rows PNG here (requires matplotlib)')
+    args = parser.parse_args()
+
+    try:
+        sizes = sorted({parse_size(value) for value in args.sizes.split(',') if value.strip()})
+    except ValueError as e:
+        parser.error(str(e))
+
+    workdir = tempfile.mkdtemp(prefix='blipp-storage-')
+    db_path = args.db or os.path.join(workdir, 'storage_benchmark.db')
+
+    # The route helpers live in game_db; importing it builds no app
+    import game_db as routes
+
+    report = {
+        'config': {'sizes': sizes, 'seed': args.seed, 'budget_seconds': args.budget,
+                   'page_size': PAGE_SIZE, 'insert_batch': INSERT_BATCH,
+                   'sqlite_version': sqlite3.sqlite_version, 'python': sys.version.split()[0]},
+        'sizes': []
+    }
+    try:
+        for size in sizes:
+            print(f'Growing inventory_items to {size} rows...')
+            build_seconds = grow(db_path, size, args.seed)
+            rows, operations, plans = benchmark_size(db_path, args.budget, args.seed, routes)
+            if rows > size:
+                print(f'Note: database already held {rows} rows (more than {size})')
+            entry = {
+                'target_rows': size,
+                'rows': rows,
+                'db_bytes': os.path.getsize(db_path),
+                'build_seconds': round(build_seconds, 3),
+                'operations': operations,
+                'query_plans': plans
+            }
+            report['sizes'].append(entry)
+            print_size(entry)
+    finally:
+        if args.keep and not args.db:
+            print(f'\nDatabase kept at {db_path}')
+        else:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+    if args.plot and plot(report, args.plot):
+        print(f'Wrote {args.plot}')
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Streaming JSON / NDJSON / Server-Sent Events responses
+
+import json
+
+from flask import Response
+
+NDJSON_MIMETYPE = 'application/x-ndjson'
+NDJSON_ACCEPT = ('application/x-ndjson', 'application/ndjson', 'application/jsonl')
+
+# Rows pulled from the SQLite cursor per fetchmany() call / response chunk
+STREAM_BATCH_SIZE = 500
+
+
+def negotiate_format(request):
+    """Return 'ndjson', 'stream' (incremental JSON array) or None for a regular response"""
+    fmt = (request.args.get('format') or '').lower()
+    if fmt in ('ndjson', 'jsonl'):
+        return 'ndjson'
+    if fmt == 'stream':
+        return 'stream'
+    accept = request.headers.get('Accept', '')
+    if any(mimetype in accept for mimetype in NDJSON_ACCEPT):
+        return 'ndjson'
+    return None
+
+
+def iter_batches(cursor, batch_size=STREAM_BATCH_SIZE):
+    """Yield lists of rows from an executed cursor without materialising the result"""
+    while True:
+        rows = cursor.fetchmany(batch_size)
+        if not rows:
+            return
+        yield rows
+
+
+def _encode(row):
+    return json.dumps(row, separators=(',', ':'))
+
+
+def stream_response(batches, fmt):
+    """Build a chunked response from an iterable of row-dict batches.
+
+    The iterable is consumed lazily while the response is written, so any
+    resources it holds (e.g. a pooled connection) stay checked out only until
+    the last chunk has been sent or the client disconnects.
+    """
+    if fmt == 'ndjson':
+        def generate():
+            for batch in batches:
+                yield ''.join(_encode(row) + '\n' for row in batch)
+        return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield '['
+        first = True
+        for batch in batches:
+            if not batch:
+                continue
+            chunk = ','.join(_encode(row) for row in batch)
+            yield chunk if first else ',' + chunk
+            first = False
+        yield ']'
+    return Response(generate(), mimetype='application/json')
+
+
+def encoded_response(bodies, fmt=None, batch_size=STREAM_BATCH_SIZE):
+    """Build a response from rows that are already JSON-encoded bytes.
+
+    fmt is None for a plain JSON array (the same bytes jsonify() writes),
+    or 'ndjson' / 'stream' to send the rows in chunks.
+    """
+    if fmt is None:
+        return Response(b'[' + b','.join(bodies) + b']\n', mimetype='application/json')
+
+    if fmt == 'ndjson':
+        def generate():
+            for start in range(0, len(bodies), batch_size):
+                yield b''.join(body + b'\n' for body in bodies[start:start + batch_size])
+        return Response(generate(), mimetype=NDJSON_MIMETYPE)
+
+    def generate():
+        yield b'['
+        for start in range(0, len(bodies), batch_size):
+            chunk = b','.join(bodies[start:start + batch_size])
+            yield chunk if start == 0 else b',' + chunk
+        yield b']'
+    return Response(generate(), mimetype='application/json')
+
+
+def format_sse(data, event=None, event_id=None):
+    """Encode one Server-Sent Events message (data is JSON-encoded on one line)"""
+    lines = []
+    if event_id is not None:
+        lines.append(f'id: {event_id}')
+    if event:
+        lines.append(f'event: {event}')
+    lines.append(f'data: {_encode(data)}')
+    return '\n'.join(lines) + '\n\n'
+
+
+def sse_response(messages):
+    """Build a text/event-stream response from an iterable of encoded messages"""
+    response = Response(messages, mimetype='text/event-stream')
+    response.headers['Cache-Control'] = 'no-cache'
+    # Stop reverse proxies from buffering the stream
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
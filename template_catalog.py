@@ -0,0 +1,117 @@
+#!/usr/bin/env python
+# In-memory item template catalog with pre-encoded JSON rows
+#
+# item_templates is a small, mostly static table, so the whole catalog is
+# kept in memory with every row already encoded the way jsonify() would
+# encode it. Random picks and listings are answered from prebuilt
+# per-category / per-rarity slices and joined straight from those bytes,
+# without SQL or JSON encoding per request. The item_templates row of
+# table_generations (bumped by triggers on every write, from any process)
+# tells the catalog when to reload.
+
+import json
+import random
+import threading
+import time
+
+# Marker for "no filter" in a (category, rarity) key
+ANY = object()
+
+# Seconds between generation checks; writes show up within this delay
+CHECK_INTERVAL = 1.0
+
+
+def encode_row(row):
+    # Same bytes as jsonify() outside debug mode: sorted keys, compact separators
+    return json.dumps(row, sort_keys=True, separators=(',', ':')).encode('utf-8')
+
+
+class _Snapshot:
+    __slots__ = ('generation', 'slices', 'rows', 'size_bytes')
+
+    def __init__(self, generation, rows):
+        self.generation = generation
+        self.rows = len(rows)
+        self.size_bytes = 0
+        self.slices = {}
+        for row in rows:
+            body = encode_row(row)
+            self.size_bytes += len(body)
+            category, rarity = row.get('category'), row.get('rarity')
+            # Each row is reachable from every filter combination that matches it
+            for key in ((ANY, ANY), (category, ANY), (ANY, rarity), (category, rarity)):
+                self.slices.setdefault(key, []).append(body)
+
+
+class TemplateCatalog:
+    def __init__(self, pool, table='item_templates', check_interval=CHECK_INTERVAL, rng=None):
+        self.pool = pool
+        self.table = table
+        self.check_interval = check_interval
+        self._rng = rng or random.Random()
+
+        self._snapshot = None
+        self._checked_at = 0.0
+        self._reload_lock = threading.Lock()
+
+        # Statistics
+        self._reloads = 0
+        self._served = 0
+
+    def _current(self):
+        """Return the snapshot to serve from, reloading it if the table changed"""
+        snapshot = self._snapshot
+        if snapshot is not None and time.monotonic() - self._checked_at < self.check_interval:
+            return snapshot
+        # One thread reloads; the others keep serving the previous snapshot
+        if snapshot is not None and not self._reload_lock.acquire(blocking=False):
+            return snapshot
+        if snapshot is None:
+            self._reload_lock.acquire()
+        try:
+            snapshot = self._snapshot
+            with self.pool.connection() as conn:
+                # Generation and rows come from the same read transaction
+                conn.execute('BEGIN')
+                try:
+                    row = conn.execute('SELECT generation FROM table_generations WHERE name = ?',
+                                       (self.table,)).fetchone()
+                    generation = row[0] if row else None
+                    if snapshot is None or generation is None or generation != snapshot.generation:
+                        rows = [dict(r) for r in conn.execute(f'SELECT * FROM {self.table} ORDER BY id')]
+                        snapshot = self._snapshot = _Snapshot(generation, rows)
+                        self._reloads += 1
+                finally:
+                    conn.rollback()
+            self._checked_at = time.monotonic()
+            return snapshot
+        finally:
+            self._reload_lock.release()
+
+    def sample(self, category=None, rarity=None, k=1):
+        """Return up to k distinct encoded rows matching the filters, in random order"""
+        bodies = self._current().slices.get((category or ANY, rarity or ANY))
+        if not bodies or k == 0:
+            return []
+        if k < 0:
+            # Mirrors LIMIT -1: every matching row, shuffled
+            k = len(bodies)
+        if k == 1:
+            picked = [bodies[self._rng.randrange(len(bodies))]]
+        else:
+            picked = self._rng.sample(bodies, min(k, len(bodies)))
+        self._served += len(picked)
+        return picked
+
+    def stats(self):
+        snapshot = self._snapshot
+        return {
+            'loaded': snapshot is not None,
+            'rows': snapshot.rows if snapshot else 0,
+            'encoded_bytes': snapshot.size_bytes if snapshot else 0,
+            'filter_slices': len(snapshot.slices) if snapshot else 0,
+            'generation': snapshot.generation if snapshot else None,
+            'reloads': self._reloads,
+            'rows_served': self._served,
+            'check_interval_seconds': self.check_interval
+        }
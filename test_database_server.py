@@ -7,8 +7,14 @@ import time
 import os
 import sys
 import sqlite3
+import logging
+import tempfile
+import argparse
+from contextlib import contextmanager
 from datetime import datetime
 
+from db_migrations import migrate, get_version, check_query_plans, HOT_QUERIES, LATEST_VERSION
+
 # Configuration
 API_BASE_URL = "http://localhost:5000/api"
 DB_PATH = "game_data.db"
@@ -198,6 +204,601 @@ def test_database_file():
         print_error(f"Database file does not exist: {DB_PATH}")
         print_info("The database file will be created when the server starts")
 
+def test_query_plans():
+    print_header("Testing Schema Migrations and Query Plans")
+    
+    # Migrate a scratch database so the check does not depend on game_data.db
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        conn = sqlite3.connect(os.path.join(tmp_dir, 'plans.db'))
+        try:
+            migrate(conn)
+            version = get_version(conn)
+            if version == LATEST_VERSION:
+                print_success(f"Migrations applied up to version {version}")
+            else:
+                print_error(f"Schema version {version}, expected {LATEST_VERSION}")
+                return False
+            
+            all_indexed = True
+            for name, (uses_index, plan) in check_query_plans(conn).items():
+                if uses_index:
+                    print_success(f"{name}: {' | '.join(plan)}")
+                else:
+                    print_error(f"{name} does not use its index: {' | '.join(plan)}")
+                    all_indexed = False
+            
+            # An index no hot query relies on only slows down writes
+            expected = {index for _, _, index in HOT_QUERIES.values()}
+            unused = [name for (name,) in conn.execute(
+                "SELECT name FROM sqlite_master WHERE type = 'index' AND name NOT LIKE 'sqlite_%'")
+                if name not in expected]
+            if unused:
+                print_error(f"Indexes not used by any hot query: {', '.join(unused)}")
+            else:
+                print_success("Every index backs a hot query")
+            return all_indexed and not unused
+        finally:
+            conn.close()
+
+# In-process checks: each builds the app on a throwaway database and talks to
+# it through Flask's test client, so no running server is needed
+@contextmanager
+def scratch_app(**config):
+    import game_db
+    from game_logging import stop_listener
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        settings = {
+            'DB_PATH': os.path.join(tmp_dir, 'checks.db'),
+            'LOG_FILE': os.path.join(tmp_dir, 'game_db.log')
+        }
+        settings.update(config)
+        app = game_db.create_app(settings)
+        # Errors still show; per-request lines would drown the results
+        game_db.logger.setLevel(logging.WARNING)
+        try:
+            yield game_db, app.test_client()
+        finally:
+            game_db.shutdown()
+            stop_listener(game_db.log_listener)
+
+def check(condition, message, detail=None):
+    """Print the outcome of one assertion and return it"""
+    if condition:
+        print_success(message)
+    else:
+        print_error(f"{message}: {detail}" if detail is not None else message)
+    return bool(condition)
+
+def test_trajectory_bounds():
+    print_header("Testing Robot Trajectory Bounds")
+    results = []
+    with scratch_app() as (game_db, client):
+        # Positions a float32 sample cannot hold still update the state
+        response = client.post("/api/robot/state", json={"x": 1e300, "y": 5, "direction": 1})
+        results.append(check(response.status_code == 200, "Out-of-range position is accepted",
+                             response.status_code))
+        state = client.get("/api/robot/state").get_json()
+        results.append(check(state.get("x") == 1e300, "Robot state keeps the position", state))
+        skipped = game_db.robot_trajectory.stats()['samples_skipped']
+        results.append(check(skipped == 1, "Trajectory sample is skipped", skipped))
+        
+        for value in ("inf", "nan", "1e30", "-1e30"):
+            response = client.get(f"/api/robot/trajectory?from={value}")
+            results.append(check(response.status_code == 400, f"from={value} is rejected with 400",
+                                 response.status_code))
+        response = client.get("/api/robot/trajectory?from=0&to=2000-01-01T00:00:00Z")
+        results.append(check(response.status_code == 200, "Millisecond and ISO-8601 bounds are accepted",
+                             response.status_code))
+    return all(results)
+
+def test_cache_negotiation():
+    print_header("Testing Response Cache Content Negotiation")
+    results = []
+    with scratch_app() as (game_db, client):
+        client.post("/api/inventory/add", json={"name": "Cached Item", "type": "test"})
+        first = client.get("/api/inventory/items?limit=5")
+        results.append(check(first.mimetype == "application/json", "JSON page is served", first.mimetype))
+        results.append(check("Accept" in first.headers.get("Vary", ""), "Cached response varies on Accept",
+                             first.headers.get("Vary")))
+        
+        # Same URL, now asking for NDJSON: must not be answered from the JSON entry
+        streamed = client.get("/api/inventory/items?limit=5", headers={"Accept": "application/x-ndjson"})
+        lines = streamed.get_data(as_text=True).splitlines()
+        results.append(check(streamed.mimetype == "application/x-ndjson", "NDJSON is negotiated after a cached "
+                             "JSON page", streamed.mimetype))
+        results.append(check(len(lines) == 1 and json.loads(lines[0])["name"] == "Cached Item",
+                             "NDJSON body has one item per line", lines))
+        
+        again = client.get("/api/inventory/items?limit=5", headers={"If-None-Match": first.headers["ETag"]})
+        results.append(check(again.status_code == 304, "JSON page still revalidates from the cache",
+                             again.status_code))
+    return all(results)
+
+def test_dashboard_snapshot():
+    print_header("Testing Dashboard Snapshot")
+    results = []
+    with scratch_app() as (game_db, client):
+        client.post("/api/inventory/add", json={"name": "Typed Item", "type": "tool", "prefix": "Shiny"})
+        # Accepted by the add route, stored with NULL type and prefix
+        client.post("/api/inventory/add", json={"name": "Untyped Item"})
+        
+        for path in ("/api/dashboard/snapshot", "/api/inventory/stats"):
+            response = client.get(path)
+            results.append(check(response.status_code == 200, f"{path} answers with a NULL-typed item",
+                                 response.status_code))
+        snapshot = client.get("/api/dashboard/snapshot").get_json() or {}
+        stats = snapshot.get("inventory_stats", {})
+        results.append(check(stats.get("by_type") == {"tool": 1, "unknown": 1},
+                             "NULL type is counted under 'unknown'", stats.get("by_type")))
+        results.append(check(len(snapshot.get("recent_items", [])) == 2, "Recent items include both",
+                             snapshot.get("recent_items")))
+    return all(results)
+
+def test_frame_decoding():
+    print_header("Testing Binary Robot State Frames")
+    from robot_frames import CONTENT_TYPE, FRAME_SIZE, MAX_FRAMES, decode_frames, encode_frames
+    results = []
+    
+    frames = decode_frames(encode_frames([(123.456, -7, -1, True, False, 50), (1, 2, 1, False, True)]))
+    results.append(check(frames == [(123.456, -7.0, -1, 1, 0, 50), (1.0, 2.0, 1, 0, 1, 0)],
+                         "Encoded frames decode to the same values", frames))
+    
+    valid = encode_frames([(1, 2, 1, False, False)])
+    malformed = {
+        "empty body": b"",
+        "bad version byte": b"\x02" + valid[1:],
+        "truncated frame": valid[:-1],
+        "header only": valid[:1],
+        "too many frames": encode_frames([(1, 2, 1, False, False)] * (MAX_FRAMES + 1)),
+        "NaN y": encode_frames([(1, float("nan"), 1, False, False)]),
+        "infinite x": encode_frames([(1, 2, 1, False, False), (float("-inf"), 2, 1, False, False)])
+    }
+    for name, body in malformed.items():
+        try:
+            decode_frames(body)
+            results.append(check(False, f"{name} is rejected", "decoded without error"))
+        except ValueError as e:
+            results.append(check(True, f"{name} is rejected ({str(e)})"))
+    
+    with scratch_app() as (game_db, client):
+        response = client.post("/api/robot/state/frames", data=valid, content_type=CONTENT_TYPE)
+        results.append(check(response.status_code == 204, "Frames route answers 204", response.status_code))
+        response = client.post("/api/robot/state/frames", data=malformed["NaN y"], content_type=CONTENT_TYPE)
+        results.append(check(response.status_code == 400, "Non-finite frame is a 400", response.status_code))
+        state = client.get("/api/robot/state")
+        results.append(check(state.get_json() is not None and state.get_json().get("y") == 2.0,
+                             "State is still valid JSON from the last good frame", state.get_data(as_text=True)))
+        body_size = len(valid) - 1
+        results.append(check(body_size == FRAME_SIZE, f"A frame is {FRAME_SIZE} bytes", body_size))
+        
+        # A frame older than its trajectory bucket's settle window is not sampled
+        before = game_db.robot_trajectory.stats()
+        late = encode_frames([(7, 8, 1, False, False, 65535), (9, 10, 1, False, False, 0)])
+        response = client.post("/api/robot/state/frames", data=late, content_type=CONTENT_TYPE)
+        after = game_db.robot_trajectory.stats()
+        results.append(check(response.status_code == 204 and client.get("/api/robot/state").get_json().get("x") == 9,
+                             "A batch with a stale frame still updates the state", response.status_code))
+        counts = (after['samples_late'] - before['samples_late'], after['samples_appended'] - before['samples_appended'])
+        results.append(check(counts == (1, 1), "The stale frame is counted late, not sampled", counts))
+    return all(results)
+
+def test_debug_sql_token():
+    print_header("Testing /api/debug/sql Access")
+    results = []
+    with scratch_app() as (game_db, client):
+        client.get("/api/inventory/stats")
+        response = client.get("/api/debug/sql")
+        results.append(check(response.status_code == 404, "Off without BLIPP_DEBUG_TOKEN", response.status_code))
+    
+    with scratch_app(DEBUG_TOKEN="let-me-in") as (game_db, client):
+        client.get("/api/inventory/stats")
+        for method, path in (("GET", "/api/debug/sql"), ("POST", "/api/debug/sql?reset=1")):
+            response = client.open(path, method=method)
+            results.append(check(response.status_code == 403, f"{method} {path} without the token is a 403",
+                                 response.status_code))
+            response = client.open(path, method=method, headers={"X-Blipp-Debug-Token": "wrong"})
+            results.append(check(response.status_code == 403, f"{method} {path} with a wrong token is a 403",
+                                 response.status_code))
+        response = client.get("/api/debug/sql", headers={"X-Blipp-Debug-Token": "let-me-in"})
+        statements = (response.get_json() or {}).get("statements", [])
+        results.append(check(response.status_code == 200 and statements, "Served with the token",
+                             response.status_code))
+    return all(results)
+
+def test_debug_profiles_token():
+    print_header("Testing /api/debug/profiles Access")
+    results = []
+    previous = os.environ.get("BLIPP_PROFILE_SAMPLE")
+    os.environ["BLIPP_PROFILE_SAMPLE"] = "1"
+    try:
+        for token in (None, "let-me-in"):
+            with scratch_app(DEBUG_TOKEN=token) as (game_db, client):
+                capture_id = client.get("/api/inventory/stats").headers.get("X-Blipp-Profile-Id")
+                results.append(check(capture_id is not None, "Sampled request was profiled"))
+                routes = (("Profile list", "/api/debug/profiles"),
+                          ("Capture file", f"/api/debug/profiles/{capture_id}"))
+                expected, condition = (403, "without the token") if token else (404, "with no token configured")
+                for name, path in routes:
+                    status = client.get(path).status_code
+                    results.append(check(status == expected, f"{name} {condition} is a {expected}", status))
+                    if token:
+                        status = client.get(path, headers={"X-Blipp-Debug-Token": token}).status_code
+                        results.append(check(status == 200, f"{name} is served with the token", status))
+    finally:
+        if previous is None:
+            del os.environ["BLIPP_PROFILE_SAMPLE"]
+        else:
+            os.environ["BLIPP_PROFILE_SAMPLE"] = previous
+    return all(results)
+
+def test_session_routes():
+    print_header("Testing Session Routes")
+    from robot_frames import CONTENT_TYPE, encode_frames
+    from session_shards import SessionStore
+    results = []
+    item = {"name": "Rusty Gear", "type": "gear", "prefix": "Rusty", "rarity": "common", "category": "parts"}
+
+    with scratch_app(ROBOT_STATE_FLUSH_INTERVAL=0, SESSION_SHARDS=2) as (game_db, client):
+        client.post("/api/sessions/alice/robot/state", json={"x": 10, "y": 20, "direction": 1})
+        client.post("/api/sessions/bob/robot/state/frames", content_type=CONTENT_TYPE,
+                    data=encode_frames([(1, 2, 1, False, False), (30, 40, -1, True, False)]))
+        alice = client.get("/api/sessions/alice/robot/state").get_json()
+        bob = client.get("/api/sessions/bob/robot/state").get_json()
+        results.append(check(alice.get("x") == 10.0 and bob.get("x") == 30.0 and bob.get("is_digging") == 1,
+                             "Each session keeps its own state; frames apply the newest", (alice, bob)))
+        response = client.get("/api/sessions/carol/robot/state").get_json()
+        results.append(check(response == {"status": "not_found"}, "Unknown session is not_found", response))
+
+        for path in ("/api/sessions/bad%20id/robot/state", "/api/sessions/" + "x" * 65 + "/inventory"):
+            response = client.get(path)
+            results.append(check(response.status_code == 400, f"Malformed session id is a 400 ({path[:30]}...)",
+                                 response.status_code))
+        response = client.post("/api/sessions/alice/inventory", json=[item, {"name": 5}])
+        results.append(check(response.status_code == 400 and response.get_json().get("index") == 1,
+                             "Invalid item in a batch is a 400 naming its index", response.get_data(as_text=True)))
+
+        single = client.post("/api/sessions/alice/inventory", json=item).get_json()
+        batch = client.post("/api/sessions/alice/inventory", json=[item] * 4).get_json()
+        client.post("/api/sessions/bob/inventory", json=item)
+        results.append(check(single.get("status") == "success" and batch.get("count") == 4,
+                             "Single item and batch are added", (single, batch)))
+
+        first = client.get("/api/sessions/alice/inventory?limit=3")
+        cursor = first.headers.get("X-Next-Cursor")
+        results.append(check(len(first.get_json()) == 3 and cursor
+                             and f"cursor={cursor}" in first.headers.get("Link", ""),
+                             "First page has X-Next-Cursor and a Link to the next one", dict(first.headers)))
+        rest = client.get(f"/api/sessions/alice/inventory?limit=3&cursor={cursor}")
+        ids = [row["id"] for row in first.get_json() + rest.get_json()]
+        results.append(check(len(ids) == 5 and ids == sorted(ids, reverse=True)
+                             and "X-Next-Cursor" not in rest.headers,
+                             "Pages cover the session's items newest first, without bob's", ids))
+        response = client.get("/api/sessions/alice/inventory?cursor=abc")
+        results.append(check(response.status_code == 400, "Bad cursor is a 400", response.status_code))
+
+        shards = client.get("/api/server/status").get_json().get("session_shards", {})
+        results.append(check(shards.get("shard_count") == 2 and shards.get("sessions") == 2
+                             and shards.get("inventory_items") == 6,
+                             "Server status totals sessions and items over the shards",
+                             {key: shards.get(key) for key in ("shard_count", "sessions", "inventory_items")}))
+
+        resharded = SessionStore(game_db.DB_PATH, shard_count=3)
+        try:
+            for shard in resharded.shards:
+                with shard.connection():
+                    pass
+            results.append(check(False, "Reopening with another shard count fails", "opened"))
+        except RuntimeError as e:
+            results.append(check(True, f"Reopening with another shard count fails ({str(e)[-40:]})"))
+        finally:
+            resharded.stop()
+    return all(results)
+
+def test_event_replay():
+    print_header("Testing Event Feed Replay")
+    from event_hub import EventHub
+    results = []
+    hub = EventHub(buffer_size=4, keepalive=0.05)
+    first = hub.publish("robot_state", {"x": 1})
+    hub.publish("inventory_added", {"id": 2})
+    hub.publish("robot_state", {"x": 3})
+
+    stream = hub.stream(last_event_id=first)
+    next(stream)  # retry: line
+    replay = next(stream)
+    results.append(check(replay.count("event: ") == 2 and '"id":2' in replay and '"x":3' in replay,
+                         "Reconnecting with Last-Event-ID replays exactly what was missed", replay))
+    stream.close()
+
+    stream = hub.stream(last_event_id=first, events={"robot_state"})
+    next(stream)
+    replay = next(stream)
+    results.append(check(replay.count("event: ") == 1 and '"x":3' in replay,
+                         "Replay honours the event type filter", replay))
+    stream.close()
+
+    for name, last_event_id in (("from another server start", "deadbeef:1"), ("from the future", f"{hub.epoch}:99")):
+        stream = hub.stream(last_event_id=last_event_id)
+        next(stream)
+        message = next(stream)
+        results.append(check("event: reset" in message, f"An id {name} gets a reset", message))
+        stream.close()
+
+    stream = hub.stream()
+    next(stream)
+    for index in range(6):
+        hub.publish("robot_state", {"x": index})
+    message = next(stream)
+    results.append(check("event: reset" in message and "fell behind" in message,
+                         "A client further behind than the buffer gets a reset", message))
+    results.append(check(next(stream) == ": keepalive\n\n", "An idle stream sends keepalives"))
+    stream.close()
+    return all(results)
+
+def test_inventory_cursor():
+    print_header("Testing Inventory Keyset Pagination")
+    results = []
+    with scratch_app() as (game_db, client):
+        client.get("/api/inventory/stats")
+        # Timestamps collide within a second, and rows written without one sort last
+        timestamps = ["2024-01-01 10:00:00"] * 3 + ["2024-01-02 09:00:00"] * 2 + [None] * 3
+        with game_db.db_pool.connection() as conn:
+            conn.executemany("INSERT INTO inventory_items (name, timestamp) VALUES (?, ?)",
+                             [(f"item {index}", timestamp) for index, timestamp in enumerate(timestamps)])
+            conn.commit()
+
+        ids, pages, path = [], 0, "/api/inventory/items?limit=3&fields=id,name"
+        while path and pages < 10:
+            response = client.get(path)
+            ids.extend(row["id"] for row in response.get_json())
+            pages += 1
+            link = response.headers.get("Link")
+            path = link[1:link.index(">")] if link else None
+        results.append(check(len(ids) == 8 and len(set(ids)) == 8 and pages == 3,
+                             "Following Link visits every item once", ids))
+        results.append(check(ids == [5, 4, 3, 2, 1, 8, 7, 6],
+                             "Newest timestamp first, ties by id, NULL timestamps last", ids))
+
+        for query, name in (("cursor=not-a-cursor", "Bad cursor"), ("fields=id,secret", "Unknown field")):
+            response = client.get(f"/api/inventory/items?{query}")
+            results.append(check(response.status_code == 400, f"{name} is a 400", response.status_code))
+    return all(results)
+
+def test_async_framing():
+    print_header("Testing Async Server Framing")
+    import asyncio
+    import socket
+    import threading
+    from async_server import AsyncWSGIServer
+    from robot_frames import CONTENT_TYPE, encode_frames
+    results = []
+
+    def exchange(port, raw):
+        with socket.create_connection(("127.0.0.1", port), timeout=0.5) as conn:
+            conn.sendall(raw)
+            # Nothing more is coming, so a short body is truncated rather than slow
+            conn.shutdown(socket.SHUT_WR)
+            data = b""
+            try:
+                while True:
+                    chunk = conn.recv(65536)
+                    if not chunk:
+                        break
+                    data += chunk
+            except socket.timeout:
+                pass
+        return data
+
+    with scratch_app() as (game_db, client):
+        listener = socket.create_server(("127.0.0.1", 0))
+        port = listener.getsockname()[1]
+        server = AsyncWSGIServer(client.application, "127.0.0.1", port, workers=2)
+        loop = asyncio.new_event_loop()
+        task = loop.create_task(server.serve_forever(listener))
+
+        def serve():
+            try:
+                loop.run_until_complete(task)
+            except asyncio.CancelledError:
+                pass
+
+        thread = threading.Thread(target=serve, daemon=True)
+        thread.start()
+        try:
+            health = b"GET /api/health HTTP/1.1\r\nHost: x\r\n\r\n"
+            etag = client.get("/api/inventory/stats").headers["ETag"].encode("latin-1")
+            frames = encode_frames([(1, 2, 1, False, False)])
+            bodiless = {
+                "304": b"GET /api/inventory/stats HTTP/1.1\r\nHost: x\r\nIf-None-Match: " + etag + b"\r\n\r\n",
+                "204": (f"POST /api/robot/state/frames HTTP/1.1\r\nHost: x\r\nContent-Type: {CONTENT_TYPE}\r\n"
+                        f"Content-Length: {len(frames)}\r\n\r\n").encode("latin-1") + frames,
+                "HEAD of a stream": b"HEAD /api/inventory/items HTTP/1.1\r\nHost: x\r\n"
+                                    b"Accept: application/x-ndjson\r\n\r\n"
+            }
+            for name, raw in bodiless.items():
+                head, _, rest = exchange(port, raw + health).partition(b"\r\n\r\n")
+                results.append(check(b"Transfer-Encoding" not in head and rest.startswith(b"HTTP/1.1 200"),
+                                     f"{name}: headers only, the next pipelined response follows", head + rest[:40]))
+
+            post = b"POST /api/robot/state HTTP/1.1\r\nHost: x\r\nContent-Type: application/json\r\n"
+            malformed = {
+                "Bad chunk size": post + b"Transfer-Encoding: chunked\r\n\r\nzz\r\n",
+                "Signed chunk size": post + b"Transfer-Encoding: chunked\r\n\r\n-5\r\n",
+                "Negative Content-Length": post + b"Content-Length: -5\r\n\r\n",
+                "Content-Length with Transfer-Encoding": post + b"Content-Length: 5\r\n"
+                                                                b"Transfer-Encoding: chunked\r\n\r\n0\r\n\r\n",
+                "Truncated body": post + b"Content-Length: 50\r\n\r\n{\"x\": 1"
+            }
+            for name, raw in malformed.items():
+                status = exchange(port, raw).split(b"\r\n", 1)[0]
+                results.append(check(status == b"HTTP/1.1 400 Bad Request", f"{name} is a 400", status))
+            status = exchange(port, post + b"Transfer-Encoding: chunked\r\n\r\n7\r\n{\"x\":1}\r\n0\r\n\r\n")
+            results.append(check(status.startswith(b"HTTP/1.1 200"), "A chunked body reaches the app",
+                                 status.split(b"\r\n", 1)[0]))
+        finally:
+            loop.call_soon_threadsafe(task.cancel)
+            thread.join(5)
+            loop.close()
+            server.shutdown()
+    return all(results)
+
+def test_log_listener_fork():
+    print_header("Testing Log Listener Around fork()")
+    results = []
+
+    def fork_and_wait():
+        pid = os.fork()
+        if pid == 0:
+            os._exit(0)
+        os.waitpid(pid, 0)
+
+    with scratch_app() as (game_db, client):
+        first = game_db.log_listener
+    with scratch_app() as (game_db, client):
+        second = game_db.log_listener
+        fork_and_wait()
+        results.append(check(second._thread is not None, "The running listener is restarted after fork()"))
+        results.append(check(first._thread is None, "An earlier app's stopped listener stays stopped"))
+    fork_and_wait()
+    results.append(check(second._thread is None, "A listener stopped on shutdown stays stopped after fork()"))
+    return all(results)
+
+def test_generated_timestamps():
+    print_header("Testing Generated Item Timestamps")
+    import populate_database
+    generated = populate_database.generate_random_item()["timestamp"]
+    conn = sqlite3.connect(":memory:")
+    server = conn.execute("SELECT datetime('now')").fetchone()[0]
+    conn.close()
+    # Same length and separator, and within a minute of each other as UTC
+    same_format = len(generated) == len(server) and generated[10] == server[10] == " "
+    return check(same_format and abs((datetime.fromisoformat(generated) -
+                                      datetime.fromisoformat(server)).total_seconds()) < 60,
+                 "populate_database writes UTC timestamps like the server's datetime('now')",
+                 (generated, server))
+
+def test_fetch_timing():
+    print_header("Testing SQL Fetch Timing")
+    from db_pool import ConnectionPool
+    results = []
+    with tempfile.TemporaryDirectory() as tmp_dir:
+        path = os.path.join(tmp_dir, "fetch.db")
+        conn = sqlite3.connect(path)
+        conn.execute("CREATE TABLE numbers (n INTEGER PRIMARY KEY)")
+        conn.executemany("INSERT INTO numbers VALUES (?)", [(n,) for n in range(10000)])
+        conn.commit()
+        conn.close()
+
+        for time_rows in (False, True):
+            calls = []
+            pool = ConnectionPool(path, statement_hook=lambda *args: calls.append(args), time_rows=time_rows)
+            with pool.connection() as conn:
+                started = time.perf_counter()
+                count = sum(1 for _ in conn.execute("SELECT n FROM numbers"))
+                elapsed = time.perf_counter() - started
+                looped = [seconds for _, _, seconds, phase in calls if phase == "fetch"]
+                cursor = conn.execute("SELECT n FROM numbers")
+                while cursor.fetchmany(4000):
+                    pass
+            pool.close_all()
+            batched = [phase for _, _, _, phase in calls if phase == "fetch"][len(looped):]
+            if time_rows:
+                results.append(check(count == 10000 and len(looped) == 1 and looped[0] <= elapsed,
+                                     "BLIPP_SQL_TIME_ROWS reports a loop once, within its wall time",
+                                     (looped, elapsed)))
+            else:
+                results.append(check(count == 10000 and not looped, "Loops over a cursor are not timed per row",
+                                     looped))
+            results.append(check(len(batched) == 4, "fetchmany is timed once per call", batched))
+    return all(results)
+
+# Checks run by --offline and at the end of the full suite
+APP_CHECKS = [
+    test_trajectory_bounds,
+    test_cache_negotiation,
+    test_dashboard_snapshot,
+    test_inventory_cursor,
+    test_generated_timestamps,
+    test_frame_decoding,
+    test_debug_sql_token,
+    test_debug_profiles_token,
+    test_session_routes,
+    test_event_replay,
+    test_async_framing,
+    test_log_listener_fork,
+    test_fetch_timing
+]
+
+def run_app_checks():
+    results = [check_function() for check_function in APP_CHECKS]
+    return all(results)
+
+# GET endpoints compared between two servers (e.g. Flask vs async_server.py)
+PARITY_ENDPOINTS = [
+    "/health",
+    "/robot/state",
+    "/inventory/stats",
+    "/inventory/items?limit=10",
+    "/inventory/random",
+    "/item-templates?limit=5",
+    "/random-item"
+]
+
+def _response_shape(response):
+    try:
+        data = response.json()
+    except ValueError:
+        return (response.status_code, 'non-json')
+    if isinstance(data, dict):
+        return (response.status_code, 'object', tuple(sorted(data.keys())))
+    if isinstance(data, list):
+        return (response.status_code, 'array', tuple(sorted(data[0].keys())) if data else ())
+    return (response.status_code, type(data).__name__)
+
+def _throughput(base_url, rounds):
+    session = requests.Session()
+    start = time.time()
+    for _ in range(rounds):
+        for endpoint in PARITY_ENDPOINTS:
+            session.get(f"{base_url}{endpoint}", timeout=5)
+    return rounds * len(PARITY_ENDPOINTS) / (time.time() - start)
+
+def compare_servers(base_url, other_url, rounds=50, min_ratio=0.8):
+    print_header("Comparing Server Responses and Throughput")
+    print_info(f"Reference: {base_url}")
+    print_info(f"Candidate: {other_url}")
+    
+    # Same routes must answer with the same status and JSON shape
+    matched = True
+    for endpoint in PARITY_ENDPOINTS:
+        try:
+            expected = _response_shape(requests.get(f"{base_url}{endpoint}", timeout=5))
+            actual = _response_shape(requests.get(f"{other_url}{endpoint}", timeout=5))
+        except Exception as e:
+            print_error(f"{endpoint}: {str(e)}")
+            matched = False
+            continue
+        if expected == actual:
+            print_success(f"{endpoint}: {expected[0]} {expected[1]}")
+        else:
+            print_error(f"{endpoint}: reference {expected}, candidate {actual}")
+            matched = False
+    
+    # Sequential keep-alive throughput over the same request mix
+    try:
+        base_rps = _throughput(base_url, rounds)
+        other_rps = _throughput(other_url, rounds)
+    except Exception as e:
+        print_error(f"Throughput run failed: {str(e)}")
+        return False
+    ratio = other_rps / base_rps if base_rps else 0
+    print_info(f"Reference: {base_rps:.1f} req/s, candidate: {other_rps:.1f} req/s ({ratio:.2f}x)")
+    if ratio < min_ratio:
+        print_error(f"Candidate throughput below {min_ratio:.0%} of the reference")
+        return False
+    print_success("Candidate throughput is at parity with the reference")
+    return matched
+
 def run_all_tests():
     print_header("BLIPP DATABASE SERVER TEST SUITE")
     print_info(f"Testing server at: {API_BASE_URL}")
@@ -214,6 +815,8 @@ def run_all_tests():
         test_inventory_endpoints()
     
     test_database_file()
+    test_query_plans()
+    run_app_checks()
     
     print_header("TEST SUMMARY")
     if server_running:
@@ -225,4 +828,17 @@ def run_all_tests():
         print_info("Or run 'start_db_server.bat' to start the server")
 
 if __name__ == "__main__":
+    parser = argparse.ArgumentParser(description="Test the Blipp database server")
+    parser.add_argument("--url", default=API_BASE_URL, help="API base URL (default: %(default)s)")
+    parser.add_argument("--compare-url", help="second server to compare against --url, e.g. http://localhost:5001/api")
+    parser.add_argument("--rounds", type=int, default=50, help="request rounds for the throughput comparison")
+    parser.add_argument("--offline", action="store_true",
+                        help="only run the in-process checks against a scratch database (exit status 1 on failure)")
+    args = parser.parse_args()
+    
+    API_BASE_URL = args.url
+    if args.offline:
+        sys.exit(0 if run_app_checks() else 1)
+    if args.compare_url:
+        sys.exit(0 if compare_servers(API_BASE_URL, args.compare_url, args.rounds) else 1)
     run_all_tests()
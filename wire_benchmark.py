@@ -0,0 +1,157 @@
+#!/usr/bin/env python
+# CPU cost per robot state update: JSON body vs binary frames
+#
+# Sends the same stream of robot states through the app in-process (Flask
+# test client, no sockets) as JSON posts to /api/robot/state, as one binary
+# frame per request and as batches of frames to /api/robot/state/frames, and
+# reports process CPU time per update for each. The flusher interval is set
+# high so the numbers are the request path, not SQLite. A decode-only pass
+# isolates body parsing from the rest of the request. Writes a JSON report.
+#
+# Usage:
+#   python wire_benchmark.py --updates 20000 --batch 16 --runs 5 --output wire.json
+
+import argparse
+import json
+import os
+import random
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+
+from robot_frames import CONTENT_TYPE, decode_frames, encode_frames
+
+UPDATES = 10000
+BATCH = 16
+RUNS = 3
+
+
+def generate_states(count, seed):
+    """Robot states shaped like the game's: positions drift, direction is -1 or 1"""
+    rng = random.Random(seed)
+    x, y = 400.0, 300.0
+    states = []
+    for _ in range(count):
+        x += rng.uniform(-4, 4)
+        y += rng.uniform(-4, 4)
+        states.append((round(x, 3), round(y, 3), rng.choice((-1, 1)), rng.random() < 0.2, rng.random() < 0.1))
+    return states
+
+
+def json_body(state):
+    x, y, direction, is_digging, is_jumping = state
+    return json.dumps({'x': x, 'y': y, 'direction': direction, 'isDigging': is_digging, 'isJumping': is_jumping})
+
+
+def build_requests(states, batch):
+    """Request bodies per mode: (path, content type, bodies, updates per body)"""
+    return {
+        'json': ('/api/robot/state', 'application/json', [json_body(state) for state in states], 1),
+        'binary_single': ('/api/robot/state/frames', CONTENT_TYPE,
+                          [encode_frames([state]) for state in states], 1),
+        f'binary_batch_{batch}': ('/api/robot/state/frames', CONTENT_TYPE,
+                                  [encode_frames(states[i:i + batch]) for i in range(0, len(states), batch)],
+                                  batch)
+    }
+
+
+def cpu_per_update(operation, updates):
+    """Process CPU time (all threads) per update in microseconds, plus wall time"""
+    wall = time.perf_counter()
+    cpu = time.process_time()
+    operation()
+    cpu = time.process_time() - cpu
+    wall = time.perf_counter() - wall
+    return cpu / updates * 1e6, wall / updates * 1e6
+
+
+def run_requests(client, path, content_type, bodies):
+    for body in bodies:
+        response = client.post(path, data=body, content_type=content_type)
+        if response.status_code not in (200, 204):
+            raise RuntimeError(f'{path} returned {response.status_code}: {response.get_data(as_text=True)}')
+
+
+def decode_json(bodies):
+    for body in bodies:
+        data = json.loads(body)
+        (data.get('x'), data.get('y'), data.get('direction'), data.get('isDigging'), data.get('isJumping'))
+
+
+def decode_binary(bodies):
+    for body in bodies:
+        decode_frames(body)
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Compare CPU time per robot state update, JSON vs binary frames')
+    parser.add_argument('--updates', type=int, default=UPDATES, help='updates per mode and run (default: %(default)s)')
+    parser.add_argument('--batch', type=int, default=BATCH,
+                        help='frames per request in the batched mode (default: %(default)s)')
+    parser.add_argument('--runs', type=int, default=RUNS, help='runs per mode; medians are reported '
+                                                               '(default: %(default)s)')
+    parser.add_argument('--seed', type=int, default=0, help='RNG seed for the generated states')
+    parser.add_argument('--output', default='wire_benchmark.json', help='JSON report (default: %(default)s)')
+    args = parser.parse_args()
+    if args.updates <= 0 or args.batch <= 0 or args.runs <= 0:
+        parser.error('--updates, --batch and --runs must be positive')
+
+    workdir = tempfile.mkdtemp(prefix='blipp-wire-')
+    import game_db
+    app = game_db.create_app({
+        'DB_PATH': os.path.join(workdir, 'wire.db'),
+        'LOG_FILE': os.path.join(workdir, 'game_db.log'),
+        # Keep request logging and SQLite out of the measurement
+        'LOG_SAMPLE': '/api/robot/state=0,/api/robot/state/frames=0',
+        'ROBOT_STATE_FLUSH_INTERVAL': 3600
+    })
+    client = app.test_client()
+
+    states = generate_states(args.updates, args.seed)
+    requests = build_requests(states, args.batch)
+    results = {}
+    try:
+        # Warm up: schema check, first-request setup and caches
+        for path, content_type, bodies, _ in requests.values():
+            run_requests(client, path, content_type, bodies[:50])
+
+        for name, (path, content_type, bodies, per_body) in requests.items():
+            updates = len(states)
+            request_runs = [cpu_per_update(lambda: run_requests(client, path, content_type, bodies), updates)
+                            for _ in range(args.runs)]
+            decoder = decode_json if name == 'json' else decode_binary
+            decode_runs = [cpu_per_update(lambda: decoder(bodies), updates)[0] for _ in range(args.runs)]
+            body_bytes = sum(len(body) for body in bodies)
+            results[name] = {
+                'requests': len(bodies),
+                'updates_per_request': per_body,
+                'cpu_us_per_update': round(statistics.median(run[0] for run in request_runs), 3),
+                'wall_us_per_update': round(statistics.median(run[1] for run in request_runs), 3),
+                'decode_cpu_us_per_update': round(statistics.median(decode_runs), 3),
+                'body_bytes_per_update': round(body_bytes / updates, 2)
+            }
+            print(f"{name:<20} {results[name]['cpu_us_per_update']:>9.1f} us CPU/update   "
+                  f"decode {results[name]['decode_cpu_us_per_update']:>6.2f} us   "
+                  f"{results[name]['body_bytes_per_update']:>6.1f} body bytes/update")
+    finally:
+        game_db.shutdown()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    baseline = results['json']['cpu_us_per_update']
+    for entry in results.values():
+        entry['cpu_vs_json'] = round(entry['cpu_us_per_update'] / baseline, 3)
+
+    report = {
+        'config': {'updates': args.updates, 'batch': args.batch, 'runs': args.runs, 'seed': args.seed,
+                   'python': sys.version.split()[0]},
+        'modes': results
+    }
+    with open(args.output, 'w') as f:
+        json.dump(report, f, indent=2)
+    print(f'Wrote {args.output}')
+
+
+if __name__ == '__main__':
+    main()
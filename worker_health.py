@@ -0,0 +1,67 @@
+#!/usr/bin/env python
+# Per-worker heartbeat files for the multi-process launcher
+#
+# Each worker rewrites <run_dir>/worker-<N>.json every few seconds. The
+# master uses them to spot hung workers, and any worker can report on all
+# of them through /api/server/workers.
+
+import json
+import os
+import time
+
+HEARTBEAT_INTERVAL = 2.0
+
+
+def heartbeat_path(run_dir, worker_id):
+    return os.path.join(run_dir, f'worker-{worker_id}.json')
+
+
+def write_heartbeat(run_dir, worker_id, payload):
+    """Atomically replace this worker's heartbeat file"""
+    entry = dict(payload, worker=worker_id, pid=os.getpid(), heartbeat=time.time())
+    path = heartbeat_path(run_dir, worker_id)
+    tmp_path = f'{path}.{os.getpid()}.tmp'
+    with open(tmp_path, 'w') as f:
+        json.dump(entry, f)
+    os.replace(tmp_path, path)
+
+
+def remove_heartbeat(run_dir, worker_id, pid=None):
+    """Delete a worker's heartbeat file (only if it still belongs to pid)"""
+    path = heartbeat_path(run_dir, worker_id)
+    if pid is not None:
+        entry = read_heartbeat(path)
+        if entry is None or entry.get('pid') != pid:
+            return
+    try:
+        os.remove(path)
+    except FileNotFoundError:
+        pass
+
+
+def read_heartbeat(path):
+    try:
+        with open(path) as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return None
+
+
+def read_heartbeats(run_dir, stale_after=HEARTBEAT_INTERVAL * 3):
+    """Return every worker's latest heartbeat, flagging ones that stopped updating"""
+    workers = []
+    try:
+        names = sorted(os.listdir(run_dir))
+    except FileNotFoundError:
+        return workers
+    now = time.time()
+    for name in names:
+        if not (name.startswith('worker-') and name.endswith('.json')):
+            continue
+        entry = read_heartbeat(os.path.join(run_dir, name))
+        if entry is None:
+            continue
+        entry['age_seconds'] = round(now - entry.get('heartbeat', 0), 3)
+        entry['healthy'] = entry['age_seconds'] <= stale_after
+        workers.append(entry)
+    return workers